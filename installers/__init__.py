@@ -9,14 +9,16 @@ import zipfile
 import invoke
 import packaging.version
 import pkg_resources
-import requests
-
 import shims
+import snafu.mirrors
+import snafu.termui
+import snafu.transfers
+import snafu.versions
 
 
 VERSION = '3.6.3'
 
-DOWNLOAD_PREFIX = 'https://www.python.org/ftp/python'
+DOWNLOAD_PREFIX = snafu.mirrors.ORIGIN
 
 KB_CODE = 'KB2999226'
 
@@ -97,36 +99,82 @@ ASSETSDIR.mkdir(exist_ok=True)
 SHIMSDIR = ROOT.parent.joinpath('shims')
 
 
-def download_file(url, path):
-    print('Downloading {}'.format(url))
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    path.write_bytes(response.content)
+def download_files(targets):
+    """Download (url, path) targets concurrently, skipping existing paths.
+    """
+    targets = [(url, path) for url, path in targets if not path.exists()]
+    if not targets:
+        return
+    for url, _ in targets:
+        print('Downloading {}'.format(url))
+    mirror_list = snafu.mirrors.get_mirror_list()
+    progress = snafu.termui.CombinedProgress(
+        label='{} files'.format(len(targets)),
+    )
 
+    async def download_all():
+        async with snafu.transfers.Engine() as engine:
+            return await engine.gather([
+                mirror_list.download_file_async(
+                    engine, url, container=path.parent, filename=path.name,
+                    progress=progress,
+                )
+                for url, path in targets
+            ], progress=progress)
 
-def get_py_launcher(arch):
-    installer_path = ASSETSDIR.joinpath('py-{vers}-{arch}.msi'.format(
+    for result in snafu.transfers.run(download_all()):
+        if isinstance(result, BaseException):
+            raise result
+
+
+def get_py_launcher_path(arch):
+    return ASSETSDIR.joinpath('py-{vers}-{arch}.msi'.format(
         vers=VERSION,
         arch=arch,
     ))
-    if not installer_path.exists():
-        download_file(get_py_launcher_url(arch), installer_path)
+
+
+def get_asset_path(url):
+    return ASSETSDIR.joinpath(url.rsplit('/', 1)[-1])
+
+
+def get_winarcs(arch):
+    return {
+        'amd64': ['x64'],
+        'win32': ['x86', 'x64'],
+    }[arch]
+
+
+def prefetch(arch):
+    """Download all assets needed to build for arch in one go.
+    """
+    urls = [get_python_embed_url(arch)] + [
+        get_kb_msu_url(arch, winver, winarc)
+        for winver, winarc in itertools.product(WINVERS, get_winarcs(arch))
+    ]
+    download_files(
+        [(get_py_launcher_url(arch), get_py_launcher_path(arch))] +
+        [(url, get_asset_path(url)) for url in urls],
+    )
+
+
+def get_py_launcher(arch):
+    installer_path = get_py_launcher_path(arch)
+    download_files([(get_py_launcher_url(arch), installer_path)])
     return installer_path
 
 
 def get_embed_bundle(arch):
     url = get_python_embed_url(arch)
-    bundle_path = ASSETSDIR.joinpath(url.rsplit('/', 1)[-1])
-    if not bundle_path.exists():
-        download_file(url, bundle_path)
+    bundle_path = get_asset_path(url)
+    download_files([(url, bundle_path)])
     return bundle_path
 
 
 def get_kb_msu(arch, winver, winarc):
     url = get_kb_msu_url(arch, winver, winarc)
-    msu_path = ASSETSDIR.joinpath(url.rsplit('/', 1)[-1])
-    if not msu_path.exists():
-        download_file(url, msu_path)
+    msu_path = get_asset_path(url)
+    download_files([(url, msu_path)])
     return msu_path
 
 
@@ -183,12 +231,23 @@ def build_lib_python(libdir, arch):
         str(ROOT.parent.joinpath('snafu')),
         str(pythondir.joinpath('snafu')),
     )
+    snafu.versions.build_index(
+        pythondir.joinpath('snafu', 'versions'),
+        pythondir.joinpath('snafu', 'versions.index.json'),
+    )
 
     # Write SNAFU configurations.
     with pythondir.joinpath('snafu', 'installation.json').open('w') as f:
         json.dump({
+            'cache_dir': '..\\..\\..\\cache',
+            'cache_max_megabytes': 2048,
             'cmd_dir': '..\\..\\..\\cmd',
+            'download_connections': 4,
+            'downloads_dir': '..\\..\\..\\downloads',
+            'mirrors': [],
+            'publish_strategy': 'auto',
             'scripts_dir': '..\\..\\..\\scripts',
+            'scriptsets_dir': '..\\..\\..\\scriptsets',
             'shims_dir': '..\\..\\shims',
         }, f)
 
@@ -216,13 +275,8 @@ def build_lib_setup(libdir, arch):
     setupdir = libdir.joinpath('setup')
     setupdir.mkdir()
 
-    winarcs = {
-        'amd64': ['x64'],
-        'win32': ['x86', 'x64'],
-    }[arch]
-
     # Copy necessary updates.
-    for winver, winarc in itertools.product(WINVERS, winarcs):
+    for winver, winarc in itertools.product(WINVERS, get_winarcs(arch)):
         msu_path = get_kb_msu(arch, winver, winarc)
         print('Copy {}'.format(msu_path.name))
         shutil.copy2(
@@ -280,6 +334,7 @@ def build_files(arch):
     if container.exists():
         shutil.rmtree(str(container))
     container.mkdir()
+    prefetch(arch)
     build_lib(container, arch)
     build_cmd(container)
 
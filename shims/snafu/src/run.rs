@@ -39,10 +39,13 @@ pub fn pymod_and_link(find_python: fn(&Tag) -> Result<PathBuf, String>) {
         exit(code);
     }
 
-    // TODO: Only relink when needed. How does Pyenv do this?;
+    // SNAFU exits early if active versions' Scripts are unchanged.
     run_and_end(
         &find_of_snafu().unwrap_or_else(print_and_abort),
-        &vec!["-m", "snafu", "link", "--all", "--overwrite=smart"],
+        &vec![
+            "-m", "snafu", "link", "--all", "--if-changed",
+            "--overwrite=smart",
+        ],
         false,
     );
 }
@@ -1,4 +1,13 @@
-import click
+import sys
+
+from . import relinks
+
+# The shim runs "link --all --if-changed" after every pip call. Answer it
+# before importing anything heavy if there is nothing to do.
+if __name__ == '__main__' and relinks.is_unchanged_relink(sys.argv[1:]):
+    sys.exit(0)
+
+import click    # noqa: E402
 
 
 class SnafuGroup(click.Group):
@@ -57,19 +66,110 @@ def upgrade(ctx, **kwargs):
     upgrade(ctx, **kwargs)
 
 
-@cli.command(help='Download installer of given Python version.')
-@click.argument('version')
+@cli.command(help='Download installers of given Python versions.')
+@click.argument('version', nargs=-1)
+@click.option(
+    '--all', 'download_all', is_flag=True,
+    help='Download installers of all versions, including all architectures.',
+)
 @click.option(
     '--dest', 'dest_dir', type=click.Path(exists=True, file_okay=False),
-    help='Download installer to this directory.',
+    help='Download installers to this directory.',
+)
+@click.option('--force', is_flag=True, help='Overwrite targets if exist.')
+@click.option(
+    '--connections', type=click.IntRange(min=1),
+    help='Maximum number of connections to download each installer with.',
+)
+@click.option(
+    '--jobs', type=click.IntRange(min=1), default=4, show_default=True,
+    help='Maximum number of installers to download at once.',
 )
-@click.option('--force', is_flag=True, help='Overwrite target if exists.')
 @click.pass_context
 def download(ctx, **kwargs):
     from .operations.download import download
     download(ctx, **kwargs)
 
 
+@cli.group(help='Manage the installer cache.')
+def cache():
+    pass
+
+
+@cache.command(name='list', help='List cached installers.')
+def cache_list(**kwargs):
+    from .operations.cache import list_
+    list_(**kwargs)
+
+
+@cache.command(
+    name='prune',
+    help='Remove least recently used installers to fit the size limit.',
+)
+@click.option('--all', 'prune_all', is_flag=True, help='Remove everything.')
+@click.option(
+    '--max-megabytes', type=click.IntRange(min=0),
+    help='Size limit to use instead of the configured one.',
+)
+@click.pass_context
+def cache_prune(ctx, **kwargs):
+    from .operations.cache import prune
+    prune(ctx, **kwargs)
+
+
+@cache.command(
+    name='verify', help='Check cached installers and remove corrupted ones.',
+)
+@click.option(
+    '--rehash', is_flag=True,
+    help='Hash every installer, even if verified before and not modified.',
+)
+@click.pass_context
+def cache_verify(ctx, **kwargs):
+    from .operations.cache import verify
+    verify(ctx, **kwargs)
+
+
+@cli.group(help='Manage the catalogue of Python versions.')
+def catalogue():
+    pass
+
+
+@catalogue.command(
+    name='update',
+    help=('Add new Python releases to the catalogue. Directories unchanged '
+          'since the last update are not downloaded again.'),
+    short_help='Add new Python releases to the catalogue.',
+)
+@click.option(
+    '--source', default='https://www.python.org/ftp/python',
+    show_default=True,
+    help='URL of the python.org FTP directory, or a mirror of it.',
+)
+def catalogue_update(**kwargs):
+    from .operations.catalogue import update
+    update(**kwargs)
+
+
+@cli.command(
+    name='serve-cache',
+    help=('Serve the installer cache over HTTP, so other SNAFU instances can '
+          'use it as a mirror. Missing installers are downloaded on demand.'),
+    short_help='Serve the installer cache over HTTP.',
+)
+@click.option(
+    '--host', default='127.0.0.1', show_default=True,
+    help='Address to listen on.',
+)
+@click.option(
+    '--port', type=click.IntRange(min=0, max=65535), default=8037,
+    show_default=True, help='Port to listen on.',
+)
+def serve_cache(**kwargs):
+    from .operations.cache import serve
+    serve(**kwargs)
+
+
 @cli.command(help='Set active Python versions.')
 @click.argument('version', nargs=-1)
 @click.option(
@@ -101,6 +201,15 @@ def list_(**kwargs):
     list_(**kwargs)
 
 
+@cli.command(help='List installed versions with upgrades available.')
+@click.option(
+    '--json', 'as_json', is_flag=True, help='Print the list as JSON.',
+)
+def outdated(**kwargs):
+    from .operations.versions import outdated
+    outdated(**kwargs)
+
+
 @cli.command(
     short_help='Link a command from active versions.',
     help=('Link a command, or all commands available based on the currently '
@@ -116,6 +225,14 @@ def list_(**kwargs):
     type=click.Choice(['yes', 'no', 'smart']), default='yes',
     help='What to do when the target exists.',
 )
+@click.option(
+    '--if-changed', is_flag=True,
+    help='Only link all if active versions changed since the last time.',
+)
+@click.option(
+    '--no-wait', is_flag=True,
+    help='Link all in the background, and return immediately.',
+)
 @click.pass_context
 def link(ctx, overwrite, **kwargs):
     from .operations.link import link, Overwrite
@@ -0,0 +1,206 @@
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import attr
+
+from . import configs, utils, verification
+
+
+# Updating the index is read-modify-write; serialize them across threads.
+_index_lock = threading.RLock()
+
+
+@attr.s
+class CacheEntry:
+
+    key = attr.ib()
+    url = attr.ib()
+    filename = attr.ib()
+    size = attr.ib()
+    last_used = attr.ib()
+
+    def to_json(self):
+        return {
+            'url': self.url,
+            'filename': self.filename,
+            'size': self.size,
+            'last_used': self.last_used,
+        }
+
+    @classmethod
+    def from_json(cls, key, data):
+        return cls(key=key, **data)
+
+
+@attr.s
+class InstallerCache:
+    """Content-addressed store of downloaded installers.
+
+    Each installer is stored as ``<root>/<md5>/<filename>``, and recorded in
+    an index with its size and when it was last used, so the least recently
+    used entries can be evicted when the cache grows too large.
+    """
+    root = attr.ib()
+    max_size = attr.ib(default=None)
+
+    # Uses not saved to the index yet, key -> time. See `get(defer=True)`.
+    _uses = attr.ib(default=attr.Factory(dict), init=False, repr=False)
+    _flushed_at = attr.ib(default=0, init=False, repr=False)
+
+    @property
+    def index_path(self):
+        return self.root.joinpath('index.json')
+
+    def _load_index(self):
+        try:
+            with self.index_path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        entries = {
+            key: CacheEntry.from_json(key, value)
+            for key, value in data.items()
+        }
+        for key, last_used in self._uses.items():
+            if key in entries:
+                entries[key].last_used = max(
+                    entries[key].last_used, last_used,
+                )
+        return entries
+
+    def _save_index(self, entries):
+        utils.write_json_atomic(self.index_path, {
+            key: entry.to_json()
+            for key, entry in entries.items()
+        }, indent=4, sort_keys=True)
+        # Loaded with the index, so saved with it now.
+        self._uses.clear()
+        self._flushed_at = time.time()
+
+    def get_path(self, entry):
+        return self.root.joinpath(entry.key, entry.filename)
+
+    def get_container(self, key):
+        path = self.root.joinpath(key)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def entries(self):
+        """List entries, most recently used first.
+        """
+        return sorted(
+            self._load_index().values(),
+            key=lambda e: e.last_used, reverse=True,
+        )
+
+    def get(self, key, *, defer=False):
+        """Look up an installer by its checksum.
+
+        Returns the path to the installer, or None on cache miss. The entry
+        is marked as used on hit. With `defer`, the index is not written;
+        the use is saved with the next write, or `flush()`.
+        """
+        with _index_lock:
+            entries = self._load_index()
+            try:
+                entry = entries[key]
+            except KeyError:
+                return None
+            path = self.get_path(entry)
+            if not path.is_file():
+                if not defer:
+                    del entries[key]
+                    self._save_index(entries)
+                return None
+            if defer:
+                self._uses[key] = time.time()
+                return path
+            entry.last_used = time.time()
+            self._save_index(entries)
+        return path
+
+    def flush(self, *, min_interval=0):
+        """Save uses recorded by `get(defer=True)` into the index.
+
+        Nothing is written if the index was written less than min_interval
+        seconds ago.
+        """
+        with _index_lock:
+            if not self._uses:
+                return
+            if time.time() - self._flushed_at < min_interval:
+                return
+            self._save_index(self._load_index())
+
+    def add(self, key, url, path):
+        """Record a file already downloaded into the key's container.
+        """
+        with _index_lock:
+            entries = self._load_index()
+            entries[key] = CacheEntry(
+                key=key, url=url, filename=path.name,
+                size=path.stat().st_size, last_used=time.time(),
+            )
+            self._save_index(entries)
+            if self.max_size is not None:
+                self.prune(self.max_size, keep={key})
+
+    def remove(self, entry):
+        with _index_lock:
+            entries = self._load_index()
+            entries.pop(entry.key, None)
+            self._save_index(entries)
+        shutil.rmtree(str(self.root.joinpath(entry.key)), ignore_errors=True)
+
+    def prune(self, max_size, *, keep=frozenset()):
+        """Evict least recently used entries until the cache fits max_size.
+
+        Returns a list of removed entries.
+        """
+        entries = self.entries()
+        total = sum(e.size for e in entries)
+        removed = []
+        for entry in reversed(entries):
+            if total <= max_size:
+                break
+            if entry.key in keep:
+                continue
+            self.remove(entry)
+            removed.append(entry)
+            total -= entry.size
+        return removed
+
+    def verify(self, entry, *, rehash=False):
+        """Check the entry's file against its checksum.
+
+        Files verified before are not hashed again unless `rehash` is set,
+        if they are not modified since.
+        """
+        try:
+            return verification.verify_file(
+                self.get_path(entry), {'md5': entry.key}, rehash=rehash,
+            )
+        except OSError:
+            return False
+
+
+def get_installer_cache():
+    return InstallerCache(
+        root=configs.get_cache_dir_path(),
+        max_size=configs.get_cache_max_size(),
+    )
+
+
+def link_or_copy(source, target):
+    """Hardlink source to target, or copy if linking is not possible.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        target.unlink()
+    try:
+        os.link(str(source), str(target))
+    except OSError:
+        shutil.copy2(str(source), str(target))
@@ -0,0 +1,205 @@
+import http.server
+import json
+import os
+import re
+import socketserver
+import threading
+
+import attr
+
+from . import mirrors, utils, versions
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Uses of cached files are saved into the index at most this often.
+USE_FLUSH_INTERVAL = 60
+
+
+def parse_range(value, size):
+    """Parse a single-range Range header into (start, end), end inclusive.
+
+    Returns None if the header is absent or unsupported (e.g. multiple
+    ranges), so the whole file should be sent. Raises ValueError if the range
+    is not satisfiable.
+    """
+    match = RANGE_RE.match(value or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:   # Suffix range, e.g. "bytes=-500" (the last 500 bytes).
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(value)
+    return start, end
+
+
+@attr.s
+class CacheServerState:
+    """Installer cache served to other clients, filled on miss.
+    """
+    cache = attr.ib()
+    mirror_list = attr.ib()
+    catalogue = attr.ib()   # md5_sum -> Version.
+    _locks = attr.ib(default=attr.Factory(dict), init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), init=False)
+
+    def find_version(self, path):
+        """Find the catalogue entry for a request path.
+
+        Both checksum-named paths (``/<md5>/<filename>``) and paths mirroring
+        the python.org FTP layout (``/3.6.4/python-3.6.4.exe``) are accepted.
+        """
+        key = path.strip('/').split('/', 1)[0]
+        if key in self.catalogue:
+            return self.catalogue[key]
+        url = '{}/{}'.format(mirrors.ORIGIN, path.lstrip('/'))
+        for version in self.catalogue.values():
+            if version.url == url:
+                return version
+        return None
+
+    def get_file(self, version):
+        # Serving a file must not rewrite the index every time.
+        path = self.cache.get(version.md5_sum, defer=True)
+        self.cache.flush(min_interval=USE_FLUSH_INTERVAL)
+        if path is not None:
+            return path
+
+        # Download only once if multiple clients ask for the same file.
+        with self._lock:
+            lock = self._locks.setdefault(version.md5_sum, threading.Lock())
+        with lock:
+            path = self.cache.get(version.md5_sum, defer=True)
+            if path is not None:
+                return path
+            path = self.mirror_list.download_file(
+                version.url, check=version.check_installer,
+                container=self.cache.get_container(version.md5_sum),
+            )
+            self.cache.add(version.md5_sum, version.url, path)
+        return path
+
+    def open_file(self, version):
+        """Get a cached file of version, and open it.
+
+        A file pruned after it is looked up is treated as a cache miss.
+        """
+        try:
+            return self.get_file(version).open('rb')
+        except FileNotFoundError:
+            return self.get_file(version).open('rb')
+
+    def get_index(self):
+        entries = self.cache.entries()
+        return [
+            {
+                'md5_sum': entry.key,
+                'filename': entry.filename,
+                'size': entry.size,
+                'url': entry.url,
+                'path': '/{}/{}'.format(entry.key, entry.filename),
+            }
+            for entry in entries
+        ]
+
+
+class CacheRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'SNAFU-Cache'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def handle_request(self, *, send_body):
+        path = self.path.split('?', 1)[0]
+        if path in ('/', '/index.json'):
+            self.send_index(send_body=send_body)
+            return
+        version = self.state.find_version(path)
+        if version is None:
+            self.send_error(404)
+            return
+        try:
+            f = self.state.open_file(version)
+        except (OSError, utils.DownloadIntegrityError) as e:
+            self.send_error(502, explain=str(e))
+            return
+        with f:
+            self.send_file(f, etag=version.md5_sum, send_body=send_body)
+
+    def send_index(self, *, send_body):
+        data = json.dumps(self.state.get_index()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def send_file(self, f, *, etag, send_body):
+        size = os.fstat(f.fileno()).st_size
+        etag = '"{}"'.format(etag)
+        try:
+            if_range = self.headers.get('If-Range')
+            byte_range = None
+            if if_range is None or if_range == etag:
+                byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(size))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if byte_range is None:
+            start, end = 0, size - 1
+            self.send_response(200)
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, size,
+            ))
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if not send_body:
+            return
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(remaining, utils.CHUNK_SIZE))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class CacheServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, state):
+        super().__init__(address, CacheRequestHandler)
+        self.state = state
+
+
+def get_catalogue():
+    return {
+        version.md5_sum: version
+        for version in versions.get_all_variants()
+    }
@@ -0,0 +1,381 @@
+"""Update version definitions from the python.org FTP directory.
+
+Directory listings are cached with their ETag and Last-Modified headers, and
+revalidated with conditional requests, so unchanged directories cost a 304.
+Only release directories newer than the catalogue are listed, and installers
+are only downloaded (to compute their checksums) for new releases.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import pathlib
+import re
+import shutil
+import tempfile
+
+import attr
+
+from . import (
+    caches, configs, mirrors, network, transfers, utils, verification,
+    versions,
+)
+
+
+HREF_RE = re.compile(r'href="([^"?#]+)"', re.IGNORECASE)
+
+RELEASE_DIR_RE = re.compile(r'^(\d+)\.(\d+)\.(\d+)/$')
+
+# Lines older than this are not added to the catalogue.
+OLDEST_VERSION = (2, 7)
+
+# CPython switched from MSI to the new installer in 3.5.
+MSI_BEFORE = (3, 5)
+
+
+def parse_listing(text):
+    """Extract names of entries from an HTML directory listing.
+    """
+    names = []
+    for href in HREF_RE.findall(text):
+        name = href.rstrip('/').rsplit('/', 1)[-1]
+        if name and name not in ('.', '..'):
+            names.append(name + '/' if href.endswith('/') else name)
+    return names
+
+
+def format_version(version_info):
+    return '.'.join(str(i) for i in version_info)
+
+
+def get_release_versions(names):
+    """Group release directory names by line, newest first.
+    """
+    lines = collections.defaultdict(list)
+    for name in names:
+        match = RELEASE_DIR_RE.match(name)
+        if match:
+            version_info = tuple(int(p) for p in match.groups())
+            lines[version_info[:2]].append(version_info)
+    for releases in lines.values():
+        releases.sort(reverse=True)
+    return lines
+
+
+def get_installer_filenames(version_info):
+    """Map version names to installer filenames of a release.
+
+    The value is a 2-tuple (installer type, {architecture: filename}).
+    Architecture is None for the new installer, which has one per name.
+    """
+    v = format_version(version_info)
+    line = '{}.{}'.format(*version_info[:2])
+    if version_info[:2] < MSI_BEFORE:
+        return {line: (versions.InstallerType.cpython_msi, {
+            'amd64': 'python-{}.amd64.msi'.format(v),
+            'x86': 'python-{}.msi'.format(v),
+        })}
+    return {
+        line: (versions.InstallerType.cpython, {
+            None: 'python-{}-amd64.exe'.format(v),
+        }),
+        '{}-32'.format(line): (versions.InstallerType.cpython, {
+            None: 'python-{}.exe'.format(v),
+        }),
+    }
+
+
+@attr.s
+class Listing:
+
+    names = attr.ib()
+    etag = attr.ib(default=None)
+    last_modified = attr.ib(default=None)
+
+    def get_conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_json(self):
+        return attr.asdict(self)
+
+
+@attr.s
+class ListingCache:
+    """Directory listings previously fetched, keyed by URL.
+    """
+    path = attr.ib()
+    listings = attr.ib(default=attr.Factory(dict))
+    changed = attr.ib(default=False)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        return cls(path=path, listings={
+            url: Listing(**value) for url, value in data.items()
+        })
+
+    def save(self):
+        if not self.changed:
+            return
+        utils.write_json_atomic(self.path, {
+            url: listing.to_json()
+            for url, listing in self.listings.items()
+        }, optional=True)
+        self.changed = False
+
+
+def get_listing_cache():
+    return ListingCache.load(
+        configs.get_cache_dir_path().joinpath('listings.json'),
+    )
+
+
+def fetch_listing_with_session(url, cached):
+    response = network.get_session().get(
+        url, headers=(cached.get_conditional_headers() if cached else {}),
+    )
+    if response.status_code == 304 and cached is not None:
+        return cached
+    response.raise_for_status()
+    return Listing(
+        names=parse_listing(response.text),
+        etag=response.headers.get('etag'),
+        last_modified=response.headers.get('last-modified'),
+    )
+
+
+@attr.s
+class Crawler:
+    """Find releases newer than the catalogue under the source directory.
+    """
+    engine = attr.ib()
+    source = attr.ib(convert=lambda s: s.rstrip('/'))
+    cache = attr.ib()
+    requests = attr.ib(default=0)
+    revalidated = attr.ib(default=0)   # Requests answered with 304.
+
+    async def list_directory(self, path):
+        url = '{}/{}'.format(self.source, path)
+        local_path = utils.get_local_path(url)
+        if local_path is not None:
+            return [
+                entry.name + '/' if entry.is_dir() else entry.name
+                for entry in os.scandir(str(local_path))
+            ]
+        cached = self.cache.listings.get(url)
+        self.requests += 1
+        if utils.is_proxied(url):
+            listing = await asyncio.get_event_loop().run_in_executor(
+                None, fetch_listing_with_session, url, cached,
+            )
+        else:
+            listing = await self._fetch_listing(url, cached)
+        if listing is cached:
+            self.revalidated += 1
+        else:
+            self.cache.listings[url] = listing
+            self.cache.changed = True
+        return listing.names
+
+    async def _fetch_listing(self, url, cached):
+        response = await self.engine.client.request('GET', url, headers=(
+            cached.get_conditional_headers() if cached else {}
+        ))
+        if response.status_code == 304 and cached is not None:
+            await response.read()
+            return cached
+        response.raise_for_status()
+        text = (await response.read()).decode('utf-8', 'replace')
+        return Listing(
+            names=parse_listing(text),
+            etag=response.headers.get('etag'),
+            last_modified=response.headers.get('last-modified'),
+        )
+
+    async def find_releases(self, known):
+        """Find the newest release of each line not in the catalogue.
+
+        `known` maps version names to version info in the catalogue. Lines
+        older than the newest known line (or `OLDEST_VERSION`), but not in
+        the catalogue, are ignored. Returns a list of (name, version_info,
+        installer type, {architecture: filename}).
+        """
+        lines = get_release_versions(await self.list_directory(''))
+        newest = max((v[:2] for v in known.values()), default=OLDEST_VERSION)
+        candidates = []
+        for line, releases in lines.items():
+            current = known.get('{}.{}'.format(*line))
+            if current is None and line < newest:
+                continue
+            candidates.extend(v for v in releases if v > (current or ()))
+        results = await self.engine.gather([
+            self.list_directory('{}/'.format(format_version(v)))
+            for v in candidates
+        ])
+
+        found = {}
+        for version_info, names in zip(candidates, results):
+            if isinstance(names, BaseException):
+                raise names
+            available = set(names)
+            filenames = get_installer_filenames(version_info)
+            for name, (installer_type, files) in filenames.items():
+                if name in found and found[name][0] > version_info:
+                    continue
+                if known.get(name, ()) >= version_info:
+                    continue
+                if all(f in available for f in files.values()):
+                    found[name] = (version_info, installer_type, files)
+        return [
+            (name, version_info, installer_type, files)
+            for name, (version_info, installer_type, files) in found.items()
+        ]
+
+
+async def download_and_hash(engine, url, *, container):
+    """Download an installer into the cache, and return its digests.
+    """
+    with tempfile.TemporaryDirectory(dir=str(container)) as tempdir:
+        path = await engine.download_file(
+            url, container=pathlib.Path(tempdir),
+        )
+        digests = await asyncio.get_event_loop().run_in_executor(
+            None, verification.hash_file, path,
+        )
+        cache = caches.get_installer_cache()
+        target = cache.get_container(digests['md5']).joinpath(path.name)
+        shutil.move(str(path), str(target))
+    cache.add(digests['md5'], url, target)
+    verification.get_memo().record(target, digests)
+    return digests
+
+
+def build_definition(version_info, installer_type, files, digests, *,
+                     previous):
+    """Build a version definition, in the catalogue's JSON schema.
+    """
+    def describe(filename):
+        url = '{}/{}/{}'.format(
+            mirrors.ORIGIN, format_version(version_info), filename,
+        )
+        return {
+            'url': url,
+            'md5_sum': digests[url]['md5'],
+            'sha256_sum': digests[url]['sha256'],
+        }
+
+    definition = {
+        'type': installer_type.value,
+        'version_info': list(version_info),
+    }
+    if installer_type == versions.InstallerType.cpython:
+        definition.update(describe(files[None]))
+        return definition
+    for arch, filename in files.items():
+        variant = describe(filename)
+        # Product codes are read from the MSI, which needs Windows. Keep
+        # those of previous releases, so they can still be uninstalled.
+        product_codes = (previous or {}).get(arch, {}).get('product_codes')
+        if product_codes:
+            variant['product_codes'] = product_codes
+        definition[arch] = variant
+    return definition
+
+
+def load_definitions(dirpath):
+    definitions = {}
+    for path in dirpath.iterdir():
+        if path.suffix == '.json' and versions.VERSION_NAME_RE.match(
+                path.stem):
+            with path.open() as f:
+                definitions[path.stem] = json.load(f)
+    return definitions
+
+
+def write_definition(dirpath, name, definition):
+    path = dirpath.joinpath('{}.json'.format(name))
+    utils.write_json_atomic(path, definition, indent=4)
+
+
+@attr.s
+class UpdateResult:
+
+    updated = attr.ib()     # [(name, previous version_info, version_info)]
+    requests = attr.ib()
+    revalidated = attr.ib()
+
+
+async def update_async(engine, *, source, versions_dir, cache):
+    definitions = load_definitions(versions_dir)
+    crawler = Crawler(engine=engine, source=source, cache=cache)
+    releases = await crawler.find_releases({
+        name: tuple(data['version_info'])
+        for name, data in definitions.items()
+    })
+
+    urls = {
+        '{}/{}'.format(format_version(version_info), filename)
+        for _, version_info, _, files in releases
+        for filename in files.values()
+    }
+    container = configs.get_downloads_dir_path()
+    container.mkdir(parents=True, exist_ok=True)
+    hashed = await engine.gather([
+        download_and_hash(
+            engine, '{}/{}'.format(crawler.source, path), container=container,
+        )
+        for path in urls
+    ])
+    digests = {}
+    for path, result in zip(urls, hashed):
+        if isinstance(result, BaseException):
+            raise result
+        digests['{}/{}'.format(mirrors.ORIGIN, path)] = result
+
+    updated = []
+    for name, version_info, installer_type, files in sorted(releases):
+        previous = definitions.get(name)
+        write_definition(versions_dir, name, build_definition(
+            version_info, installer_type, files, digests, previous=previous,
+        ))
+        updated.append((name, (
+            None if previous is None else tuple(previous['version_info'])
+        ), version_info))
+    return UpdateResult(
+        updated=updated, requests=crawler.requests,
+        revalidated=crawler.revalidated,
+    )
+
+
+def update(*, source=mirrors.ORIGIN, versions_dir=None):
+    """Update version definitions in versions_dir from source.
+
+    If versions_dir is not given, the bundled definitions are updated, and
+    their index rebuilt. Returns an `UpdateResult`.
+    """
+    cache = get_listing_cache()
+
+    async def run():
+        async with transfers.Engine() as engine:
+            return await update_async(
+                engine, source=source, cache=cache,
+                versions_dir=(versions_dir or versions.VERSIONS_DIR_PATH),
+            )
+
+    try:
+        result = transfers.run(run())
+    finally:
+        cache.save()
+    if result.updated and versions_dir is None:
+        versions.build_index()
+    return result
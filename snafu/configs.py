@@ -1,13 +1,30 @@
+import functools
 import json
+import os
 import pathlib
 
 
-def get_value(key):
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=None)
+def get_installation_data():
     with pathlib.Path(__file__).with_name('installation.json').open() as f:
-        data = json.load(f)
-    return data[key]
+        return json.load(f)
+
+
+def get_value(key, default=_MISSING):
+    data = get_installation_data()
+    try:
+        return data[key]
+    except KeyError:
+        if default is _MISSING:
+            raise
+    return default
 
 
+# Directories do not move during a run. Only create and resolve them once.
+@functools.lru_cache(maxsize=None)
 def get_directory(key):
     path = pathlib.Path(__file__).parent.joinpath(get_value(key))
     path.mkdir(parents=True, exist_ok=True)
@@ -18,10 +35,88 @@ def get_scripts_dir_path():
     return get_directory('scripts_dir')
 
 
+def get_scripts_link_path():
+    """The scripts directory in PATH, without resolving it if it's a link.
+    """
+    path = pathlib.Path(__file__).parent.joinpath(get_value('scripts_dir'))
+    return pathlib.Path(os.path.abspath(str(path)))
+
+
+def get_scriptsets_dir_path():
+    """Where scripts are prebuilt per set of active versions.
+
+    None if not configured, and the scripts directory is a real one.
+    """
+    if get_value('scriptsets_dir', None) is None:
+        return None
+    return get_directory('scriptsets_dir')
+
+
 def get_cmd_dir_path():
     return get_directory('cmd_dir')
 
 
+def get_cache_dir_path():
+    return get_directory('cache_dir')
+
+
+def get_cache_max_size():
+    value = os.environ.get('SNAFU_CACHE_MAX_MEGABYTES')
+    if value is None:
+        value = get_value('cache_max_megabytes', None)
+    if value is None:
+        return None
+    return int(value) * 1024 * 1024
+
+
+def get_downloads_dir_path():
+    return get_directory('downloads_dir')
+
+
+def get_download_connections():
+    value = os.environ.get('SNAFU_DOWNLOAD_CONNECTIONS')
+    if value is None:
+        value = get_value('download_connections', 1)
+    return max(1, int(value))
+
+
+PUBLISH_STRATEGIES = ('auto', 'copy', 'hardlink', 'symlink')
+
+
+def get_publish_strategy():
+    value = os.environ.get('SNAFU_PUBLISH_STRATEGY')
+    if value is None:
+        value = get_value('publish_strategy', 'auto')
+    if value not in PUBLISH_STRATEGIES:
+        raise ValueError('publish strategy must be one of {}, not {!r}'.format(
+            ', '.join(PUBLISH_STRATEGIES), value,
+        ))
+    return value
+
+
+HTTP_SETTINGS = {
+    'pool_size': 16,
+    'per_host_connections': 8,
+    'retries': 3,
+    'backoff': 0.5,
+    'connect_timeout': 10,
+    'read_timeout': 30,
+}
+
+
+def get_http_settings():
+    settings = dict(HTTP_SETTINGS)
+    settings.update(get_value('http', {}))
+    return settings
+
+
+def get_mirrors():
+    value = os.environ.get('SNAFU_MIRRORS')
+    if value is None:
+        return list(get_value('mirrors', []))
+    return [v.strip() for v in value.split(';') if v.strip()]
+
+
 def get_linkexe_script_path():
     return get_directory('utils_dir').joinpath('linkexe.vbs')
 
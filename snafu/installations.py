@@ -1,14 +1,64 @@
+import concurrent.futures
 import contextlib
 import itertools
+import mmap
 import os
 import pathlib
 import re
+import struct
 import subprocess
 
 import attr
 
+from . import states
 
-@attr.s
+
+PATCHLEVEL_RE = re.compile(
+    r'^#define\s+PY_(MAJOR|MINOR|MICRO)_VERSION\s+(\d+)', re.MULTILINE,
+)
+
+PYTHON_DLL_NAME_RE = re.compile(r'^python(\d)(\d+)\.dll$', re.IGNORECASE)
+
+# Installations probed at once by probe_versions(), and seconds to wait for
+# each if Python needs to be run.
+PROBE_JOBS = 8
+PROBE_TIMEOUT = 10
+
+# Errors from probing a broken installation.
+PROBE_ERRORS = (OSError, ValueError, subprocess.SubprocessError)
+
+# VS_FIXEDFILEINFO starts with this signature, and the structure version.
+FIXED_FILE_INFO_SIGNATURE = struct.pack('<2I', 0xFEEF04BD, 0x00010000)
+
+
+def read_patchlevel(path):
+    """Read the version from a patchlevel.h header.
+    """
+    with path.open(encoding='latin-1') as f:
+        parts = dict(PATCHLEVEL_RE.findall(f.read()))
+    return tuple(int(parts[k]) for k in ('MAJOR', 'MINOR', 'MICRO'))
+
+
+def read_dll_version(path):
+    """Read the version from a Python DLL's version resource.
+
+    CPython sets the file version to major.minor.(micro * 1000 + release
+    level * 10 + serial).build.
+    """
+    match = PYTHON_DLL_NAME_RE.match(path.name)
+    major, minor = (int(i) for i in match.groups())
+    with path.open('rb') as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        index = data.find(FIXED_FILE_INFO_SIGNATURE)
+        while index >= 0:
+            ms, ls = struct.unpack_from('<2I', data, index + 8)
+            if (ms >> 16, ms & 0xFFFF) == (major, minor):
+                return (major, minor, (ls >> 16) // 1000)
+            index = data.find(FIXED_FILE_INFO_SIGNATURE, index + 1)
+    raise ValueError('no version resource in {}'.format(path))
+
+
+@attr.s(frozen=True)
 class Installation:
 
     path = attr.ib(convert=pathlib.Path)
@@ -26,10 +76,38 @@ class Installation:
         return self.scripts_dir.joinpath('pip.exe')
 
     def get_version_info(self):
+        state = states.get_state()
+        version_info = state.get_version_info(self.python)
+        if version_info is None:
+            version_info = self.read_version_info()
+            state.set_version_info(self.python, version_info)
+        return version_info
+
+    def read_version_info(self, *, timeout=None):
+        """Find the installation's version.
+
+        The version is read from the headers or the DLL if possible. Python
+        is only run as the last resort, waiting for `timeout` seconds.
+        """
+        with contextlib.suppress(KeyError, OSError, ValueError):
+            return read_patchlevel(
+                self.path.joinpath('include', 'patchlevel.h'),
+            )
+        for entry in os.scandir(str(self.path)):
+            if PYTHON_DLL_NAME_RE.match(entry.name):
+                with contextlib.suppress(OSError, ValueError):
+                    return read_dll_version(pathlib.Path(entry.path))
+        return self.run_version_info(timeout=timeout)
+
+    def run_version_info(self, *, timeout=None):
         output = subprocess.check_output(
             [str(self.python), '--version'], encoding='ascii',
+            stderr=subprocess.STDOUT,   # Python 2 prints to stderr.
+            timeout=timeout,
         ).strip()
         match = re.match(r'^Python (\d+)\.(\d+)\.(\d+)$', output)
+        if not match:
+            raise ValueError('unexpected version {!r}'.format(output))
         return tuple(int(x) for x in match.groups())
 
     def find_script(self, name):
@@ -41,3 +119,41 @@ class Installation:
             with contextlib.suppress(FileNotFoundError):
                 return self.scripts_dir.joinpath(name).resolve(strict=True)
         raise FileNotFoundError(name)
+
+
+def probe_versions(installations, *, jobs=PROBE_JOBS, timeout=PROBE_TIMEOUT):
+    """Get version info of installations concurrently.
+
+    Versions already in the installation state are not probed again. Returns
+    a 2-tuple (versions, errors), mapping each installation to its version
+    info, or the error raised when probing it.
+    """
+    state = states.get_state()
+    versions = {}
+    pending = []
+    for installation in installations:
+        version_info = state.get_version_info(installation.python)
+        if version_info is None:
+            pending.append(installation)
+        else:
+            versions[installation] = version_info
+    if not pending:
+        return versions, {}
+
+    errors = {}
+    probed = {}
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(jobs, len(pending))) as executor:
+        futures = {
+            executor.submit(i.read_version_info, timeout=timeout): i
+            for i in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            installation = futures[future]
+            try:
+                probed[installation] = future.result()
+            except PROBE_ERRORS as e:
+                errors[installation] = e
+    state.set_version_infos({i.python: v for i, v in probed.items()})
+    versions.update(probed)
+    return versions, errors
@@ -1,8 +1,12 @@
+import json
 import pathlib
+import re
 import struct
 import sys
 import winreg
 
+from . import configs, utils
+
 
 PYTHON_KEY_PATHS = [
     (winreg.HKEY_CURRENT_USER, 'Software\\Python\\PythonCore'),
@@ -11,31 +15,80 @@ PYTHON_KEY_PATHS = [
 ]
 
 
-def get_install_path(name):
+_install_paths = None
+
+
+def get_install_paths():
+    """Read InstallPath of every PythonCore entry, keyed by version name.
+
+    All PYTHON_KEY_PATHS are enumerated in one pass, with earlier ones taking
+    precedence. The result is kept for the rest of the process. Call
+    `invalidate_install_paths()` after running an installer.
+
+    Paths are not kept between runs. Windows only marks the key a value is
+    written to modified, so telling whether they are up to date takes
+    opening every InstallPath key, which costs more than reading them.
+    """
+    global _install_paths
+    if _install_paths is not None:
+        return _install_paths
+    paths = {}
     for root, prefix in PYTHON_KEY_PATHS:
-        keypath = '{}\\{}\\InstallPath'.format(prefix, name)
         try:
-            key = winreg.OpenKey(root, keypath)
+            key = winreg.OpenKey(root, prefix)
         except FileNotFoundError:
             continue
-        install_path = winreg.QueryValue(key, None)
-        winreg.CloseKey(key)
-        return pathlib.Path(install_path).resolve(strict=True)
-    raise FileNotFoundError(
-        'Software\\Python\\PythonCore\\{}\\InstallPath'.format(name),
-    )
+        try:
+            subkey_count, _, _ = winreg.QueryInfoKey(key)
+            read_install_paths(key, subkey_count, paths)
+        finally:
+            winreg.CloseKey(key)
+    _install_paths = paths
+    return paths
 
 
-def find_uninstaller_id(name):
-    # Look for EVERY entry in the uninstaller list to find one that looks like
-    # the matching version's uninstaller. This is crazy, but the best way I
-    # can think of right now. And it's still faster than downloading the MSI.
-    key = winreg.OpenKey(
-        winreg.HKEY_LOCAL_MACHINE,
-        'Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall',
-    )
+def read_install_paths(key, subkey_count, paths):
+    for i in range(subkey_count):
+        name = winreg.EnumKey(key, i)
+        if name in paths:
+            continue
+        try:
+            paths[name] = winreg.QueryValue(
+                key, '{}\\InstallPath'.format(name),
+            )
+        except FileNotFoundError:
+            continue
+
+
+def invalidate_install_paths():
+    global _install_paths
+    _install_paths = None
+
+
+def get_install_path(name):
+    try:
+        install_path = get_install_paths()[name]
+    except KeyError:
+        raise FileNotFoundError(
+            'Software\\Python\\PythonCore\\{}\\InstallPath'.format(name),
+        )
+    return pathlib.Path(install_path).resolve(strict=True)
 
-    match = None
+
+UNINSTALL_KEY_PATH = 'Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall'
+
+UNINSTALLER_DISPLAY_NAME_RE = re.compile(r'^Python (\d+\.\d+)\.')
+
+_uninstaller_index = None
+
+
+def scan_uninstallers(key):
+    """Map version prefixes to IDs of Python uninstaller entries.
+    """
+    # Look for EVERY entry in the uninstaller list to find ones that look
+    # like Python uninstallers. This is crazy, but the best way I can think
+    # of right now. And it's still faster than downloading the MSI.
+    entries = {}
     subkey_count, _, _ = winreg.QueryInfoKey(key)
     for i in range(subkey_count):
         sub_name = winreg.EnumKey(key, i)
@@ -47,16 +100,57 @@ def find_uninstaller_id(name):
             continue
         finally:
             winreg.CloseKey(subkey)
-        if (display_name.startswith('Python {}.'.format(name)) and
-                publisher == 'Python Software Foundation'):
-            match = sub_name
-            break
+        match = UNINSTALLER_DISPLAY_NAME_RE.match(display_name)
+        if match and publisher == 'Python Software Foundation':
+            entries.setdefault(match.group(1), sub_name)
+    return entries
+
+
+def get_uninstaller_index_path():
+    return configs.get_cache_dir_path().joinpath('uninstallers.json')
+
+
+def load_uninstaller_index(path):
+    try:
+        with path.open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_uninstaller_index(path, index):
+    utils.write_json_atomic(path, index, optional=True)
+
+
+def get_uninstaller_index():
+    """Get Python uninstaller entries, keyed by version prefix.
+
+    The entries are kept on disk with the last write time of the Uninstall
+    key, and only scanned again when the key is modified.
+    """
+    global _uninstaller_index
+    path = get_uninstaller_index_path()
+    key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, UNINSTALL_KEY_PATH)
+    try:
+        _, _, last_write = winreg.QueryInfoKey(key)
+        index = _uninstaller_index or load_uninstaller_index(path)
+        if index is None or index.get('last_write') != last_write:
+            index = {
+                'last_write': last_write,
+                'entries': scan_uninstallers(key),
+            }
+            save_uninstaller_index(path, index)
+    finally:
+        winreg.CloseKey(key)
+    _uninstaller_index = index
+    return index['entries']
 
-    winreg.CloseKey(key)
 
-    if not match:
-        raise FileNotFoundError
-    return match
+def find_uninstaller_id(name):
+    try:
+        return get_uninstaller_index()[name]
+    except KeyError:
+        raise FileNotFoundError(name)
 
 
 def get_bundle_cache_path(name):
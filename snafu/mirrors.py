@@ -0,0 +1,226 @@
+import asyncio
+import concurrent.futures
+import functools
+import json
+import threading
+import time
+
+import attr
+import click
+
+from . import configs, network, transfers, utils
+
+
+ORIGIN = 'https://www.python.org/ftp/python'
+
+# Re-measure a mirror's latency if the last probe is older than this.
+PROBE_TTL = 60 * 60
+
+PROBE_TIMEOUT = 3
+
+# Assumed download size when ranking for a file of unknown size, so
+# measured throughput still counts. Installers are about this large.
+DEFAULT_ESTIMATE_SIZE = 25 * 1024 * 1024
+
+# Seconds added to a mirror's estimate per failure, halved every
+# FAILURE_HALF_LIFE seconds, so a mirror failing once is tried again later.
+FAILURE_PENALTY = 60
+
+FAILURE_HALF_LIFE = 60 * 60
+
+# Failures that make a download try the next mirror.
+FAILOVER_ERRORS = (
+    OSError,    # Includes requests.RequestException.
+    utils.DownloadIntegrityError,
+)
+
+
+@attr.s
+class Mirror:
+
+    base = attr.ib(convert=lambda s: s.rstrip('/'))
+    latency = attr.ib(default=None)
+    throughput = attr.ib(default=None)
+    failures = attr.ib(default=0)
+    failed_at = attr.ib(default=0)
+    probed_at = attr.ib(default=0)
+
+    def __str__(self):
+        return self.base
+
+    def get_url(self, path):
+        return '{}/{}'.format(self.base, path)
+
+    def estimate(self, size, *, now=None):
+        """Estimate seconds needed to download size bytes from this mirror.
+
+        Recent failures are added as a penalty, decaying over time.
+        """
+        if self.latency is None:
+            return float('inf')
+        if now is None:
+            now = time.time()
+        seconds = self.latency + self.get_penalty(now)
+        if self.throughput:
+            seconds += (size or DEFAULT_ESTIMATE_SIZE) / self.throughput
+        return seconds
+
+    def get_penalty(self, now):
+        age = max(now - self.failed_at, 0)
+        return (
+            FAILURE_PENALTY * self.failures *
+            0.5 ** (age / FAILURE_HALF_LIFE)
+        )
+
+    def probe(self):
+        """Measure the mirror's latency.
+        """
+        start = time.perf_counter()
+        local_path = utils.get_local_path(self.base)
+        try:
+            if local_path is not None:
+                local_path.stat()
+            else:
+                # Any response counts; we only care how fast it arrives.
+                network.get_session().head(
+                    self.base + '/', timeout=PROBE_TIMEOUT,
+                )
+        except OSError:
+            self.latency = None
+        else:
+            self.latency = time.perf_counter() - start
+        self.probed_at = time.time()
+
+    def to_json(self):
+        return {
+            'latency': self.latency,
+            'throughput': self.throughput,
+            'failures': self.failures,
+            'failed_at': self.failed_at,
+            'probed_at': self.probed_at,
+        }
+
+
+def get_relative_path(url):
+    """Get the path of URL relative to the origin, or None if not under it.
+    """
+    prefix = ORIGIN + '/'
+    if not url.startswith(prefix):
+        return None
+    return url[len(prefix):]
+
+
+@attr.s
+class MirrorList:
+    """Mirrors of the python.org FTP directory, ranked by measured speed.
+    """
+    mirrors = attr.ib()
+    stats_path = attr.ib(default=None)
+    _lock = attr.ib(
+        default=attr.Factory(threading.Lock),
+        init=False, repr=False, cmp=False,
+    )
+
+    def save(self):
+        if self.stats_path is None:
+            return
+        # Stats only affect ranking. Losing them must not fail a download.
+        with self._lock:
+            utils.write_json_atomic(self.stats_path, {
+                m.base: m.to_json() for m in self.mirrors
+            }, optional=True)
+
+    def rank(self, *, size=None):
+        """Sort mirrors by estimated download time, fastest first.
+
+        Mirrors not probed recently are probed (concurrently) first. If size
+        is unknown, a typical installer size is assumed.
+        """
+        now = time.time()
+        stale = [m for m in self.mirrors if now - m.probed_at > PROBE_TTL]
+        if stale:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                list(executor.map(Mirror.probe, stale))
+            self.save()
+        return sorted(
+            self.mirrors, key=lambda m: m.estimate(size, now=now),
+        )
+
+    def record_success(self, mirror, *, size, seconds):
+        mirror.failures = 0
+        if seconds > 0:
+            mirror.throughput = size / seconds
+        self.save()
+
+    def record_failure(self, mirror):
+        now = time.time()
+        # Fold the decayed penalty so far into the count.
+        mirror.failures = mirror.get_penalty(now) / FAILURE_PENALTY + 1
+        mirror.failed_at = now
+        self.save()
+
+    def download_file(self, url, **kwargs):
+        """Synchronous interface to `download_file_async()`.
+        """
+        async def download():
+            async with transfers.Engine() as engine:
+                return await self.download_file_async(engine, url, **kwargs)
+
+        return transfers.run(download())
+
+    async def download_file_async(self, engine, url, *, size=None, **kwargs):
+        """Download URL from the fastest mirror, failing over on errors.
+
+        Keyword arguments are passed to `transfers.Engine.download_file()`.
+        Each mirror is verified with the same `check`. URLs outside the
+        origin are downloaded directly.
+        """
+        path = get_relative_path(url)
+        if path is None or not self.mirrors:
+            return await engine.download_file(url, **kwargs)
+
+        kwargs.setdefault('filename', path.rsplit('/', 1)[-1])
+        if [m.base for m in self.mirrors] == [ORIGIN]:
+            # No mirrors configured. Nothing to rank, or fail over to.
+            return await engine.download_file(url, **kwargs)
+        mirrors = await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(self.rank, size=size),
+        )
+        for i, mirror in enumerate(mirrors, 1):
+            start = time.perf_counter()
+            try:
+                result = await engine.download_file(
+                    mirror.get_url(path), **kwargs
+                )
+            except FAILOVER_ERRORS as e:
+                self.record_failure(mirror)
+                if i == len(mirrors):
+                    raise
+                click.echo('WARNING: Failed to download from {} ({})'.format(
+                    mirror, e,
+                ), err=True)
+                continue
+            self.record_success(
+                mirror, size=result.stat().st_size,
+                seconds=time.perf_counter() - start,
+            )
+            return result
+
+
+def get_mirror_list():
+    bases = configs.get_mirrors()
+    if ORIGIN not in (b.rstrip('/') for b in bases):
+        bases.append(ORIGIN)
+    stats_path = configs.get_cache_dir_path().joinpath('mirrors.json')
+    try:
+        with stats_path.open() as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {}
+    mirrors = []
+    for base in bases:
+        mirror = Mirror(base=base)
+        for key, value in stats.get(mirror.base, {}).items():
+            setattr(mirror, key, value)
+        mirrors.append(mirror)
+    return MirrorList(mirrors=mirrors, stats_path=stats_path)
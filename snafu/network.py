@@ -0,0 +1,210 @@
+import atexit
+import os
+import threading
+
+import attr
+import click
+import requests
+import requests.adapters
+import urllib3.util.retry
+
+from . import configs, termui
+
+
+# Responses that are retried, after backing off.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@attr.s
+class Statistics:
+    """Counters of HTTP traffic made by this process.
+    """
+    requests = attr.ib(default=0)
+    bytes_received = attr.ib(default=0)
+    latency_total = attr.ib(default=0.0)
+    latency_max = attr.ib(default=0.0)
+
+    # Connections made by the asyncio engine. The requests session's pools
+    # keep their own counts (see `Session.get_connection_counts()`).
+    connections = attr.ib(default=0)
+    reused = attr.ib(default=0)
+    _lock = attr.ib(
+        default=attr.Factory(threading.Lock),
+        init=False, repr=False, cmp=False,
+    )
+
+    def add_response(self, response):
+        self.add_latency(response.elapsed.total_seconds())
+
+    def add_latency(self, latency):
+        with self._lock:
+            self.requests += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def add_connection(self, *, reused):
+        with self._lock:
+            if reused:
+                self.reused += 1
+            else:
+                self.connections += 1
+
+    def add_bytes(self, n):
+        with self._lock:
+            self.bytes_received += n
+
+
+class _CountingRawResponse:
+    """Wrap a urllib3 response to count bytes read from it.
+    """
+    def __init__(self, raw, statistics):
+        self._raw = raw
+        self._statistics = statistics
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def stream(self, *args, **kwargs):
+        for chunk in self._raw.stream(*args, **kwargs):
+            self._statistics.add_bytes(len(chunk))
+            yield chunk
+
+    def read(self, *args, **kwargs):
+        data = self._raw.read(*args, **kwargs)
+        self._statistics.add_bytes(len(data))
+        return data
+
+
+class CountingHTTPAdapter(requests.adapters.HTTPAdapter):
+
+    def __init__(self, *, statistics, **kwargs):
+        super().__init__(**kwargs)
+        self.statistics = statistics
+
+    def build_response(self, req, resp):
+        response = super().build_response(req, resp)
+        response.raw = _CountingRawResponse(response.raw, self.statistics)
+        return response
+
+    def get_connection_counts(self):
+        """Count (connections made, requests made) by this adapter's pools.
+        """
+        pools = self.poolmanager.pools
+        connections = requests_made = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_made += pool.num_requests
+        return connections, requests_made
+
+
+class Session(requests.Session):
+    """Session with default timeouts, retries, and traffic statistics.
+    """
+    def __init__(self, *, pool_size, retries, backoff, timeout,
+                 statistics=None):
+        super().__init__()
+        self.timeout = timeout
+        self.statistics = statistics or Statistics()
+        self._counting_adapters = []
+        self.retries = urllib3.util.retry.Retry(
+            total=retries, backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        self.resize_pool(pool_size)
+        self.hooks['response'].append(self._record_response)
+
+    def _record_response(self, response, *args, **kwargs):
+        self.statistics.add_response(response)
+
+    def resize_pool(self, pool_size):
+        self.pool_size = pool_size
+        adapter = CountingHTTPAdapter(
+            statistics=self.statistics, pool_maxsize=pool_size,
+            max_retries=self.retries,
+        )
+        self._counting_adapters.append(adapter)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def get_connection_counts(self):
+        connections = requests_made = 0
+        for adapter in self._counting_adapters:
+            c, r = adapter.get_connection_counts()
+            connections += c
+            requests_made += r
+        return connections, requests_made
+
+
+_session = None
+_statistics = None
+_session_lock = threading.RLock()
+
+
+def get_statistics():
+    """Get the process-wide HTTP statistics.
+
+    If the environment variable SNAFU_HTTP_STATISTICS is set, a summary is
+    printed when the process exits.
+    """
+    global _statistics
+    with _session_lock:
+        if _statistics is None:
+            _statistics = Statistics()
+            if os.environ.get('SNAFU_HTTP_STATISTICS'):
+                atexit.register(echo_statistics)
+        return _statistics
+
+
+def get_session(*, pool_size=None):
+    """Get the process-wide HTTP session.
+
+    Every network call should go through this, so connections are pooled and
+    reused. If `pool_size` is given, the pool is grown to at least the size
+    (e.g. for concurrent downloads).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            settings = configs.get_http_settings()
+            _session = Session(
+                pool_size=settings['pool_size'],
+                retries=settings['retries'],
+                backoff=settings['backoff'],
+                timeout=(
+                    settings['connect_timeout'], settings['read_timeout'],
+                ),
+                statistics=get_statistics(),
+            )
+        if pool_size is not None and pool_size > _session.pool_size:
+            _session.resize_pool(pool_size)
+        return _session
+
+
+def echo_statistics():
+    statistics = get_statistics()
+    if not statistics.requests:
+        return
+    connections, reused = statistics.connections, statistics.reused
+    if _session is not None:
+        pooled, requests_made = _session.get_connection_counts()
+        connections += pooled
+        reused += max(0, requests_made - pooled)
+    click.echo('\n'.join([
+        'HTTP statistics:',
+        '  Requests: {} over {} connections ({} reused)'.format(
+            statistics.requests, connections, reused,
+        ),
+        '  Received: {}'.format(termui.format_size(statistics.bytes_received)),
+        '  Latency: {:.0f} ms average, {:.0f} ms max'.format(
+            statistics.latency_total / statistics.requests * 1000,
+            statistics.latency_max * 1000,
+        ),
+    ]), err=True)
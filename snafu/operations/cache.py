@@ -0,0 +1,80 @@
+import datetime
+
+import click
+
+from snafu import cacheserver, caches, configs, mirrors, termui
+
+
+def list_():
+    cache = caches.get_installer_cache()
+    entries = cache.entries()
+    if not entries:
+        click.echo('Installer cache is empty.', err=True)
+        return
+    for entry in entries:
+        last_used = datetime.datetime.fromtimestamp(entry.last_used)
+        click.echo('{}  {:>9}  {}  {}'.format(
+            entry.key, termui.format_size(entry.size),
+            last_used.strftime('%Y-%m-%d %H:%M'), entry.filename,
+        ))
+    max_size = cache.max_size
+    click.echo('Total: {} in {} installers (limit: {})'.format(
+        termui.format_size(sum(e.size for e in entries)), len(entries),
+        'none' if max_size is None else termui.format_size(max_size),
+    ))
+
+
+def prune(ctx, prune_all, max_megabytes):
+    cache = caches.get_installer_cache()
+    if prune_all:
+        max_size = 0
+    elif max_megabytes is not None:
+        max_size = max_megabytes * 1024 * 1024
+    else:
+        max_size = configs.get_cache_max_size()
+        if max_size is None:
+            click.echo('No cache size limit configured.', err=True)
+            click.echo('HINT: Use --max-megabytes or --all.', err=True)
+            ctx.exit(1)
+    removed = cache.prune(max_size)
+    for entry in removed:
+        click.echo('Removed {}'.format(entry.filename))
+    click.echo('Freed {}.'.format(
+        termui.format_size(sum(e.size for e in removed)),
+    ))
+
+
+def verify(ctx, rehash):
+    cache = caches.get_installer_cache()
+    corrupted = []
+    for entry in cache.entries():
+        if cache.verify(entry, rehash=rehash):
+            click.echo('OK       {}'.format(entry.filename))
+        else:
+            click.echo('CORRUPT  {}'.format(entry.filename))
+            cache.remove(entry)
+            corrupted.append(entry)
+    if corrupted:
+        click.echo('Removed {} corrupted installers.'.format(
+            len(corrupted),
+        ), err=True)
+        ctx.exit(1)
+
+
+def serve(host, port):
+    state = cacheserver.CacheServerState(
+        cache=caches.get_installer_cache(),
+        mirror_list=mirrors.get_mirror_list(),
+        catalogue=cacheserver.get_catalogue(),
+    )
+    server = cacheserver.CacheServer((host, port), state)
+    host, port = server.server_address[:2]
+    click.echo('Serving installer cache at http://{}:{}/'.format(host, port))
+    click.echo('Press Ctrl+C to stop.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.cache.flush()
@@ -0,0 +1,26 @@
+import click
+
+from snafu import catalogue
+from snafu.catalogue import format_version
+
+
+def update(source):
+    try:
+        result = catalogue.update(source=source)
+    except OSError as e:
+        click.echo('Failed to update catalogue: {}'.format(e), err=True)
+        click.get_current_context().exit(1)
+    for name, previous, version_info in result.updated:
+        if previous is None:
+            click.echo('Added Python {} ({})'.format(
+                name, format_version(version_info),
+            ))
+        else:
+            click.echo('Updated Python {} from {} to {}'.format(
+                name, format_version(previous), format_version(version_info),
+            ))
+    if not result.updated:
+        click.echo('Catalogue is up to date.')
+    click.echo('Checked {} directories ({} unchanged).'.format(
+        result.requests, result.revalidated,
+    ), err=True)
@@ -1,8 +1,9 @@
+import contextlib
 import functools
 
 import click
 
-from snafu import metadata, versions
+from snafu import installations, metadata, specifiers, versions
 
 
 def check_installation(version, *, installed=True, on_exit=None):
@@ -22,6 +23,17 @@ def check_installation(version, *, installed=True, on_exit=None):
     click.get_current_context().exit(1)
 
 
+def check_installer_file(version, path):
+    """Make sure a user-supplied installer is the one in the catalogue.
+    """
+    if version.verify_installer(path):
+        return
+    click.echo('{} does not match the checksum of {}.'.format(
+        path, version,
+    ), err=True)
+    click.get_current_context().exit(1)
+
+
 def get_active_names():
     try:
         return metadata.get_active_python_versions()
@@ -30,28 +42,81 @@ def get_active_names():
 
 
 def get_versions(*, installed_only):
-    vers = versions.get_versions()
-    names = set(v.name for v in vers)
+    # On a 32-bit host, 64-bit names with a 32-bit counterpart are hidden.
+    architecture = 'amd64' if metadata.can_install_64bit() else 'win32'
+    entries = versions.get_catalogue(architecture)
+    if installed_only:
+        entries = [e for e in entries if e.is_installed()]
+    return [e.get_version() for e in entries]
 
-    def should_include(version):
-        if installed_only and not version.is_installed():
-            return False
-        # On a 32-bit host, hide 64-bit names if there is a 32-bit counterpart.
-        if (not metadata.can_install_64bit() and
-                not version.name.endswith('-32') and
-                '{}-32'.format(version.name) in names):
-            return False
-        return True
 
-    return [v for v in vers if should_include(v)]
+def probe_installed(vers):
+    """Find version info of installed versions.
 
+    Versions not installed are skipped. Returns a 2-tuple (version infos,
+    errors), mapping versions to their installed version info, or the error
+    raised when finding it.
+    """
+    found = {}
+    for version in vers:
+        with contextlib.suppress(FileNotFoundError):
+            found[version] = version.get_installation()
+    version_infos, errors = installations.probe_versions(found.values())
+    return (
+        {v: version_infos[i] for v, i in found.items() if i in version_infos},
+        {v: errors[i] for v, i in found.items() if i in errors},
+    )
 
-def get_version(name):
-    force_32 = not metadata.can_install_64bit()
+
+def echo_probe_errors(errors):
+    for version, error in errors.items():
+        click.echo('WARNING: Failed to find version of {}: {}'.format(
+            version, error,
+        ), err=True)
+
+
+def get_all_variants():
+    return versions.get_all_variants()
+
+
+@functools.lru_cache(maxsize=None)
+def get_resolver():
+    return specifiers.build_resolver(host_64bit=metadata.can_install_64bit())
+
+
+def resolve_version(name, *, installed):
+    """Resolve a version specifier to the best matching version.
+
+    If `installed` is true, only installed versions are considered. Returns
+    None if nothing matches.
+    """
     try:
-        version = versions.get_version(name, force_32=force_32)
-    except versions.VersionNotFoundError:
-        click.echo('No such version: {}'.format(name), err=True)
+        specifier = specifiers.parse(name)
+    except specifiers.InvalidSpecifier:
+        return None
+    candidate = get_resolver().best_match(
+        specifier, predicate=(versions.is_installed if installed else None),
+    )
+    if candidate is None:
+        return None
+    return versions.get_version(candidate.name, force_32=(
+        candidate.force_32 or not metadata.can_install_64bit()
+    ))
+
+
+def get_version(name, *, installed=False):
+    force_32 = not metadata.can_install_64bit()
+    version = None
+    if versions.VERSION_NAME_RE.match(name):
+        with contextlib.suppress(versions.VersionNotFoundError):
+            version = versions.get_version(name, force_32=force_32)
+    if version is None:
+        version = resolve_version(name, installed=installed)
+    if version is None:
+        message = 'No such version: {}'
+        if installed:
+            message = 'No installed version matches: {}'
+        click.echo(message.format(name), err=True)
         click.get_current_context().exit(1)
     if version.name != name:
         click.echo('Note: Selecting {} instead of {}'.format(
@@ -60,14 +125,16 @@ def get_version(name):
     return version
 
 
-def version_command(*, plural=False, wild_versions=()):
-    if wild_versions:
-        def _get_version(n):
-            if n in wild_versions:
-                return n
-            return get_version(n)
-    else:
-        _get_version = get_version
+def version_command(*, plural=False, wild_versions=(), installed=False):
+    """Convert version arguments of a command into versions.
+
+    Arguments can be version names or specifiers. If `installed` is true,
+    specifiers only match installed versions.
+    """
+    def _get_version(n):
+        if n in wild_versions:
+            return n
+        return get_version(n, installed=installed)
 
     def decorator(f):
 
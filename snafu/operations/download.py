@@ -1,29 +1,184 @@
+import asyncio
+import collections
 import pathlib
-import shutil
+import time
 
+import attr
 import click
 
-from snafu import utils
+from snafu import caches, configs, mirrors, termui, transfers
 
-from .common import version_command
+from .common import get_all_variants, version_command
 
 
-def download_installer(version):
-    click.echo('Downloading {}'.format(version.url))
-    return utils.download_file(version.url, check=version.check_installer)
+def download_installer(version, *, connections=None, quiet=False):
+    """Download an installer into the cache, and return its path.
+    """
+    async def download():
+        async with transfers.Engine() as engine:
+            return await download_installer_async(
+                engine, version, connections=connections, quiet=quiet,
+            )
 
+    return transfers.run(download())
+
+
+async def download_installer_async(engine, version, *, connections=None,
+                                   progress=None, mirror_list=None,
+                                   quiet=False):
+    cache = caches.get_installer_cache()
+    cached = cache.get(version.md5_sum)
+    if cached is not None:
+        if version.verify_installer(cached):
+            if not quiet:
+                click.echo('Using cached {}'.format(cached.name))
+            return cached
+        click.echo('WARNING: Cached {} is corrupted.'.format(
+            cached.name,
+        ), err=True)
+        cached.unlink()
+
+    if connections is None:
+        connections = configs.get_download_connections()
+    if mirror_list is None:
+        mirror_list = mirrors.get_mirror_list()
+    if not quiet:
+        click.echo('Downloading {}'.format(version.url))
+    path = await mirror_list.download_file_async(
+        engine, version.url, check=version.check_installer,
+        container=cache.get_container(version.md5_sum),
+        partial_dir=configs.get_downloads_dir_path(),
+        connections=connections, progress=progress,
+    )
+    cache.add(version.md5_sum, version.url, path)
+    return path
+
+
+@attr.s
+class DownloadResult:
+
+    version = attr.ib()
+    path = attr.ib(default=None)
+    error = attr.ib(default=None)
+    size = attr.ib(default=0)       # Bytes transferred; 0 if cached.
+    seconds = attr.ib(default=0.0)
+
+
+def download_installers(versions, *, jobs, connections):
+    """Download installers of versions concurrently.
+
+    Up to `jobs` installers are downloaded at once on one event loop, sharing
+    connections and a combined progress bar. Returns a list of
+    `DownloadResult`.
+    """
+    mirror_list = mirrors.get_mirror_list()
+    progress = termui.CombinedProgress(
+        label='{} installers'.format(len(versions)),
+    )
+
+    async def download_one(engine, limit, version):
+        cached = caches.get_installer_cache().get(version.md5_sum) is not None
+        async with limit:
+            start = time.perf_counter()
+            try:
+                path = await download_installer_async(
+                    engine, version, connections=connections,
+                    progress=progress, mirror_list=mirror_list, quiet=True,
+                )
+            except Exception as e:
+                return DownloadResult(version=version, error=e)
+        return DownloadResult(
+            version=version, path=path,
+            size=0 if cached else path.stat().st_size,
+            seconds=time.perf_counter() - start,
+        )
+
+    async def download_all():
+        limit = asyncio.Semaphore(jobs)
+        async with transfers.Engine(per_host=jobs * connections) as engine:
+            return await engine.gather(
+                [download_one(engine, limit, v) for v in versions],
+                progress=progress,
+            )
+
+    return transfers.run(download_all())
+
+
+def echo_summary(results, seconds):
+    for result in results:
+        if result.error is not None:
+            click.echo('  {:<32}  FAILED: {}'.format(
+                result.version.url.rsplit('/', 1)[-1], result.error,
+            ))
+        elif not result.size:
+            click.echo('  {:<32}  cached'.format(result.path.name))
+        else:
+            click.echo('  {:<32}  {:>9}  {:>6.1f}s  {:>9}/s'.format(
+                result.path.name, termui.format_size(result.size),
+                result.seconds, termui.format_size(
+                    int(result.size / result.seconds) if result.seconds else 0
+                ),
+            ))
+    total = sum(r.size for r in results)
+    click.echo('Downloaded {} in {:.1f}s ({}/s).'.format(
+        termui.format_size(total), seconds,
+        termui.format_size(int(total / seconds) if seconds else 0),
+    ))
+
+
+def get_target(dest_dir, version):
+    return pathlib.Path(dest_dir, version.url.rsplit('/', 1)[-1])
+
+
+@version_command(plural=True)
+def download(ctx, versions, download_all, dest_dir, force, connections,
+             jobs):
+    if download_all == bool(versions):
+        click.echo(ctx.get_usage(), color=ctx.color)
+        click.echo(
+            '\nError: Specify either versions or --all.', color=ctx.color,
+        )
+        ctx.exit(1)
+    if download_all:
+        versions = get_all_variants()
+
+    # Remove duplicate inputs (keep first apperance).
+    versions = list(collections.OrderedDict(
+        (version.url, version) for version in versions
+    ).values())
 
-@version_command()
-def download(ctx, version, dest_dir, force):
-    installer = download_installer(version)
     if dest_dir is None:
         dest_dir = pathlib.Path.cwd()
-    target = pathlib.Path(dest_dir, installer.name)
-    if target.exists() and not force:
-        click.echo('Target exists: {}'.format(target), err=True)
-        click.echo('NOTE: Use --force to overwrite destination.', err=True)
+    if not force:
+        existing = [
+            target for target in (get_target(dest_dir, v) for v in versions)
+            if target.exists()
+        ]
+        for target in existing:
+            click.echo('Target exists: {}'.format(target), err=True)
+        if existing:
+            click.echo('NOTE: Use --force to overwrite destination.', err=True)
+            ctx.exit(1)
+
+    if len(versions) == 1:
+        version, = versions
+        installer = download_installer(version, connections=connections)
+        results = [DownloadResult(version=version, path=installer)]
+    else:
+        start = time.perf_counter()
+        results = download_installers(
+            versions, jobs=jobs,
+            connections=connections or configs.get_download_connections(),
+        )
+        echo_summary(results, time.perf_counter() - start)
+
+    for result in results:
+        if result.error is not None:
+            continue
+        target = get_target(dest_dir, result.version)
+        caches.link_or_copy(result.path, target)
+        click.echo('{} installer is downloaded successfully to {}'.format(
+            result.version, target,
+        ))
+    if any(result.error is not None for result in results):
         ctx.exit(1)
-    shutil.move(str(installer), str(target))
-    click.echo('{} installer is downloaded successfully to {}'.format(
-        version, target,
-    ))
@@ -3,8 +3,10 @@ import pathlib
 
 import click
 
+from snafu import metadata, states
+
 from .common import (
-    check_installation,
+    check_installation, check_installer_file,
     get_active_names, get_version, get_versions, version_command,
 )
 from .download import download_installer
@@ -24,6 +26,7 @@ def install(version, use, from_file):
         installer_path = download_installer(version)
     else:
         installer_path = pathlib.Path(from_file)
+        check_installer_file(version, installer_path)
 
     if not use and not get_versions(installed_only=True):
         use = True
@@ -31,6 +34,7 @@ def install(version, use, from_file):
 
     click.echo('Running installer {}'.format(installer_path))
     dirpath = version.install(str(installer_path))
+    metadata.invalidate_install_paths()
 
     link_commands(version)
     click.echo('{} is installed successfully to {}'.format(
@@ -45,7 +49,7 @@ def install(version, use, from_file):
         activate(versions, allow_empty=True)
 
 
-@version_command()
+@version_command(installed=True)
 def uninstall(version, from_file):
     check_installation(version, on_exit=functools.partial(
         unlink_commands, version,
@@ -54,6 +58,7 @@ def uninstall(version, from_file):
 
     if from_file is not None:
         uninstaller_path = pathlib.Path(from_file)
+        check_installer_file(version, uninstaller_path)
     else:
         try:
             uninstaller_path = version.get_cached_uninstaller()
@@ -62,11 +67,12 @@ def uninstall(version, from_file):
 
     click.echo('Running uninstaller {}'.format(uninstaller_path))
     version.uninstall(str(uninstaller_path))
+    metadata.invalidate_install_paths()
     unlink_commands(version)
     click.echo('{} is uninstalled successfully.'.format(version))
 
 
-@version_command(wild_versions=['self'])
+@version_command(wild_versions=['self'], installed=True)
 def upgrade(ctx, version, pre, from_file):
     if version == 'self':
         from .releases import self_upgrade
@@ -77,9 +83,10 @@ def upgrade(ctx, version, pre, from_file):
         click.echo('Installing prereleases is not supported yet.', err=True)
         ctx.exit(1)
 
-    installation_vi = check_installation(
+    installation = check_installation(
         version, on_exit=functools.partial(link_commands, version),
-    ).get_version_info()
+    )
+    installation_vi = installation.get_version_info()
     if installation_vi >= version.version_info:
         click.echo('{} is up to date ({}).'.format(
             version, '.'.join(str(i) for i in installation_vi),
@@ -90,9 +97,12 @@ def upgrade(ctx, version, pre, from_file):
         installer_path = download_installer(version)
     else:
         installer_path = pathlib.Path(from_file)
+        check_installer_file(version, installer_path)
 
     click.echo('Running installer {}'.format(installer_path))
     version.upgrade(str(installer_path))
+    metadata.invalidate_install_paths()
+    states.get_state().forget_version_info(installation.python)
 
     link_commands(version)
     click.echo('{} is upgraded successfully at {}'.format(
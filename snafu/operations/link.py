@@ -1,12 +1,14 @@
 import collections
 import enum
 import filecmp
+import functools
 import itertools
-import shutil
+import os
+import pathlib
 
 import click
 
-from snafu import configs, metadata
+from snafu import configs, metadata, publishing, relinks, scriptsets
 
 from .common import (
     check_installation, get_active_names, get_version, version_command,
@@ -28,16 +30,26 @@ class Overwrite(enum.Enum):
         )
 
 
-def publish_file(source, target, *, overwrite, quiet):
+def get_publish_strategy():
+    try:
+        return publishing.get_strategy()
+    except ValueError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        click.get_current_context().exit(1)
+
+
+def publish_file(source, target, *, overwrite, quiet, shim=False):
     if target.exists():
         if not overwrite.should(source, target):
             return False
     if not quiet:
         click.echo('  {}'.format(target.name))
     try:
-        shutil.copy2(str(source), str(target))
+        publishing.publish(
+            source, target, strategy=get_publish_strategy(), shim=shim,
+        )
     except OSError as e:
-        click.echo('WARNING: Failed to copy {}.\n{}: {}'.format(
+        click.echo('WARNING: Failed to publish {}.\n{}: {}'.format(
             source.name, type(e).__name__, e,
         ), err=True)
         return False
@@ -47,16 +59,17 @@ def publish_file(source, target, *, overwrite, quiet):
 def publish_shim(name, target, *, overwrite, quiet):
     return publish_file(
         configs.get_shim_path(name), target,
-        overwrite=overwrite, quiet=quiet,
+        overwrite=overwrite, quiet=quiet, shim=True,
     )
 
 
 def safe_unlink(p):
-    if p.exists():
-        try:
-            p.unlink()
-        except OSError as e:
-            click.echo('Failed to remove {} ({})'.format(p, e), err=True)
+    try:
+        publishing.remove(p)
+    except OSError as e:
+        click.echo('Failed to remove {} ({})'.format(p, e), err=True)
+        return False
+    return True
 
 
 def collect_version_scripts(versions):
@@ -67,7 +80,8 @@ def collect_version_scripts(versions):
         version_scripts_dir = version.get_installation().scripts_dir
         if not version_scripts_dir.is_dir():
             continue
-        for path in version_scripts_dir.iterdir():
+        for entry in os.scandir(str(version_scripts_dir)):
+            path = pathlib.Path(entry.path)
             blacklisted_stems = {
                 # Encourage people to always use qualified commands.
                 'easy_install', 'pip',
@@ -82,6 +96,8 @@ def collect_version_scripts(versions):
             }
             if path.name in names or path.stem in blacklisted_stems:
                 continue
+            if not entry.is_file():
+                continue
             names.add(path.name)
             if path.stem in shimmed_stems:
                 shims.append(path.name)
@@ -95,51 +111,90 @@ def activate(versions, *, overwrite=Overwrite.yes,
     if not allow_empty and not versions:
         click.echo('No active versions.', err=True)
         click.get_current_context().exit(1)
-
+    # Other processes may be activating, e.g. pip hooks of parallel builds.
+    # Their relinks requested meanwhile are left to this one.
+    with relinks.locked(relink=serve_relink):
+        publish_scripts(versions, overwrite=overwrite, quiet=quiet)
+
+
+def publish_scripts(versions, *, overwrite, quiet):
+    get_publish_strategy()  # Fail on a bad setting before touching anything.
+    names = [version.name for version in versions]
+    stamp = relinks.make_stamp(
+        names,
+        (version.get_installation().scripts_dir for version in versions),
+    )
     source_scripts, shims = collect_version_scripts(versions)
-    scripts_dir = configs.get_scripts_dir_path()
+    scripts_dir = scriptsets.get_scripts_dir(names)
+    publishing.remove_temps(scripts_dir)
 
-    using_scripts = set()
+    # Map each script name to publish, to where to publish it from.
+    sources = collections.OrderedDict(
+        (source.name, source) for source in source_scripts
+    )
+    shim_sources = {
+        configs.get_shim_path(name)
+        for name in ('piplike-script', 'python-script')
+    }
+    for shim in shims:
+        sources.setdefault(shim, configs.get_shim_path('piplike-script'))
+    for version in versions:
+        sources.setdefault(
+            version.python_major_command_name,
+            configs.get_shim_path('python-script'),
+        )
 
-    # TODO: Distinguish between `snafu use` and automatic hook after shimmed
-    # pip execution. The latter should only write scripts that actually chaged,
-    # or at least should only log those writes (and overwrite others silently).
-    if source_scripts or shims or versions:
-        if not quiet:
-            click.echo('Publishing scripts....')
-        for source in source_scripts:
-            target = scripts_dir.joinpath(source.name)
-            if not source.is_file():
-                continue
-            using_scripts.add(target)
-            publish_file(source, target, overwrite=overwrite, quiet=quiet)
-        for shim in shims:
-            target = scripts_dir.joinpath(shim)
-            if target in using_scripts:
-                continue
-            using_scripts.add(target)
-            publish_shim(
-                'piplike-script', target, overwrite=overwrite, quiet=quiet,
-            )
-        for version in versions:
-            target = version.python_major_command
-            if target in using_scripts:
-                continue
-            using_scripts.add(target)
-            publish_shim(
-                'python-script', target, overwrite=overwrite, quiet=quiet,
-            )
+    # Only scripts changed since the last activation are written (and
+    # logged), so the automatic hook after pip is quiet and cheap.
+    manifest = publishing.Manifest.load(scriptsets.get_manifest_path(names))
+    plan = publishing.make_plan(manifest, scripts_dir, sources)
+    if (plan.add or plan.update) and not quiet:
+        click.echo('Publishing scripts....')
+    # The stamp is only written if the plan is carried out in full, so a
+    # relink is tried again next time otherwise.
+    complete = True
+    for source, target in plan.add:
+        if publish_file(source, target, overwrite=overwrite, quiet=quiet,
+                        shim=(source in shim_sources)):
+            manifest.record(source, target)
+        else:
+            complete = False
+    for source, target in plan.update:
+        if overwrite == Overwrite.no:
+            continue
+        if (overwrite == Overwrite.smart and
+                filecmp.cmp(str(source), str(target))):
+            manifest.record(source, target)
+        elif publish_file(
+                source, target, overwrite=Overwrite.yes, quiet=quiet,
+                shim=(source in shim_sources)):
+            manifest.record(source, target)
+        else:
+            complete = False
+    for source, target in plan.refresh:
+        manifest.refresh(source, target)
+    for source, target in plan.linked:
+        manifest.record(source, target)
 
-    metadata.set_active_python_versions(version.name for version in versions)
+    metadata.set_active_python_versions(names)
 
-    stale_scripts = set(scripts_dir.iterdir()) - using_scripts
-    if stale_scripts:
+    if plan.remove and not quiet:
+        click.echo('Cleaning stale scripts...')
+    for script in plan.remove:
         if not quiet:
-            click.echo('Cleaning stale scripts...')
-        for script in stale_scripts:
-            if not quiet:
-                click.echo('  {}'.format(script.name))
-            safe_unlink(script)
+            click.echo('  {}'.format(script.name))
+        if safe_unlink(script):
+            manifest.forget(script)
+        else:
+            complete = False
+    manifest.save()
+
+    # With prebuilt sets, the old set is left as is for switching back.
+    if not scriptsets.switch(names):
+        complete = False    # Migrate to sets on the next relink.
+    scriptsets.collect_garbage(keep=names)
+    if complete:
+        relinks.write_stamp(stamp)
 
 
 def link_commands(version):
@@ -174,7 +229,7 @@ def update_active_versions(*, remove=frozenset()):
         activate([get_version(n) for n in active_names], allow_empty=True)
 
 
-@version_command(plural=True)
+@version_command(plural=True, installed=True)
 def use(ctx, versions, add):
     if add is None and not versions:
         # Bare "snafu use": Display active versions.
@@ -218,7 +273,22 @@ def use(ctx, versions, add):
     activate(versions, allow_empty=(not add))
 
 
-def link(ctx, command, link_all, overwrite):
+def relink_all(*, overwrite, if_changed):
+    if if_changed and relinks.is_unchanged():
+        return
+    activate(
+        [get_version(n) for n in get_active_names()],
+        overwrite=overwrite, allow_empty=True,
+    )
+
+
+def serve_relink():
+    """Relink requested by another process, as the hook after pip does.
+    """
+    relink_all(overwrite=Overwrite.smart, if_changed=False)
+
+
+def link(ctx, command, link_all, overwrite, if_changed, no_wait):
     if not link_all and not command:    # This mistake is more common.
         click.echo(ctx.get_usage(), color=ctx.color)
         click.echo('\nError: Missing argument "command".', color=ctx.color)
@@ -226,6 +296,16 @@ def link(ctx, command, link_all, overwrite):
     if link_all and command:
         click.echo('--all cannot be used with a command.', err=True)
         ctx.exit(1)
+    if (if_changed or no_wait) and not link_all:
+        click.echo(
+            '--if-changed and --no-wait can only be used with --all.',
+            err=True,
+        )
+        ctx.exit(1)
+
+    # Also checked before loading the CLI, but not if invoked otherwise.
+    if if_changed and relinks.is_unchanged():
+        return
 
     active_names = get_active_names()
     if not active_names:
@@ -237,10 +317,18 @@ def link(ctx, command, link_all, overwrite):
             ctx.exit(1)
 
     if link_all:
-        activate(
-            [get_version(n) for n in active_names],
-            overwrite=overwrite, allow_empty=True,
-        )
+        # Relinks requested while another process is relinking are left to
+        # it, so parallel pip hooks only cause one more run. Unless asked
+        # not to, wait for it, so scripts exist when the command returns.
+        if no_wait:
+            args = ['link', '--all', '--overwrite={}'.format(overwrite.value)]
+            if if_changed:
+                args.append('--if-changed')
+            relinks.enqueue(args)
+        else:
+            relinks.run_coalesced(functools.partial(
+                relink_all, overwrite=overwrite, if_changed=if_changed,
+            ))
         return
 
     command_name = command  # Better variable names.
@@ -261,7 +349,7 @@ def link(ctx, command, link_all, overwrite):
         ctx.exit(1)
 
     target_name = command.name
-    target = configs.get_scripts_dir_path().joinpath(target_name)
+    target = scriptsets.get_scripts_dir(active_names).joinpath(target_name)
 
     # This can be done in publish_file, but we provide a better error message.
     if overwrite != Overwrite.yes and target.exists():
@@ -272,4 +360,9 @@ def link(ctx, command, link_all, overwrite):
 
     ok = publish_file(command, target, overwrite=Overwrite.yes, quiet=True)
     if ok:
+        manifest = publishing.Manifest.load(
+            scriptsets.get_manifest_path(active_names),
+        )
+        manifest.record(command, target)
+        manifest.save()
         click.echo('Linked {} from {}'.format(target_name, version))
@@ -6,7 +6,7 @@ import warnings
 import click
 
 from snafu import __version__
-from snafu import metadata, releases, termui, utils
+from snafu import configs, metadata, releases, termui, utils
 
 
 def install_self_upgrade(path):
@@ -63,5 +63,8 @@ def self_upgrade(*, installer, pre):
         return
 
     url = asset.browser_download_url
-    path = utils.download_file(url, check=asset.check_download)
+    path = utils.download_file(
+        url, check=asset.check_download,
+        partial_dir=configs.get_downloads_dir_path(),
+    )
     install_self_upgrade(path)
@@ -1,11 +1,18 @@
+import json
+
 import click
 
 from .common import (
-    check_installation, get_active_names, get_versions, version_command,
+    check_installation, echo_probe_errors, get_active_names, get_versions,
+    probe_installed, version_command,
 )
 
 
-@version_command()
+def format_version_info(version_info):
+    return '.'.join(str(i) for i in version_info)
+
+
+@version_command(installed=True)
 def where(version):
     installation = check_installation(version)
     click.echo(str(installation.python))
@@ -15,14 +22,22 @@ def list_(list_all):
     vers = get_versions(installed_only=(not list_all))
     active_names = set(get_active_names())
 
+    # Upgrades are only marked when listing installed versions, so listing
+    # the whole catalogue does not probe every installation.
+    upgradable = set()
+    if not list_all:
+        installed, errors = probe_installed(vers)
+        echo_probe_errors(errors)
+        upgradable = {v for v, i in installed.items() if i < v.version_info}
+
     for v in vers:
         marker = ' '
         if v.name in active_names:
             marker = '*'
-        elif v.is_installed():
+        elif not list_all or v.is_installed():
             marker = 'o'
-        # TODO: Show '+' for upgradable.
-        # How should we show an upgradable *and* active version?
+        if upgradable:
+            marker += '+' if v in upgradable else ' '
         click.echo('{} {}'.format(marker, v.name))
 
     if not list_all and not vers:
@@ -31,3 +46,24 @@ def list_(list_all):
             'for installation.',
             err=True,
         )
+
+
+def outdated(as_json):
+    installed, errors = probe_installed(get_versions(installed_only=True))
+    echo_probe_errors(errors)
+    entries = [
+        {
+            'name': version.name,
+            'installed': format_version_info(version_info),
+            'latest': format_version_info(version.version_info),
+        }
+        for version, version_info in installed.items()
+        if version_info < version.version_info
+    ]
+    if as_json:
+        click.echo(json.dumps(entries, indent=4))
+        return
+    for entry in entries:
+        click.echo('{name:<8}{installed} -> {latest}'.format(**entry))
+    if not entries:
+        click.echo('All installed versions are up to date.', err=True)
@@ -0,0 +1,277 @@
+"""Track scripts published into the scripts directory.
+
+A manifest records the source of each published script, the stats of both
+files, and the source's content hash. Activation compares the scripts it
+wants against the manifest, and only touches those that changed.
+
+Scripts are hardlinked (or symlinked) instead of copied if possible, so
+publishing them is cheap. Shims are always copied.
+"""
+
+import contextlib
+import enum
+import json
+import os
+import re
+import shutil
+
+import attr
+
+from . import configs, utils, verification
+
+
+MANIFEST_FORMAT = 1
+
+# Files are made under a temporary name, and moved over the target.
+TEMP_NAME_RE = re.compile(r'^.+\.(\d+)\.tmp$')
+
+
+class Strategy(enum.Enum):
+
+    copy = 'copy'
+    hardlink = 'hardlink'
+    symlink = 'symlink'
+    auto = 'auto'   # Hardlink, symlink, then copy, whichever works first.
+
+    def get_attempts(self, *, shim=False):
+        """Strategies to try in order.
+
+        Shims are always copied. They find out what to run from their own
+        name, which a symlink resolves to the shim's. A hardlink shares the
+        shim in the shims directory, which can't be replaced, e.g. when
+        SNAFU is upgraded, while any shim linked to it runs.
+        """
+        if shim or self == self.copy:
+            return [self.copy]
+        if self == self.hardlink:
+            return [self.hardlink, self.copy]
+        if self == self.auto:
+            return [self.hardlink, self.symlink, self.copy]
+        return [self.symlink, self.copy]
+
+
+def get_strategy():
+    return Strategy(configs.get_publish_strategy())
+
+
+def make_file(source, target, strategy):
+    if strategy == Strategy.hardlink:
+        os.link(str(source), str(target))
+    elif strategy == Strategy.symlink:
+        os.symlink(str(source), str(target))
+    else:
+        shutil.copy2(str(source), str(target))
+
+
+def make_file_with_attempts(source, target, attempts):
+    *attempts, last = attempts
+    for attempt in attempts:
+        try:
+            make_file(source, target, attempt)
+        except OSError:
+            continue
+        return attempt
+    make_file(source, target, last)
+    return last
+
+
+def publish(source, target, *, strategy, shim=False):
+    """Publish source to target, replacing the target.
+
+    Links fail across volumes, or on file systems without support (and
+    symlinks need privileges on Windows), in which case the file is copied.
+    The file is made next to the target, and moved over it, so the target
+    is left as is if publishing fails, and a link is replaced instead of
+    written through. Returns the strategy actually used.
+    """
+    temp = target.with_name('{}.{}.tmp'.format(target.name, os.getpid()))
+    remove(temp)
+    try:
+        used = make_file_with_attempts(
+            source, temp, strategy.get_attempts(shim=shim),
+        )
+        os.replace(str(temp), str(target))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            remove(temp)
+        raise
+    return used
+
+
+def remove_temps(dirpath):
+    """Remove files left by publishing in processes that died.
+
+    Only call this while holding the relink lock, so no other process is
+    publishing.
+    """
+    pid = str(os.getpid())
+    for entry in os.scandir(str(dirpath)):
+        match = TEMP_NAME_RE.match(entry.name)
+        if match and match.group(1) != pid:
+            with contextlib.suppress(OSError):
+                os.unlink(entry.path)
+
+
+def remove(target):
+    """Remove a published script, even if it is a broken symlink.
+    """
+    if os.path.lexists(str(target)):
+        target.unlink()
+
+
+def get_stat_key(stat):
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def stat_or_none(path):
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+
+def get_digest(path):
+    return verification.hash_file(path)['sha256']
+
+
+@attr.s
+class PublishedScript:
+
+    source = attr.ib()
+    source_stat = attr.ib()
+    target_stat = attr.ib()
+    digest = attr.ib()
+
+    def to_json(self):
+        return attr.asdict(self)
+
+
+@attr.s
+class Manifest:
+    """Scripts published into a directory, keyed by name.
+
+    `scripts` is None if the manifest is missing, i.e. what is in the
+    directory is unknown.
+    """
+    path = attr.ib()
+    scripts = attr.ib(default=None)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path=path)
+        if data.get('format') != MANIFEST_FORMAT:
+            return cls(path=path)
+        return cls(path=path, scripts={
+            name: PublishedScript(**value)
+            for name, value in data['scripts'].items()
+        })
+
+    def save(self):
+        # Without a manifest the next activation compares everything.
+        utils.write_json_atomic(self.path, {
+            'format': MANIFEST_FORMAT,
+            'scripts': {
+                name: script.to_json()
+                for name, script in (self.scripts or {}).items()
+            },
+        }, optional=True)
+
+    def record(self, source, target, *, digest=None):
+        """Record target as published from source.
+        """
+        if self.scripts is None:
+            self.scripts = {}
+        self.scripts[target.name] = PublishedScript(
+            source=str(source),
+            source_stat=get_stat_key(source.stat()),
+            target_stat=get_stat_key(target.stat()),
+            digest=(digest or get_digest(source)),
+        )
+
+    def refresh(self, source, target):
+        """Update stats of a published script whose content is unchanged.
+        """
+        self.record(source, target, digest=self.scripts[target.name].digest)
+
+    def forget(self, target):
+        if self.scripts is not None:
+            self.scripts.pop(target.name, None)
+
+
+def get_manifest_path():
+    return configs.get_cache_dir_path().joinpath('published.json')
+
+
+@attr.s
+class Plan:
+    """Operations needed to bring a scripts directory up to date.
+
+    `add` and `update` are lists of (source, target) to publish; `refresh`
+    are (source, target) whose source was touched, but not modified, so only
+    the manifest needs updating. `linked` are (source, target) where target
+    is a link to the source, so it is up to date, but not recorded as is.
+    `remove` lists targets to remove.
+    """
+    add = attr.ib(default=attr.Factory(list))
+    update = attr.ib(default=attr.Factory(list))
+    refresh = attr.ib(default=attr.Factory(list))
+    linked = attr.ib(default=attr.Factory(list))
+    remove = attr.ib(default=attr.Factory(list))
+    unchanged = attr.ib(default=0)
+
+
+def make_plan(manifest, scripts_dir, sources):
+    """Compare wanted scripts against the manifest.
+
+    `sources` maps script names to paths to publish them from. Scripts not
+    in the manifest are compared by the caller, since that depends on how
+    existing files are overwritten.
+    """
+    plan = Plan()
+    published = manifest.scripts or {}
+    for name, source in sources.items():
+        target = scripts_dir.joinpath(name)
+        target_stat = stat_or_none(target)
+        if target_stat is None:
+            plan.add.append((source, target))
+            continue
+        script = published.get(name)
+        source_stat = stat_or_none(source)
+        if source_stat is None:
+            continue    # Removed meanwhile, e.g. by pip uninstall.
+        recorded = (
+            script is not None and script.source == str(source) and
+            script.target_stat == get_stat_key(target_stat)
+        )
+        if os.path.samestat(source_stat, target_stat):
+            # Modifying the source modifies the target, there is nothing
+            # to publish. Record it if needed.
+            if recorded:
+                plan.unchanged += 1
+            else:
+                plan.linked.append((source, target))
+        elif not recorded:
+            plan.update.append((source, target))
+        elif script.source_stat == get_stat_key(source_stat):
+            plan.unchanged += 1
+        elif script.digest == get_digest(source):
+            plan.refresh.append((source, target))
+        else:
+            plan.update.append((source, target))
+
+    if manifest.scripts is None:
+        # Nothing is known about the directory. Remove everything unwanted.
+        names = (
+            entry.name for entry in os.scandir(str(scripts_dir))
+            if not TEMP_NAME_RE.match(entry.name)
+        )
+    else:
+        names = manifest.scripts
+    plan.remove.extend(
+        scripts_dir.joinpath(name) for name in names if name not in sources
+    )
+    return plan
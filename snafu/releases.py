@@ -5,7 +5,8 @@ import warnings
 
 import attr
 import packaging.version
-import requests
+
+from . import network, verification
 
 
 def get_request_headers():
@@ -19,7 +20,7 @@ def get_request_headers():
 def get(endpoint):
     url = urllib.parse.urljoin('https://api.github.com', endpoint)
     headers = get_request_headers()
-    resp = requests.get(url, headers=headers)
+    resp = network.get_session().get(url, headers=headers)
     resp.raise_for_status()
     return resp
 
@@ -44,9 +45,8 @@ class ReleaseAsset(Parsable):
     browser_download_url = attr.ib(convert=str)
     size = attr.ib(convert=int)
 
-    def check_download(self, data):
-        assert len(data) == self.size, \
-            'expect {} bytes, got {}'.format(self.size, len(data))
+    def check_download(self):
+        return verification.SizeVerifier(self.size)
 
 
 def parse_asset_list(data_list):
@@ -0,0 +1,294 @@
+"""Skip, serialise, and coalesce relinks.
+
+Every activation writes a stamp of the active versions, and mtimes of their
+Scripts directories (which change whenever pip adds or removes a script).
+The hook after every pip run checks the stamp first, with `link --all
+--if-changed`. This module is imported before anything else on that path,
+so it must only use the standard library.
+
+Activations hold a lock between processes. A relink requested while another
+process holds it marks a pending request. The holder relinks once more for
+all requests made in the meantime before it is done, and the requester waits
+for that, unless it asked not to.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+import winreg
+
+from . import configs
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+STAMP_FORMAT = 1
+
+LOCK_POLL_INTERVAL = 0.05   # In seconds, on Windows.
+
+SNAFU_KEY_PATH = 'Software\\uranusjr\\SNAFU'
+
+
+def read_active_value():
+    """Read the raw ActivePythonVersions value from the registry.
+    """
+    try:
+        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, SNAFU_KEY_PATH)
+    except FileNotFoundError:
+        return ''
+    try:
+        value, _ = winreg.QueryValueEx(key, 'ActivePythonVersions')
+    except FileNotFoundError:
+        value = ''
+    finally:
+        winreg.CloseKey(key)
+    return value or ''
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_stamp_path():
+    return configs.get_cache_dir_path().joinpath('relink.json')
+
+
+def make_stamp(names, scripts_dirs):
+    """Stamp the state an activation of versions is based on.
+
+    Take this before reading the Scripts directories, so changes made while
+    activating are picked up by the next relink.
+    """
+    return {
+        'format': STAMP_FORMAT,
+        'active': ';'.join(names),
+        'scripts_dirs': {str(p): get_mtime(str(p)) for p in scripts_dirs},
+    }
+
+
+def write_stamp(stamp):
+    from . import utils     # Not needed, nor wanted, on the fast path.
+    utils.write_json_atomic(get_stamp_path(), stamp, optional=True)
+
+
+def is_unchanged():
+    """Whether the last activation is still up to date.
+    """
+    try:
+        with get_stamp_path().open() as f:
+            stamp = json.load(f)
+    except (KeyError, OSError, ValueError):
+        return False
+    if stamp.get('format') != STAMP_FORMAT:
+        return False
+    if stamp['active'] != read_active_value():
+        return False
+    return all(
+        get_mtime(path) == mtime
+        for path, mtime in stamp['scripts_dirs'].items()
+    )
+
+
+def is_unchanged_relink(args):
+    """Whether command line arguments ask for a relink that can be skipped.
+    """
+    return (
+        args[:1] == ['link'] and '--all' in args and
+        '--if-changed' in args and is_unchanged()
+    )
+
+
+def lock_file(f, *, blocking):
+    """Lock an open file exclusively. Returns whether it is locked.
+    """
+    if os.name != 'nt':
+        flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+    # LK_LOCK gives up after 10 seconds. Poll instead.
+    while True:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+        else:
+            return True
+
+
+def unlock_file(f):
+    if os.name != 'nt':
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """An exclusive lock between processes, reentrant within one.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.count = 0
+        self.owner = None
+
+    def acquire(self, *, blocking=True):
+        # A forked child does not hold its parent's lock.
+        if self.count and self.owner == os.getpid():
+            self.count += 1
+            return True
+        f = open(str(self.path), 'a+b')
+        try:
+            locked = lock_file(f, blocking=blocking)
+        except BaseException:
+            f.close()
+            raise
+        if not locked:
+            f.close()
+            return False
+        self.file = f
+        self.count = 1
+        self.owner = os.getpid()
+        return True
+
+    def release(self):
+        self.count -= 1
+        if self.count:
+            return
+        try:
+            unlock_file(self.file)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+_lock = None
+
+
+def get_lock():
+    global _lock
+    if _lock is None:
+        _lock = FileLock(configs.get_cache_dir_path().joinpath('relink.lock'))
+    return _lock
+
+
+@contextlib.contextmanager
+def locked(relink=None):
+    """Hold the relink lock, waiting for other processes to release it.
+
+    If relink is given, it is run for requests made by other processes
+    while the lock was held, after the block is done.
+    """
+    lock = get_lock()
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+    # An outer block in this process serves them instead.
+    if relink is not None and not lock.count:
+        serve_requests(relink)
+
+
+def get_pending_path():
+    return configs.get_cache_dir_path().joinpath('relink.pending')
+
+
+def request():
+    get_pending_path().touch()
+
+
+def take_request():
+    """Clear the pending request. Returns whether there was one.
+    """
+    try:
+        get_pending_path().unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def serve_requests(relink):
+    """Run relink for pending requests, unless another process is relinking.
+
+    The process holding the lock runs relink until no requests are left,
+    including those made while it was running, so any number of them only
+    cost one more run. Returns whether relink was run in this process.
+    """
+    lock = get_lock()
+    ran = False
+    # A request made after the last check, but before the lock is
+    # released, is missed by the holder. Check again after releasing.
+    while get_pending_path().exists():
+        if not lock.acquire(blocking=False):
+            break
+        try:
+            while take_request():
+                relink()
+                ran = True
+        finally:
+            lock.release()
+    return ran
+
+
+def run_coalesced(relink):
+    """Request a relink, and wait until a relink made after it is done.
+
+    Requests made by any number of processes while another one holds the
+    lock only cost one more run. Returns whether relink was run in this
+    process.
+    """
+    request()
+    ran = False
+    # A holder takes requests, and relinks, with the lock held. Once this
+    # process has it, the request is either served, or left to it.
+    with locked():
+        while take_request():
+            relink()
+            ran = True
+    return serve_requests(relink) or ran
+
+
+def enqueue(args):
+    """Request a relink, and return without waiting for it.
+
+    If no process is relinking, start one in the background with args to
+    run the queued requests.
+    """
+    request()
+    lock = get_lock()
+    if not lock.acquire(blocking=False):
+        return False    # The running process picks the request up.
+    lock.release()
+
+    import subprocess   # Only imported when needed, unlike on the fast path.
+    if os.name == 'nt':
+        options = {'creationflags': (
+            subprocess.DETACHED_PROCESS |
+            subprocess.CREATE_NEW_PROCESS_GROUP
+        )}
+        # Before 3.7, close_fds can't be used with redirected std handles.
+        if sys.version_info >= (3, 7):
+            options['close_fds'] = True
+    else:
+        options = {'start_new_session': True, 'close_fds': True}
+    subprocess.Popen(
+        [sys.executable, '-m', 'snafu'] + list(args),
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, **options
+    )
+    return True
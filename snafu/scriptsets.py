@@ -0,0 +1,233 @@
+"""Script directories prebuilt per set of active versions.
+
+If `scriptsets_dir` is configured, scripts of each set of active versions
+(e.g. "3.6+2.7") are published into a directory of their own, and the
+scripts directory in PATH is a link (a junction on Windows) to the set in
+use. Switching to a set used before only needs to bring it up to date, and
+repoint the link. Sets not used for `SET_MAX_AGE` are removed.
+"""
+
+import contextlib
+import os
+import shutil
+import stat
+import subprocess
+import time
+
+from . import configs, metadata, publishing
+
+
+SET_MAX_AGE = 30 * 24 * 60 * 60     # In seconds.
+
+EMPTY_SET_NAME = 'none'
+
+
+def is_enabled():
+    return configs.get_scriptsets_dir_path() is not None
+
+
+def get_set_name(names):
+    return '+'.join(names) or EMPTY_SET_NAME
+
+
+def get_set_path(names):
+    return configs.get_scriptsets_dir_path().joinpath(get_set_name(names))
+
+
+def get_set_manifest_path(names):
+    return configs.get_scriptsets_dir_path().joinpath(
+        '{}.json'.format(get_set_name(names)),
+    )
+
+
+def is_directory_link(path):
+    """Whether path is a symlink, or a junction.
+    """
+    try:
+        st = os.lstat(str(path))
+    except FileNotFoundError:
+        return False
+    attributes = getattr(st, 'st_file_attributes', 0)
+    return (
+        stat.S_ISLNK(st.st_mode) or
+        bool(attributes & stat.FILE_ATTRIBUTE_REPARSE_POINT)
+    )
+
+
+def make_directory_link(link, target):
+    if os.name != 'nt':
+        os.symlink(str(target), str(link), target_is_directory=True)
+        return
+    # Junctions, unlike symlinks, can be created without privileges.
+    try:
+        from _winapi import CreateJunction
+    except ImportError:     # A private API. Use the command if it's gone.
+        CreateJunction = None
+    if CreateJunction is not None:
+        CreateJunction(str(target), str(link))
+        return
+    result = subprocess.run(
+        ['cmd', '/c', 'mklink', '/J', str(link), str(target)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise OSError('failed to create junction {}: {}'.format(
+            link, result.stderr.decode(errors='replace').strip(),
+        ))
+
+
+def remove_directory_link(link):
+    if os.name == 'nt':
+        os.rmdir(str(link))     # Removes the junction, not the target.
+    else:
+        os.unlink(str(link))
+
+
+def point_link(link, target):
+    """Point the directory link to target, replacing it.
+
+    This is atomic on POSIX, but not on Windows, which can't rename over a
+    directory. The old link is moved aside there first, so the scripts
+    directory is missing for a moment, and moved back if the new link can't
+    be put in place.
+    """
+    temp = link.with_name('{}.{}.new'.format(link.name, os.getpid()))
+    make_directory_link(temp, target)
+    try:
+        os.replace(str(temp), str(link))
+    except OSError:
+        if not is_directory_link(link):
+            remove_directory_link(temp)
+            raise
+        old = link.with_name('{}.{}.old'.format(link.name, os.getpid()))
+        os.replace(str(link), str(old))
+        try:
+            os.replace(str(temp), str(link))
+        except OSError:
+            os.replace(str(old), str(link))
+            remove_directory_link(temp)
+            raise
+        remove_directory_link(old)
+
+
+def get_current_names():
+    try:
+        return metadata.get_active_python_versions()
+    except FileNotFoundError:
+        return []
+
+
+def is_migrated():
+    """Whether the scripts directory is a link, or yet to be made one.
+    """
+    link = configs.get_scripts_link_path()
+    return is_directory_link(link) or not link.is_dir()
+
+
+def merge_directory(source, target):
+    """Move entries in source into target, except those target already has.
+
+    Returns whether source is left empty.
+    """
+    empty = True
+    for entry in os.scandir(str(source)):
+        path = target.joinpath(entry.name)
+        if os.path.lexists(str(path)):
+            empty = False
+            continue
+        os.replace(entry.path, str(path))
+    return empty
+
+
+def migrate():
+    """Turn a scripts directory from before sets into a set.
+
+    Scripts in it belong to the versions active at the time, so it becomes
+    their set, with the manifest. If the set exists, scripts are merged into
+    it instead, and the directory is renamed aside if any are left.
+
+    Returns whether the directory is migrated. A directory can't be moved on
+    Windows while a script in it runs; the old layout is kept until the
+    next run then.
+    """
+    if is_migrated():
+        return True
+    link = configs.get_scripts_link_path()
+    names = get_current_names()
+    target = get_set_path(names)
+    try:
+        if not any(os.scandir(str(link))):
+            link.rmdir()
+            return True
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            os.replace(str(link), str(target))
+            with contextlib.suppress(FileNotFoundError):
+                os.replace(
+                    str(publishing.get_manifest_path()),
+                    str(get_set_manifest_path(names)),
+                )
+        elif merge_directory(link, target):
+            link.rmdir()
+        else:
+            os.replace(str(link), str(link.with_name('{}.{}.backup'.format(
+                link.name, int(time.time()),
+            ))))
+        make_directory_link(link, target)
+    except OSError:
+        return is_migrated()
+    return True
+
+
+def get_scripts_dir(names):
+    """Get the directory to publish scripts of versions into.
+    """
+    if not is_enabled() or not migrate():
+        return configs.get_scripts_dir_path()
+    path = get_set_path(names)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_manifest_path(names):
+    if not is_enabled() or not is_migrated():
+        return publishing.get_manifest_path()
+    return get_set_manifest_path(names)
+
+
+def switch(names):
+    """Point the scripts directory to the set of versions, and mark it used.
+
+    Returns False, doing nothing, if the scripts directory is yet to be
+    migrated.
+    """
+    if not is_enabled():
+        return True
+    if not is_migrated():
+        return False
+    link = configs.get_scripts_link_path()
+    target = get_set_path(names)
+    os.utime(str(target))
+    if not link.exists() or not os.path.samefile(str(link), str(target)):
+        point_link(link, target)
+    return True
+
+
+def collect_garbage(*, keep, max_age=SET_MAX_AGE):
+    """Remove sets (except keep) not used for max_age seconds.
+    """
+    if not is_enabled():
+        return
+    dirpath = configs.get_scriptsets_dir_path()
+    keep = get_set_name(keep)
+    now = time.time()
+    for entry in os.scandir(str(dirpath)):
+        if entry.name == keep or not entry.is_dir(follow_symlinks=False):
+            continue
+        if now - entry.stat(follow_symlinks=False).st_mtime < max_age:
+            continue
+        # Scripts in use can't be removed on Windows. Try again next time.
+        shutil.rmtree(entry.path, ignore_errors=True)
+        if not os.path.exists(entry.path):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink('{}.json'.format(entry.path))
@@ -0,0 +1,195 @@
+import concurrent.futures
+import threading
+
+import attr
+import requests
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Files smaller than twice this are not worth splitting.
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+# How often the main thread refreshes the progress bar and journal.
+POLL_INTERVAL = 0.2
+
+
+class SegmentInterrupted(requests.ConnectionError):
+    pass
+
+
+@attr.s
+class Segment:
+
+    start = attr.ib()
+    end = attr.ib()     # Inclusive, as in the Range header.
+    received = attr.ib(default=0)
+
+    @property
+    def size(self):
+        return self.end - self.start + 1
+
+    @property
+    def done(self):
+        return self.received >= self.size
+
+    def to_json(self):
+        return [self.start, self.end, self.received]
+
+    @classmethod
+    def from_json(cls, data):
+        start, end, received = data
+        return cls(start=start, end=end, received=received)
+
+
+@attr.s
+class RemoteFile:
+
+    url = attr.ib()
+    size = attr.ib()
+    etag = attr.ib()
+
+
+def probe(url, *, connections, session):
+    """Find out whether it is worth downloading the URL in segments.
+
+    Returns a `RemoteFile` if the server advertises range support and a
+    size large enough to split, None otherwise.
+    """
+    if connections < 2:
+        return None
+    response = session.head(url, allow_redirects=True)
+    response.raise_for_status()
+    return get_remote_file(response)
+
+
+def get_remote_file(response):
+    """Inspect a HEAD response to see if the file can be split.
+    """
+    total = response.headers.get('content-length', '')
+    if (response.headers.get('accept-ranges') != 'bytes' or
+            not total.isdigit() or
+            int(total) < MIN_SEGMENT_SIZE * 2):
+        return None
+    return RemoteFile(
+        # Use the final URL so each segment does not redirect again.
+        url=response.url, size=int(total), etag=response.headers.get('etag'),
+    )
+
+
+def split(size, connections, *, received=0):
+    """Split a file into segments, one per connection.
+
+    If `received` is given, the leading bytes are considered already
+    downloaded (e.g. by an earlier single-stream attempt), and recorded as a
+    finished segment.
+    """
+    segments = []
+    if received:
+        segments.append(Segment(start=0, end=received - 1, received=received))
+    remaining = size - received
+    count = max(1, min(connections, remaining // MIN_SEGMENT_SIZE))
+    step, extra = divmod(remaining, count)
+    start = received
+    for i in range(count):
+        end = start + step + (1 if i < extra else 0) - 1
+        segments.append(Segment(start=start, end=end))
+        start = end + 1
+    return segments
+
+
+def get_contiguous_size(segments):
+    """Count bytes received from the beginning of the file without gaps.
+    """
+    size = 0
+    for segment in sorted(segments, key=lambda s: s.start):
+        if segment.start != size:
+            break
+        size += segment.received
+        if not segment.done:
+            break
+    return size
+
+
+def fetch(url, path, segment, *, etag, report, stop, session):
+    headers = {'Range': 'bytes={}-{}'.format(
+        segment.start + segment.received, segment.end,
+    )}
+    if etag:
+        headers['If-Range'] = etag
+    response = session.get(url, headers=headers, stream=True)
+    response.raise_for_status()
+    if response.status_code != 206:
+        response.close()
+        raise SegmentInterrupted('range request not honoured')
+
+    # Unbuffered, so whatever counted as received is already on disk.
+    with path.open('r+b', buffering=0) as f:
+        f.seek(segment.start + segment.received)
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if stop.is_set():
+                response.close()
+                return
+            chunk = chunk[:segment.size - segment.received]
+            f.write(chunk)
+            segment.received += len(chunk)
+            report(len(chunk))
+            if segment.done:
+                break
+    response.close()
+    if not segment.done:
+        raise SegmentInterrupted('expect {} bytes, got {}'.format(
+            segment.size, segment.received,
+        ))
+
+
+def download(url, path, *, segments, etag, label, connections, checkpoint,
+             session, progress):
+    """Download segments of URL into a preallocated file at path.
+
+    Segments are fetched on a pool of at most `connections` threads. Each
+    writes into its own place in the file. The main thread aggregates
+    progress into a single progress bar (created by calling `progress`), and
+    calls `checkpoint` periodically so the caller can persist the segments'
+    progress.
+    """
+    lock = threading.Lock()
+    stop = threading.Event()
+    unreported = [0]
+
+    def report(n):
+        with lock:
+            unreported[0] += n
+
+    def flush(bar):
+        with lock:
+            delta, unreported[0] = unreported[0], 0
+        bar.update(delta)
+        checkpoint()
+
+    total = sum(s.size for s in segments)
+    received = sum(s.received for s in segments)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=connections)
+    with executor, progress(length=total, label=label) as bar:
+        bar.update(received)
+        futures = [
+            executor.submit(
+                fetch, url, path, segment,
+                etag=etag, report=report, stop=stop, session=session,
+            )
+            for segment in segments if not segment.done
+        ]
+        pending = set(futures)
+        try:
+            while pending:
+                _, pending = concurrent.futures.wait(
+                    pending, timeout=POLL_INTERVAL,
+                )
+                flush(bar)
+        finally:
+            stop.set()
+            flush(bar)
+
+    for future in futures:
+        future.result()     # Propagate the first failure, if any.
@@ -0,0 +1,190 @@
+"""Resolve version specifiers against the catalogue.
+
+A specifier is one of:
+
+* A version prefix, e.g. ``3`` or ``3.6``, or with a wildcard, ``3.6.*``.
+* ``latest``, matching everything.
+* Comma-separated comparisons, e.g. ``>=3.5,<3.7`` or ``~=3.6``.
+
+Each can be suffixed with ``-32`` to select a 32-bit version. The best match
+is the highest version matching the specifier.
+"""
+
+import bisect
+import re
+
+import attr
+
+from . import versions
+
+
+class InvalidSpecifier(ValueError):
+    pass
+
+
+CLAUSE_RE = re.compile(r'^(==|!=|<=|>=|<|>|~=)?\s*(\d+(?:\.\d+)*)(\.\*)?$')
+
+
+def pad(parts):
+    """Pad a version to three parts, so 3.6 compares as 3.6.0.
+    """
+    return tuple(parts) + (0,) * (3 - len(parts))
+
+
+def next_prefix(prefix):
+    """The smallest version after everything starting with prefix.
+    """
+    return prefix[:-1] + (prefix[-1] + 1,)
+
+
+@attr.s(slots=True, frozen=True)
+class Specifier:
+    """A version range, with optional exclusions.
+
+    Bounds are (version, inclusive) pairs, or None if unbounded. Exclusions
+    are version prefixes.
+    """
+    lower = attr.ib(default=None)
+    upper = attr.ib(default=None)
+    excluded = attr.ib(default=())
+    x86 = attr.ib(default=False)
+
+    def excludes(self, version_info):
+        return any(
+            version_info[:len(prefix)] == prefix for prefix in self.excluded
+        )
+
+
+def tighten_lower(current, bound):
+    if current is None or bound[0] > current[0]:
+        return bound
+    if bound[0] == current[0] and not bound[1]:
+        return bound
+    return current
+
+
+def tighten_upper(current, bound):
+    if current is None or bound[0] < current[0]:
+        return bound
+    if bound[0] == current[0] and not bound[1]:
+        return bound
+    return current
+
+
+def parse(value):
+    """Parse a specifier string into a `Specifier`.
+    """
+    value = value.strip()
+    x86 = value.endswith('-32')
+    if x86:
+        value = value[:-len('-32')]
+    if value == 'latest':
+        return Specifier(x86=x86)
+
+    lower = upper = None
+    excluded = []
+    for clause in value.split(','):
+        match = CLAUSE_RE.match(clause.strip())
+        if not match:
+            raise InvalidSpecifier(value)
+        op, version, wildcard = match.groups()
+        parts = tuple(int(p) for p in version.split('.'))
+        if op is None or (op == '==' and wildcard):
+            # A bare version, or a wildcard, matches by prefix.
+            lower = tighten_lower(lower, (parts, True))
+            upper = tighten_upper(upper, (next_prefix(parts), False))
+        elif op == '!=':
+            excluded.append(parts if wildcard else pad(parts))
+        elif wildcard:
+            raise InvalidSpecifier(value)   # E.g. ">=3.*".
+        elif op == '==':
+            lower = tighten_lower(lower, (pad(parts), True))
+            upper = tighten_upper(upper, (pad(parts), True))
+        elif op in ('>=', '>'):
+            lower = tighten_lower(lower, (pad(parts), op == '>='))
+        elif op in ('<=', '<'):
+            upper = tighten_upper(upper, (pad(parts), op == '<='))
+        else:   # Compatible release, e.g. ~=3.6 is >=3.6,==3.*.
+            if len(parts) < 2:
+                raise InvalidSpecifier(value)
+            lower = tighten_lower(lower, (pad(parts), True))
+            upper = tighten_upper(upper, (next_prefix(parts[:-1]), False))
+    return Specifier(
+        lower=lower, upper=upper, excluded=tuple(excluded), x86=x86,
+    )
+
+
+@attr.s(slots=True, frozen=True)
+class Candidate:
+
+    name = attr.ib()
+    version_info = attr.ib()
+    force_32 = attr.ib(default=False)
+
+
+class Resolver:
+    """Sorted index of candidates, answering best-match queries.
+
+    Candidates are kept in two lists sorted by version: those selected by
+    default on this host, and 32-bit ones (selected by a "-32" suffix). A
+    query bisects the list for the specifier's range, and walks down from
+    the top, so the best match is usually found in one step.
+    """
+    def __init__(self, default, x86):
+        self._lists = {}
+        for key, candidates in ((False, default), (True, x86)):
+            candidates = sorted(candidates, key=lambda c: c.version_info)
+            self._lists[key] = (
+                [c.version_info for c in candidates], candidates,
+            )
+
+    def get_range(self, specifier):
+        keys, _ = self._lists[specifier.x86]
+        start, stop = 0, len(keys)
+        if specifier.lower is not None:
+            version, inclusive = specifier.lower
+            find = bisect.bisect_left if inclusive else bisect.bisect_right
+            start = find(keys, version)
+        if specifier.upper is not None:
+            version, inclusive = specifier.upper
+            find = bisect.bisect_right if inclusive else bisect.bisect_left
+            stop = find(keys, version)
+        return start, stop
+
+    def iter_matches(self, specifier):
+        """Iterate through candidates matching specifier, best first.
+        """
+        _, candidates = self._lists[specifier.x86]
+        start, stop = self.get_range(specifier)
+        for i in range(stop - 1, start - 1, -1):
+            candidate = candidates[i]
+            if not specifier.excludes(candidate.version_info):
+                yield candidate
+
+    def best_match(self, specifier, *, predicate=None):
+        for candidate in self.iter_matches(specifier):
+            if predicate is None or predicate(candidate.name):
+                return candidate
+        return None
+
+
+def build_resolver(*, host_64bit):
+    """Build a resolver over the catalogue for a host of the architecture.
+    """
+    default = []
+    x86 = []
+    names = versions.get_version_names('amd64' if host_64bit else 'win32')
+    for name in names:
+        data = versions.load_version_data(name)
+        version_info = pad(data['version_info'])
+        is_32 = name.endswith('-32')
+        if is_32:
+            x86.append(Candidate(name=name, version_info=version_info))
+        elif data['type'] == versions.InstallerType.cpython_msi.value:
+            # Both architectures share a name. Select by forcing 32-bit.
+            x86.append(Candidate(
+                name=name, version_info=version_info, force_32=True,
+            ))
+        if not is_32 or not host_64bit:
+            default.append(Candidate(name=name, version_info=version_info))
+    return Resolver(default, x86)
@@ -0,0 +1,107 @@
+"""Persistent state of Python installations.
+
+Finding versions of installations may mean running them. They are kept here
+between runs, so read-only commands can answer with a few stats.
+"""
+
+import json
+
+import attr
+
+from . import configs, utils
+
+
+STATE_FORMAT = 2
+
+
+def get_python_stamp(path):
+    """Identify a Python executable's content by its size and mtime.
+    """
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+@attr.s
+class InstallationState:
+    """Version info of Python installations.
+
+    Version info of an executable is valid until it is modified, or
+    forgotten. The state is kept in memory if `path` is None.
+    """
+    path = attr.ib()
+    pythons = attr.ib(default=attr.Factory(dict))
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except (AttributeError, OSError, ValueError):
+            data = {}
+        if data.get('format') != STATE_FORMAT:
+            return cls(path=path)
+        return cls(path=path, pythons=data['pythons'])
+
+    def save(self):
+        if self.path is None:
+            return
+        utils.write_json_atomic(self.path, {
+            'format': STATE_FORMAT,
+            'pythons': self.pythons,
+        }, optional=True)
+
+    def get_version_info(self, python):
+        """Get recorded version info of a Python executable.
+
+        Returns None if the executable is not recorded, or modified since.
+        """
+        entry = self.pythons.get(str(python))
+        if entry is None:
+            return None
+        try:
+            stamp = get_python_stamp(python)
+        except OSError:
+            return None
+        if entry['stamp'] != stamp:
+            return None
+        return tuple(entry['version_info'])
+
+    def set_version_info(self, python, version_info):
+        self.set_version_infos({python: version_info})
+
+    def set_version_infos(self, version_infos):
+        """Record version info of Python executables, and save once.
+        """
+        for python, version_info in version_infos.items():
+            try:
+                stamp = get_python_stamp(python)
+            except OSError:
+                continue
+            self.pythons[str(python)] = {
+                'stamp': stamp,
+                'version_info': list(version_info),
+            }
+        self.save()
+
+    def forget_version_info(self, python):
+        """Drop recorded version info, e.g. after upgrading in place.
+
+        An upgrade may leave the size and mtime of the executable as they
+        were, so it can't be told from them.
+        """
+        if self.pythons.pop(str(python), None) is not None:
+            self.save()
+
+
+_state = None
+
+
+def get_state():
+    global _state
+    if _state is None:
+        try:
+            path = configs.get_cache_dir_path().joinpath('installations.json')
+        except (KeyError, OSError):
+            path = None
+        _state = InstallationState.load(path)
+    return _state
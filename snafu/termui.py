@@ -1,4 +1,5 @@
 import operator
+import threading
 
 import click
 
@@ -38,5 +39,89 @@ def progressbar(*, length, label, width=36):
     return click.progressbar(**kwargs)
 
 
+class _CombinedProgressTask:
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.parent._finish()
+
+    def update(self, n):
+        self.parent._update(n)
+
+
+class CombinedProgress:
+    """Aggregate progress of concurrent tasks into one progress bar.
+
+    An instance is a drop-in replacement of `progressbar()` for each task,
+    and can be called from any thread. The combined progress bar is only
+    drawn by `refresh()`, which should be called from the main thread (or
+    the event loop). The label counts tasks finished so far.
+    """
+    def __init__(self, *, label):
+        self.label = label
+        self._lock = threading.Lock()
+        self._length = 0
+        self._unreported = 0
+        self._tasks = 0
+        self._finished = 0
+        self._bar = None
+
+    def __call__(self, *, length, label):
+        with self._lock:
+            self._length += length
+            self._tasks += 1
+        return _CombinedProgressTask(self)
+
+    def _update(self, n):
+        with self._lock:
+            self._unreported += n
+
+    def _finish(self):
+        with self._lock:
+            self._finished += 1
+
+    def refresh(self):
+        with self._lock:
+            length = self._length
+            delta, self._unreported = self._unreported, 0
+            label = '{} ({}/{})'.format(
+                self.label, self._finished, self._tasks,
+            )
+        if self._bar is None:
+            if not length:
+                return
+            self._bar = progressbar(length=length, label=label)
+            self._bar.__enter__()
+        if self._bar.label:     # Not discarded for lack of space.
+            self._bar.label = label
+        self._bar.length = length   # More tasks may have started.
+        self._bar.update(delta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.refresh()
+        if self._bar is not None:
+            self._bar.__exit__(*args)
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'GiB'
+    if unit == 'B':
+        return '{} {}'.format(size, unit)
+    return '{:.1f} {}'.format(size, unit)
+
+
 def warn(message, category, filename, lineno, file=None, line=None):
     click.echo('WARNING: {}'.format(message), err=True)
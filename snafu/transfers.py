@@ -0,0 +1,601 @@
+"""Asyncio download engine.
+
+Transfers are made with a small HTTP/1.1 client on asyncio streams, so many
+downloads can run concurrently on one thread. Connections are kept alive and
+reused, and limited per host across all transfers of an engine.
+
+Requests configured to go through a proxy are handed to the requests-based
+implementation in `utils` on a worker thread instead, since the client here
+does not speak to proxies.
+"""
+
+import asyncio
+import contextlib
+import functools
+import os
+import ssl
+import time
+import urllib.parse
+
+from . import __version__, configs, network, segments, termui, utils
+
+
+MAX_REDIRECTS = 10
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# How often a combined progress view is redrawn.
+REFRESH_INTERVAL = 0.2
+
+
+class HTTPError(OSError):
+
+    def __init__(self, response):
+        super().__init__('{} {} for url: {}'.format(
+            response.status_code, response.reason, response.url,
+        ))
+        self.status_code = response.status_code
+
+
+def is_retriable(error):
+    """Whether a failed download should be tried again.
+    """
+    if isinstance(error, HTTPError):
+        return error.status_code in network.RETRY_STATUSES
+    return isinstance(error, utils.RETRIABLE_ERRORS)
+
+
+class IncompleteTransfer(ConnectionError):
+    pass
+
+
+class TooManyRedirects(OSError):
+    pass
+
+
+class Connection:
+
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class Response:
+    """A response whose body is yet to be read from the connection.
+
+    The connection is returned to the client when the body is exhausted, or
+    closed if the response is released before that.
+    """
+    def __init__(self, client, connection, *, method, url, version,
+                 status_code, reason, headers):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers      # Keys are lower-cased.
+        self._client = client
+        self._connection = connection
+        self._released = False
+
+        connection_header = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            self._keep_alive = connection_header != 'close'
+        else:
+            self._keep_alive = connection_header == 'keep-alive'
+
+        self._chunked = False
+        self._remaining = None      # Read until EOF.
+        if (method == 'HEAD' or status_code in (204, 304) or
+                100 <= status_code < 200):
+            self._remaining = 0
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self._chunked = True
+        elif headers.get('content-length', '').isdigit():
+            self._remaining = int(headers['content-length'])
+        else:
+            self._keep_alive = False
+        self._finished = (self._remaining == 0)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self.close()
+            raise HTTPError(self)
+
+    async def iter_chunks(self, size=utils.CHUNK_SIZE):
+        try:
+            if self._chunked:
+                chunks = self._iter_chunked()
+            elif self._remaining is None:
+                chunks = self._iter_until_eof(size)
+            else:
+                chunks = self._iter_sized(size)
+            async for chunk in chunks:
+                network.get_statistics().add_bytes(len(chunk))
+                yield chunk
+            self._finished = True
+        finally:
+            self.release()
+
+    async def _iter_sized(self, size):
+        while self._remaining:
+            chunk = await self._client.read(
+                self._connection.reader.read(min(size, self._remaining)),
+            )
+            if not chunk:
+                raise IncompleteTransfer('{} bytes missing from {}'.format(
+                    self._remaining, self.url,
+                ))
+            self._remaining -= len(chunk)
+            yield chunk
+
+    async def _iter_until_eof(self, size):
+        while True:
+            chunk = await self._client.read(
+                self._connection.reader.read(size),
+            )
+            if not chunk:
+                return
+            yield chunk
+
+    async def _iter_chunked(self):
+        reader = self._connection.reader
+        while True:
+            line = await self._client.read(reader.readline())
+            try:
+                size = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise IncompleteTransfer('malformed chunk from {}'.format(
+                    self.url,
+                ))
+            if size == 0:
+                break
+            yield await self._client.read(reader.readexactly(size))
+            await self._client.read(reader.readexactly(2))
+        # Discard trailers.
+        while (await self._client.read(reader.readline())).strip():
+            pass
+
+    async def read(self):
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._client.release(
+            self._connection, reusable=(self._finished and self._keep_alive),
+        )
+
+    def close(self):
+        self._finished = False
+        self.release()
+
+
+def get_ssl_context():
+    """Trust what requests trusts.
+
+    Like requests, a CA bundle (a file or a directory) can be set in the
+    REQUESTS_CA_BUNDLE or CURL_CA_BUNDLE environment variable. Otherwise
+    certifi's bundle is used, or the system's if it is not installed.
+    """
+    bundle = (
+        os.environ.get('REQUESTS_CA_BUNDLE') or
+        os.environ.get('CURL_CA_BUNDLE')
+    )
+    if bundle:
+        if os.path.isdir(bundle):
+            return ssl.create_default_context(capath=bundle)
+        return ssl.create_default_context(cafile=bundle)
+    try:
+        import certifi
+    except ImportError:
+        cafile = None
+    else:
+        cafile = certifi.where()
+    return ssl.create_default_context(cafile=cafile)
+
+
+class Client:
+    """HTTP/1.1 client with keep-alive connections, limited per host.
+
+    A connection is held from when a request is sent until its response is
+    released, so at most `per_host` requests to a host are in flight at once.
+    Further requests wait for a connection to be freed.
+    """
+    def __init__(self, *, per_host, connect_timeout, read_timeout,
+                 statistics):
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.statistics = statistics
+        self._idle = {}
+        self._limits = {}
+        self._ssl_context = None
+
+    async def read(self, awaitable, timeout=None):
+        """Await a read from a connection, translating errors to OSError.
+        """
+        try:
+            return await asyncio.wait_for(
+                awaitable, timeout or self.read_timeout,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError('timed out reading response')
+        except asyncio.IncompleteReadError as e:
+            raise IncompleteTransfer(str(e))
+
+    def _get_limit(self, key):
+        try:
+            return self._limits[key]
+        except KeyError:
+            limit = self._limits[key] = asyncio.Semaphore(self.per_host)
+            return limit
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = get_ssl_context()
+            context = self._ssl_context
+        reader, writer = await self.read(asyncio.open_connection(
+            host, port, ssl=context,
+            server_hostname=(host if context else None),
+        ), timeout=self.connect_timeout)
+        return Connection(key, reader, writer)
+
+    def release(self, connection, *, reusable):
+        if reusable:
+            self._idle.setdefault(connection.key, []).append(connection)
+        else:
+            connection.close()
+        self._get_limit(connection.key).release()
+
+    def close(self):
+        for connections in self._idle.values():
+            for connection in connections:
+                connection.close()
+        self._idle.clear()
+
+    async def request(self, method, url, *, headers=None):
+        """Send a request, following redirects.
+
+        The response's body is not read. The caller must either exhaust it
+        with `iter_chunks()` (or `read()`), or `release()` the response.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._send(method, url, headers or {})
+            location = response.headers.get('location')
+            if response.status_code not in REDIRECT_STATUSES or not location:
+                return response
+            await response.read()   # So the connection can be reused.
+            url = urllib.parse.urljoin(url, location)
+            if response.status_code == 303:
+                method = 'GET'
+        raise TooManyRedirects('exceeded {} redirects'.format(MAX_REDIRECTS))
+
+    async def _send(self, method, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('unsupported URL {!r}'.format(url))
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target = '{}?{}'.format(target, parts.query)
+        lines = [
+            '{} {} HTTP/1.1'.format(method, target),
+            'Host: {}'.format(parts.netloc.rpartition('@')[-1]),
+            'User-Agent: snafu/{}'.format(__version__),
+            'Accept: */*',
+            'Accept-Encoding: identity',
+        ]
+        lines.extend('{}: {}'.format(k, v) for k, v in headers.items())
+        data = '\r\n'.join(lines + ['', '']).encode('latin-1')
+
+        limit = self._get_limit(key)
+        await limit.acquire()
+        connection = None
+        try:
+            while True:
+                idle = self._idle.get(key)
+                reused = bool(idle)
+                connection = idle.pop() if reused else await self._connect(key)
+                start = time.perf_counter()
+                try:
+                    connection.writer.write(data)
+                    await self.read(connection.writer.drain())
+                    status_line = await self.read(
+                        connection.reader.readline(),
+                    )
+                except ConnectionError:
+                    if not reused:
+                        raise
+                    status_line = b''
+                if status_line:
+                    break
+                connection.close()
+                connection = None
+                if not reused:
+                    raise IncompleteTransfer('no response from {}'.format(
+                        parts.netloc,
+                    ))
+                # The server closed the idle connection. Try another one.
+            headers = {}
+            while True:
+                line = await self.read(connection.reader.readline())
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                name = name.strip().lower()
+                value = value.strip()
+                if name in headers:
+                    value = '{}, {}'.format(headers[name], value)
+                headers[name] = value
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            limit.release()
+            raise
+
+        self.statistics.add_latency(time.perf_counter() - start)
+        self.statistics.add_connection(reused=reused)
+        version, status_code, reason = (
+            status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + ['']
+        )[:3]
+        return Response(
+            self, connection, method=method, url=url, version=version,
+            status_code=int(status_code), reason=reason, headers=headers,
+        )
+
+
+async def refresh_periodically(progress):
+    while True:
+        progress.refresh()
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+class Engine:
+    """Run downloads concurrently on the event loop.
+
+    Use as an async context manager, so connections are closed when done.
+    """
+    def __init__(self, *, per_host=None):
+        settings = configs.get_http_settings()
+        self.client = Client(
+            per_host=per_host or settings['per_host_connections'],
+            connect_timeout=settings['connect_timeout'],
+            read_timeout=settings['read_timeout'],
+            statistics=network.get_statistics(),
+        )
+        self.retries = settings['retries']
+        self.backoff = settings['backoff']
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.client.close()
+
+    async def gather(self, awaitables, *, progress=None):
+        """Run awaitables concurrently, returning results or exceptions.
+
+        If `progress` is a `termui.CombinedProgress`, it is redrawn
+        periodically until all are done.
+        """
+        if progress is None:
+            return await asyncio.gather(*awaitables, return_exceptions=True)
+        refresher = asyncio.ensure_future(refresh_periodically(progress))
+        try:
+            with progress:
+                return await asyncio.gather(
+                    *awaitables, return_exceptions=True,
+                )
+        finally:
+            refresher.cancel()
+
+    async def download_file(self, url, *, filename=None, container=None,
+                            check=None, partial_dir=None,
+                            retries=None, connections=1, progress=None):
+        """Download a file from URL into container.
+
+        The arguments are the same as `utils.download_file()`, except retries
+        default to the HTTP settings. Retries back off exponentially, like
+        those of `network.Session`, and are also made on 429 and 5xx.
+        """
+        if retries is None:
+            retries = self.retries
+        loop = asyncio.get_event_loop()
+        if utils.is_proxied(url):
+            return await loop.run_in_executor(None, functools.partial(
+                utils.download_with_session, url,
+                session=network.get_session(),
+                filename=filename, container=container, check=check,
+                partial_dir=partial_dir, retries=retries,
+                connections=connections, progress=progress,
+            ))
+        if progress is None:
+            progress = termui.progressbar
+        filename, path, partial, journal = utils.prepare_download(
+            url, filename=filename, container=container,
+            partial_dir=partial_dir,
+        )
+
+        local_path = utils.get_local_path(url)
+        attempt = 0
+        while True:
+            try:
+                if local_path is not None:
+                    journal.remove()    # Nothing to resume for local files.
+                    verifier = await loop.run_in_executor(
+                        None, functools.partial(
+                            utils.copy_local, local_path, label=filename,
+                            partial=partial, check=check, progress=progress,
+                        ),
+                    )
+                    break
+                remote = await self.probe(url, connections=connections)
+                if remote is None:
+                    verifier = await self._download_partial(
+                        url, label=filename, partial=partial,
+                        journal=journal, check=check, progress=progress,
+                    )
+                else:
+                    verifier = await self._download_segmented(
+                        remote, label=filename, partial=partial,
+                        journal=journal, check=check,
+                        connections=connections, progress=progress,
+                    )
+            except (HTTPError,) + utils.RETRIABLE_ERRORS as e:
+                if attempt >= retries or not is_retriable(e):
+                    raise
+                attempt += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            break
+
+        return utils.finish_download(
+            path=path, partial=partial, journal=journal, verifier=verifier,
+        )
+
+    async def probe(self, url, *, connections):
+        if connections < 2:
+            return None
+        response = await self.client.request('HEAD', url)
+        response.raise_for_status()
+        response.release()
+        return segments.get_remote_file(response)
+
+    async def _download_partial(self, url, *, label, partial, journal, check,
+                                progress):
+        offset, headers = utils.get_range_headers(journal, partial)
+        response = await self.client.request('GET', url, headers=headers)
+        if response.status_code == 416:     # Not satisfiable. Start over.
+            response.close()
+            response = await self.client.request('GET', url)
+        response.raise_for_status()
+
+        with contextlib.ExitStack() as stack:
+            stack.callback(response.release)
+            accepted = utils.accept_response(
+                response, offset=offset, journal=journal,
+            )
+            if accepted is None:
+                response.close()
+                return await self._download_partial(
+                    url, label=label, partial=partial, journal=journal,
+                    check=check, progress=progress,
+                )
+            offset, size = accepted
+
+            verifier = utils.get_verifier(check, partial, offset)
+            writer = stack.enter_context(utils.PartialWriter(
+                partial, offset=offset, journal=journal, verifier=verifier,
+            ))
+            bar = None
+            if size is not None:
+                bar = stack.enter_context(progress(length=size, label=label))
+                bar.update(offset)
+            async for chunk in response.iter_chunks():
+                writer.write(chunk)
+                if bar is not None:
+                    bar.update(len(chunk))
+        utils.check_received(journal, size)
+        return verifier
+
+    async def _fetch_segment(self, url, partial, segment, *, etag, bar):
+        start = segment.start + segment.received
+        headers = {'Range': 'bytes={}-{}'.format(start, segment.end)}
+        if etag:
+            headers['If-Range'] = etag
+        response = await self.client.request('GET', url, headers=headers)
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            raise segments.SegmentInterrupted('range not honoured')
+        match = utils.CONTENT_RANGE_RE.match(
+            response.headers.get('content-range', ''),
+        )
+        if not match or int(match.group(1)) != start:
+            response.close()
+            raise segments.SegmentInterrupted('unexpected range in response')
+        try:
+            with partial.open('r+b', buffering=0) as f:
+                f.seek(start)
+                async for chunk in response.iter_chunks():
+                    chunk = chunk[:segment.size - segment.received]
+                    f.write(chunk)
+                    segment.received += len(chunk)
+                    bar.update(len(chunk))
+        finally:
+            response.release()
+        if not segment.done:
+            raise segments.SegmentInterrupted('segment ended early')
+
+    async def _download_segmented(self, remote, *, label, partial, journal,
+                                  check, connections, progress):
+        utils.prepare_segments(
+            remote, partial=partial, journal=journal, connections=connections,
+        )
+        pending = [s for s in journal.segments if not s.done]
+        # The client's per-host limit may allow more; use what we're told.
+        limit = asyncio.Semaphore(connections)
+
+        async def fetch(segment):
+            async with limit:
+                await self._fetch_segment(
+                    remote.url, partial, segment, etag=remote.etag, bar=bar,
+                )
+
+        async def checkpoint_periodically():
+            while True:
+                await asyncio.sleep(segments.POLL_INTERVAL)
+                checkpoint()
+
+        def checkpoint():
+            journal.received = sum(s.received for s in journal.segments)
+            journal.save()
+
+        with progress(length=remote.size, label=label) as bar:
+            bar.update(sum(s.received for s in journal.segments))
+            checkpointer = asyncio.ensure_future(checkpoint_periodically())
+            try:
+                results = await asyncio.gather(
+                    *(fetch(s) for s in pending), return_exceptions=True,
+                )
+            finally:
+                checkpointer.cancel()
+                checkpoint()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        # Segments arrive out of order, so the file is hashed after the fact.
+        verifier = check() if callable(check) else None
+        if verifier is not None:
+            utils.feed_file(verifier, partial, remote.size)
+        return verifier
+
+
+def run(coroutine):
+    """Run a coroutine on a new event loop, blocking until it is done.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def download_file(url, **kwargs):
+    """Synchronous interface to `Engine.download_file()`.
+    """
+    async def download():
+        async with Engine() as engine:
+            return await engine.download_file(url, **kwargs)
+
+    return run(download())
@@ -1,45 +1,492 @@
 import atexit
+import contextlib
+import json
+import os
 import pathlib
+import re
 import shutil
 import tempfile
+import urllib.parse
+import urllib.request
 
+import attr
 import requests
 
-from . import termui
+from . import network, segments, termui
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Record progress into the journal every this many bytes.
+JOURNAL_INTERVAL = 1024 * 1024
+
+# How many times to resume an interrupted download before giving up.
+DOWNLOAD_RETRIES = 3
+
+RETRIABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    segments.SegmentInterrupted,
+    ConnectionError,    # Raised by the asyncio engine, as are the following.
+    TimeoutError,
+)
+
+
+def write_json_atomic(path, data, *, optional=False, **kwargs):
+    """Write data as JSON into path, replacing it atomically.
+
+    The temporary file is named after the process, so processes writing the
+    same file don't clash. If optional, the file only saves work that can be
+    done again (e.g. a cache), and failing to write it is ignored.
+    """
+    temp_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    try:
+        with temp_path.open('w') as f:
+            json.dump(data, f, **kwargs)
+            f.write('\n')
+        os.replace(str(temp_path), str(path))
+    except OSError:
+        with contextlib.suppress(OSError):
+            temp_path.unlink()
+        if not optional:
+            raise
 
 
 class DownloadIntegrityError(ValueError):
     pass
 
 
-def download_file(url, *, filename=None, container=None, check=None):
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+class DownloadInterrupted(requests.ConnectionError):
+    pass
 
-    if not filename:
-        filename = url.rsplit('/', 1)[-1]
-    total = response.headers.get('content-length', '')
-    chunks = []
 
-    if total.isdigit():
-        with termui.progressbar(length=int(total), label=filename) as b:
-            for chunk in response.iter_content(chunk_size=4096):
-                chunks.append(chunk)
-                b.update(len(chunk))
-    else:
-        chunks.append(response.content)
+@attr.s
+class DownloadJournal:
+    """Progress record of a partially downloaded file.
+
+    This is saved next to the partial file, so an interrupted download can
+    be resumed later, even in another process.
+    """
+    path = attr.ib()
+    url = attr.ib()
+    size = attr.ib(default=None)
+    etag = attr.ib(default=None)
+    received = attr.ib(default=0)
+    segments = attr.ib(default=None)
 
-    data = b''.join(chunks)
-    if callable(check):
+    @classmethod
+    def load(cls, path, url):
         try:
-            check(data)
-        except AssertionError as e:
-            raise DownloadIntegrityError(str(e))
+            with path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('url') != url:
+            return None
+        segment_data = data.get('segments')
+        if segment_data is not None:
+            segment_data = [
+                segments.Segment.from_json(d) for d in segment_data
+            ]
+        return cls(
+            path=path, url=url,
+            size=data.get('size'), etag=data.get('etag'),
+            received=int(data.get('received', 0)),
+            segments=segment_data,
+        )
+
+    def save(self):
+        write_json_atomic(self.path, {
+            'url': self.url,
+            'size': self.size,
+            'etag': self.etag,
+            'received': self.received,
+            'segments': (
+                None if self.segments is None
+                else [s.to_json() for s in self.segments]
+            ),
+        })
+
+    def remove(self):
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+def get_resumed_offset(response, offset):
+    """Check whether the response continues from offset.
 
+    Returns the offset if the server honoured our range request, 0 if it sent
+    the whole file instead (e.g. it does not support ranges).
+    """
+    if response.status_code != 206:
+        return 0
+    match = CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+    if not match or int(match.group(1)) != offset:
+        raise DownloadInterrupted('unexpected range in response')
+    return offset
+
+
+def get_response_size(response, offset):
+    total = response.headers.get('content-length', '')
+    if not total.isdigit():
+        return None
+    return offset + int(total)
+
+
+def feed_file(verifier, path, size):
+    with path.open('rb') as f:
+        while size > 0:
+            chunk = f.read(min(CHUNK_SIZE, size))
+            if not chunk:
+                break
+            verifier.update(chunk)
+            size -= len(chunk)
+
+
+def get_local_path(url):
+    """Convert a file:// URL into a path, or None if it is not one.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme != 'file':
+        return None
+    path = urllib.request.url2pathname(parsed.path)
+    if parsed.netloc and parsed.netloc != 'localhost':
+        path = '\\\\{}{}'.format(parsed.netloc, path)    # UNC share.
+    return pathlib.Path(path)
+
+
+def is_proxied(url):
+    """Check whether requests to URL are configured to go through a proxy.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in urllib.request.getproxies():
+        return False
+    return not urllib.request.proxy_bypass(parsed.hostname or '')
+
+
+def prepare_download(url, *, filename, container, partial_dir):
+    """Work out where a download goes.
+
+    Returns (filename, path, partial path, journal).
+    """
+    if not filename:
+        filename = url.rsplit('/', 1)[-1]
     if container is None:
         container = pathlib.Path(tempfile.mkdtemp())
         atexit.register(shutil.rmtree, str(container), ignore_errors=True)
+    if partial_dir is None:
+        partial_dir = container
     path = container.joinpath(filename)
-    with path.open('wb') as f:
-        f.write(data)
+    partial = partial_dir.joinpath('{}.part'.format(filename))
+    journal_path = partial_dir.joinpath('{}.part.json'.format(filename))
+
+    journal = DownloadJournal.load(journal_path, url)
+    if journal is None:
+        journal = DownloadJournal(path=journal_path, url=url)
+    return filename, path, partial, journal
+
+
+def finish_download(*, path, partial, journal, verifier):
+    # The file is complete; the journal is not needed anymore whatever the
+    # verification result is, since the data is not going to change.
+    journal.remove()
+    if verifier is not None:
+        try:
+            verifier.verify()
+        except AssertionError as e:
+            partial.unlink()
+            raise DownloadIntegrityError(str(e))
+    shutil.move(str(partial), str(path))
+    completed = getattr(verifier, 'completed', None)
+    if completed is not None:
+        completed(path)
     return path
+
+
+def get_range_headers(journal, partial):
+    """Build headers to resume a single-stream download.
+
+    Returns (offset, headers).
+    """
+    headers = {}
+    offset = 0
+    if journal.segments is not None:     # Left by a segmented download.
+        journal.received = segments.get_contiguous_size(journal.segments)
+    if journal.received and partial.exists():
+        offset = min(journal.received, partial.stat().st_size)
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        if journal.etag:
+            headers['If-Range'] = journal.etag
+    return offset, headers
+
+
+def accept_response(response, *, offset, journal):
+    """Record a single-stream download's response into the journal.
+
+    Returns (offset, size) the response continues from, or None if the remote
+    file changed since the last attempt, and the download needs to start over.
+    """
+    offset = get_resumed_offset(response, offset)
+    size = get_response_size(response, offset)
+    etag = response.headers.get('etag')
+    if offset and (journal.size != size or journal.etag != etag):
+        journal.received = 0
+        return None
+    journal.size = size
+    journal.etag = etag
+    journal.received = offset
+    journal.segments = None
+    return offset, size
+
+
+def get_verifier(check, partial, offset):
+    # Bring the verifier up to date with what we already have on disk, so
+    # the hash is always computed against the whole file.
+    verifier = check() if callable(check) else None
+    if verifier is not None and offset:
+        feed_file(verifier, partial, offset)
+    return verifier
+
+
+def check_received(journal, size):
+    if size is not None and journal.received != size:
+        raise DownloadInterrupted('expect {} bytes, got {}'.format(
+            size, journal.received,
+        ))
+
+
+class PartialWriter:
+    """Write a single-stream download into its partial file.
+
+    Each chunk is fed to the verifier as it is written, and the progress is
+    recorded into the journal every `JOURNAL_INTERVAL` bytes.
+    """
+    def __init__(self, partial, *, offset, journal, verifier):
+        self.journal = journal
+        self.verifier = verifier
+        self._file = partial.open('r+b' if offset else 'wb')
+        self._file.seek(offset)
+        self._file.truncate()
+        self._unjournaled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        if self.verifier is not None:
+            self.verifier.update(chunk)
+        self.journal.received += len(chunk)
+        self._unjournaled += len(chunk)
+        if self._unjournaled >= JOURNAL_INTERVAL:
+            self._file.flush()
+            self.journal.save()
+            self._unjournaled = 0
+
+    def close(self):
+        self._file.close()
+        self.journal.save()
+
+
+def iter_response_chunks(response, *, label, offset, size, progress):
+    if size is None:
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+        return
+    with progress(length=size, label=label) as b:
+        b.update(offset)
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            yield chunk
+            b.update(len(chunk))
+
+
+def download_partial(url, *, label, partial, journal, check,
+                     session, progress):
+    offset, headers = get_range_headers(journal, partial)
+    response = session.get(url, headers=headers, stream=True)
+    if response.status_code == 416:     # Range not satisfiable. Start over.
+        response.close()
+        response = session.get(url, stream=True)
+    response.raise_for_status()
+
+    accepted = accept_response(response, offset=offset, journal=journal)
+    if accepted is None:
+        response.close()
+        return download_partial(
+            url, label=label, partial=partial, journal=journal, check=check,
+            session=session, progress=progress,
+        )
+    offset, size = accepted
+
+    verifier = get_verifier(check, partial, offset)
+    writer = PartialWriter(
+        partial, offset=offset, journal=journal, verifier=verifier,
+    )
+    with writer:
+        chunks = iter_response_chunks(
+            response, label=label, offset=offset, size=size,
+            progress=progress,
+        )
+        for chunk in chunks:
+            writer.write(chunk)
+    check_received(journal, size)
+    return verifier
+
+
+def copy_local(source, *, label, partial, check, progress):
+    verifier = check() if callable(check) else None
+    with source.open('rb') as src, partial.open('wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        with progress(length=size, label=label) as b:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+                if verifier is not None:
+                    verifier.update(chunk)
+                b.update(len(chunk))
+    return verifier
+
+
+def prepare_segments(remote, *, partial, journal, connections):
+    """Preallocate the partial file, and plan segments in the journal.
+
+    Segments from an earlier attempt are kept if the remote file did not
+    change, so the download continues where it was left.
+    """
+    if (journal.segments is not None and journal.size == remote.size and
+            journal.etag == remote.etag and partial.exists()):
+        return
+    # Keep bytes from a previous single-stream attempt if possible.
+    received = 0
+    if (journal.segments is None and journal.size == remote.size and
+            journal.etag == remote.etag and partial.exists()):
+        received = min(journal.received, partial.stat().st_size)
+    with partial.open('r+b' if received else 'wb') as f:
+        f.truncate(remote.size)
+    journal.size = remote.size
+    journal.etag = remote.etag
+    journal.segments = segments.split(
+        remote.size, connections, received=received,
+    )
+
+
+def download_segmented(remote, *, label, partial, journal, check,
+                       connections, session, progress):
+    prepare_segments(
+        remote, partial=partial, journal=journal, connections=connections,
+    )
+
+    def checkpoint():
+        journal.received = sum(s.received for s in journal.segments)
+        journal.save()
+
+    segments.download(
+        remote.url, partial,
+        segments=journal.segments, etag=remote.etag, label=label,
+        connections=connections, checkpoint=checkpoint,
+        session=session, progress=progress,
+    )
+
+    # Segments arrive out of order, so the file is hashed after the fact.
+    verifier = check() if callable(check) else None
+    if verifier is not None:
+        feed_file(verifier, partial, remote.size)
+    return verifier
+
+
+def download_with_session(url, *, session, filename=None, container=None,
+                          check=None, partial_dir=None,
+                          retries=DOWNLOAD_RETRIES, connections=1,
+                          progress=None):
+    """Download a file with a requests session, blocking until it is done.
+
+    See `download_file()` for the arguments.
+    """
+    if progress is None:
+        progress = termui.progressbar
+    filename, path, partial, journal = prepare_download(
+        url, filename=filename, container=container, partial_dir=partial_dir,
+    )
+
+    local_path = get_local_path(url)
+    while True:
+        try:
+            if local_path is not None:
+                journal.remove()    # Nothing to resume for local files.
+                verifier = copy_local(
+                    local_path, label=filename, partial=partial, check=check,
+                    progress=progress,
+                )
+                break
+            remote = segments.probe(
+                url, connections=connections, session=session,
+            )
+            if remote is None:
+                verifier = download_partial(
+                    url, label=filename,
+                    partial=partial, journal=journal, check=check,
+                    session=session, progress=progress,
+                )
+            else:
+                verifier = download_segmented(
+                    remote, label=filename, partial=partial, journal=journal,
+                    check=check, connections=connections,
+                    session=session, progress=progress,
+                )
+        except RETRIABLE_ERRORS:
+            if retries <= 0:
+                raise
+            retries -= 1
+            continue
+        break
+
+    return finish_download(
+        path=path, partial=partial, journal=journal, verifier=verifier,
+    )
+
+
+def download_file(url, *, session=None, **kwargs):
+    """Download a file from URL into container.
+
+    Keyword arguments:
+
+    * `filename` and `container` specify the target path. The file name
+      defaults to the last part of the URL, and the container a temporary
+      directory.
+    * `check` is a callable returning a fresh verifier, i.e. an object with
+      `update(chunk)` and `verify()` methods. Each chunk is written to disk
+      and fed to the verifier as it arrives, so the file is never held in
+      memory. If the verifier has a `completed(path)` method, it is called
+      with the final path after verification.
+    * The data is written into a partial file in `partial_dir` (defaults to
+      container), alongside a journal recording the progress. An interrupted
+      download is resumed with a range request, either immediately (up to
+      `retries` times), or the next time the same URL is downloaded into the
+      same partial directory. The partial file is only moved to the target
+      path after it is verified.
+    * If `connections` is larger than 1, and the server supports ranges, the
+      file is split into segments, downloaded with up to this many
+      connections in parallel.
+    * `progress` is a callable with the signature of `termui.progressbar()`
+      to report progress to; a progress bar is displayed by default.
+
+    A file:// URL is copied from the local file system (or a network share)
+    instead.
+
+    The transfer runs on the asyncio engine in `snafu.transfers`. If
+    `session` is given, or the URL is configured to go through a proxy, it
+    is made with a requests session instead (the shared one from
+    `network.get_session()` by default).
+    """
+    if session is None and not is_proxied(url):
+        from . import transfers     # Avoid circular import.
+        return transfers.download_file(url, **kwargs)
+    if session is None:
+        session = network.get_session()
+    return download_with_session(url, session=session, **kwargs)
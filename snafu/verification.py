@@ -0,0 +1,220 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+
+import attr
+
+from . import configs, utils
+
+
+# Digests computed whenever a file is hashed, so any of them can be checked
+# later without reading the file again.
+ALGORITHMS = ('md5', 'sha256')
+
+# Hashing reads files in blocks this large.
+BLOCK_SIZE = 1024 * 1024
+
+
+@attr.s
+class HashVerifier:
+    """Hash data as it arrives, and compare the digest when asked to verify.
+    """
+    algorithm = attr.ib()
+    expected = attr.ib()
+
+    def __attrs_post_init__(self):
+        self._hash = hashlib.new(self.algorithm)
+
+    def update(self, chunk):
+        self._hash.update(chunk)
+
+    def verify(self):
+        checksum = self._hash.hexdigest()
+        assert checksum == self.expected, \
+            'expect checksum {}, got {}'.format(self.expected, checksum)
+
+
+@attr.s
+class ChecksumVerifier:
+    """Compute all known digests as data arrives, and compare expected ones.
+
+    `expected` maps algorithm names to hex digests. When the download is
+    complete, the digests are memoized against the file, so it is not hashed
+    again to verify it later.
+    """
+    expected = attr.ib()
+
+    def __attrs_post_init__(self):
+        self._hashes = {a: hashlib.new(a) for a in ALGORITHMS}
+
+    @property
+    def digests(self):
+        return {a: h.hexdigest() for a, h in self._hashes.items()}
+
+    def update(self, chunk):
+        for h in self._hashes.values():
+            h.update(chunk)
+
+    def verify(self):
+        digests = self.digests
+        for algorithm, expected in sorted(self.expected.items()):
+            assert digests[algorithm] == expected, \
+                'expect {} checksum {}, got {}'.format(
+                    algorithm, expected, digests[algorithm],
+                )
+
+    def completed(self, path):
+        get_memo().record(path, self.digests)
+
+
+@attr.s
+class SizeVerifier:
+    """Count bytes as they arrive, and compare the total when asked to verify.
+    """
+    expected = attr.ib(convert=int)
+    received = attr.ib(default=0, init=False)
+
+    def update(self, chunk):
+        self.received += len(chunk)
+
+    def verify(self):
+        assert self.received == self.expected, \
+            'expect {} bytes, got {}'.format(self.expected, self.received)
+
+
+def hash_file(path):
+    """Compute all known digests of a file in one pass.
+    """
+    hashes = {a: hashlib.new(a) for a in ALGORITHMS}
+    buf = bytearray(BLOCK_SIZE)
+    view = memoryview(buf)
+    with path.open('rb', buffering=0) as f:
+        for n in iter(lambda: f.readinto(buf), 0):
+            for h in hashes.values():
+                h.update(view[:n])
+    return {a: h.hexdigest() for a, h in hashes.items()}
+
+
+def get_stat_key(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+@attr.s
+class VerificationMemo:
+    """Digests of files hashed before, keyed by their size, mtime, and inode.
+
+    A file not modified since it was last hashed can be verified with a
+    stat. New records are kept in memory until `save()`, which merges them
+    into the file, and drops entries of files that were deleted or changed
+    since. The memo is kept in memory only if `path` is None.
+    """
+    path = attr.ib()
+    _entries = attr.ib(default=None, init=False)
+    _recorded = attr.ib(default=attr.Factory(dict), init=False, repr=False)
+    _lock = attr.ib(
+        default=attr.Factory(threading.Lock),
+        init=False, repr=False, cmp=False,
+    )
+
+    def _read(self):
+        try:
+            with self.path.open() as f:
+                return json.load(f)
+        except (AttributeError, OSError, ValueError):
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def save(self):
+        """Write new records into the file, dropping stale entries.
+
+        The file is read again first, so records saved by other processes in
+        the meantime are kept.
+        """
+        with self._lock:
+            if self.path is None or not self._recorded:
+                return
+            entries = self._read()
+            entries.update(self._recorded)
+            for key, entry in list(entries.items()):
+                try:
+                    stat = os.stat(key)
+                except OSError:
+                    stale = True
+                else:
+                    stale = entry.get('stat') != get_stat_key(stat)
+                if stale:
+                    del entries[key]
+            utils.write_json_atomic(self.path, entries, optional=True)
+            self._entries = entries
+            self._recorded.clear()
+
+    def lookup(self, path, stat):
+        with self._lock:
+            entry = self._load().get(str(path.resolve()))
+        if entry is None or entry['stat'] != get_stat_key(stat):
+            return None
+        return entry['digests']
+
+    def record(self, path, digests, *, stat=None):
+        if stat is None:
+            stat = path.stat()
+        with self._lock:
+            key = str(path.resolve())
+            entry = {'stat': get_stat_key(stat), 'digests': digests}
+            self._load()[key] = self._recorded[key] = entry
+
+    def get_digests(self, path, *, rehash=False):
+        """Get digests of a file, hashing it only if it changed.
+        """
+        stat = path.stat()
+        digests = None if rehash else self.lookup(path, stat)
+        if digests is None:
+            digests = hash_file(path)
+            self.record(path, digests, stat=stat)
+        return digests
+
+
+_memos = {}
+
+_save_registered = False
+
+
+def save_memos():
+    for memo in list(_memos.values()):
+        memo.save()
+
+
+def get_memo():
+    """Get the memo in the cache directory.
+
+    Records are saved when the process exits.
+    """
+    global _save_registered
+    if not _save_registered:
+        atexit.register(save_memos)
+        _save_registered = True
+    try:
+        path = configs.get_cache_dir_path().joinpath('verified.json')
+    except (KeyError, OSError):
+        path = None
+    try:
+        return _memos[path]
+    except KeyError:
+        memo = _memos[path] = VerificationMemo(path=path)
+        return memo
+
+
+def verify_file(path, checksums, *, rehash=False):
+    """Check a file against expected checksums, memoizing the result.
+
+    `checksums` maps algorithm names to hex digests. Returns whether all of
+    them match.
+    """
+    digests = get_memo().get_digests(path, rehash=rehash)
+    return all(digests.get(a) == v for a, v in checksums.items())
@@ -1,5 +1,4 @@
 import enum
-import hashlib
 import json
 import os
 import pathlib
@@ -8,7 +7,7 @@ import subprocess
 
 import attr
 
-from . import configs, installations, metadata
+from . import configs, installations, metadata, utils, verification
 
 
 class VersionNotFoundError(ValueError):
@@ -27,25 +26,151 @@ class InstallerType(enum.Enum):
 
 VERSIONS_DIR_PATH = pathlib.Path(__file__).with_name('versions').resolve()
 
+# Compiled from VERSIONS_DIR_PATH by build_index() at build time.
+INDEX_PATH = pathlib.Path(__file__).with_name('versions.index.json')
+
+INDEX_FORMAT = 1
+
+VERSION_NAME_RE = re.compile(r'^\d+\.\d+(:?\-32)?$')
+
+
+def get_source_stats(dirpath):
+    """Stat version definitions to tell whether an index is up to date.
+
+    This takes one directory scan. On Windows the stat results come with the
+    listing, so no file is opened.
+    """
+    stats = {}
+    for entry in os.scandir(str(dirpath)):
+        if entry.name.endswith('.json'):
+            stat = entry.stat()
+            stats[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def sort_names(definitions):
+    return sorted(definitions, key=lambda name: (
+        definitions[name]['version_info'], name,
+    ))
+
+
+def get_architecture_names(names):
+    """Split version names by the host architecture they are listed on.
+
+    A 64-bit host lists everything. A 32-bit host hides a 64-bit version if
+    it has a 32-bit counterpart.
+    """
+    available = set(names)
+    return {
+        'amd64': list(names),
+        'win32': [n for n in names if '{}-32'.format(n) not in available],
+    }
+
+
+def build_index(dirpath=None, index_path=None):
+    """Compile version definitions in dirpath into a single index file.
+    """
+    global _index
+    if dirpath is None:
+        dirpath = VERSIONS_DIR_PATH
+    if index_path is None:
+        index_path = INDEX_PATH
+    definitions = {}
+    for path in dirpath.iterdir():
+        if path.suffix == '.json' and VERSION_NAME_RE.match(path.stem):
+            with path.open() as f:
+                definitions[path.stem] = json.load(f)
+    index = {
+        'format': INDEX_FORMAT,
+        'sources': get_source_stats(dirpath),
+        'definitions': definitions,
+        'names': get_architecture_names(sort_names(definitions)),
+    }
+    utils.write_json_atomic(index_path, index, sort_keys=True)
+    if index_path == INDEX_PATH:
+        _index = None
+        _definitions.clear()
+
+
+_index = None
+
+# Definitions read from VERSIONS_DIR_PATH without an index, so listing and
+# loading versions read each file once.
+_definitions = {}
+
+
+def get_index():
+    """Load the compiled index, or None if it is missing or stale.
+    """
+    global _index
+    if _index is None:
+        try:
+            with INDEX_PATH.open() as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if (index.get('format') != INDEX_FORMAT or
+                index.get('sources') != get_source_stats(VERSIONS_DIR_PATH)):
+            index = {}
+        _index = index
+    return _index or None
+
 
 def load_version_data(name):
+    index = get_index()
+    if index is not None:
+        try:
+            return index['definitions'][name]
+        except KeyError:
+            raise VersionNotFoundError(name)
+    try:
+        return _definitions[name]
+    except KeyError:
+        pass
     try:
         with VERSIONS_DIR_PATH.joinpath('{}.json'.format(name)).open() as f:
             data = json.load(f)
     except FileNotFoundError:
         raise VersionNotFoundError(name)
+    _definitions[name] = data
     return data
 
 
-@attr.s
+def is_installed(name):
+    try:
+        exists = metadata.get_install_path(name).exists()
+    except FileNotFoundError:
+        return False
+    return exists
+
+
+@attr.s(slots=True, frozen=True)
+class CatalogueEntry:
+    """A version in the catalogue, without its installer details.
+
+    This is cheap to create for the whole catalogue. The installer details
+    are only loaded by `get_version()`.
+    """
+    name = attr.ib()
+    version_info = attr.ib(convert=tuple)
+
+    def is_installed(self):
+        return is_installed(self.name)
+
+    def get_version(self, *, force_32=False):
+        return get_version(self.name, force_32=force_32)
+
+
+@attr.s(slots=True, frozen=True)
 class Version:
 
     name = attr.ib()
     url = attr.ib()
     md5_sum = attr.ib()
     version_info = attr.ib(convert=tuple)
-    product_codes = attr.ib(default=attr.Factory(dict))
+    product_codes = attr.ib(default=attr.Factory(dict), hash=False)
     forced_32 = attr.ib(default=False)
+    sha256_sum = attr.ib(default=None)
 
     def __str__(self):
         return 'Python {}'.format(self.name)
@@ -77,26 +202,35 @@ class Version:
             for name in self.script_version_names
         ]
 
+    @property
+    def python_major_command_name(self):
+        return 'python{}.exe'.format(self.version_info[0])
+
     @property
     def python_major_command(self):
         dirpath = configs.get_scripts_dir_path()
-        return dirpath.joinpath('python{}.exe'.format(self.version_info[0]))
+        return dirpath.joinpath(self.python_major_command_name)
 
     def get_installation(self):
         path = metadata.get_install_path(self.name).resolve(strict=True)
         return installations.Installation(path=path)
 
     def is_installed(self):
-        try:
-            exists = metadata.get_install_path(self.name).exists()
-        except FileNotFoundError:
-            return False
-        return exists
+        return is_installed(self.name)
+
+    def get_checksums(self):
+        checksums = {'md5': self.md5_sum}
+        if self.sha256_sum:
+            checksums['sha256'] = self.sha256_sum
+        return checksums
 
-    def check_installer(self, data):
-        checksum = hashlib.md5(data).hexdigest()
-        assert checksum == self.md5_sum, \
-            'expect checksum {}, got {}'.format(self.md5_sum, checksum)
+    def check_installer(self):
+        return verification.ChecksumVerifier(self.get_checksums())
+
+    def verify_installer(self, path, *, rehash=False):
+        return verification.verify_file(
+            path, self.get_checksums(), rehash=rehash,
+        )
 
     def get_target_for_install(self):
         return pathlib.Path(
@@ -107,6 +241,8 @@ class Version:
 
 class CPythonMSIVersion(Version):
 
+    __slots__ = ()
+
     @classmethod
     def load(cls, name, data, *, force_32):
         variant = data['x86' if force_32 else 'amd64']
@@ -115,6 +251,7 @@ class CPythonMSIVersion(Version):
             version_info=data['version_info'],
             url=variant['url'],
             md5_sum=variant['md5_sum'],
+            sha256_sum=variant.get('sha256_sum'),
             product_codes=variant.get('product_codes', {}),
         )
 
@@ -161,6 +298,8 @@ class CPythonMSIVersion(Version):
 
 class CPythonVersion(Version):
 
+    __slots__ = ()
+
     @classmethod
     def load(cls, name, data, *, force_32):
         forced_32 = False
@@ -173,6 +312,7 @@ class CPythonVersion(Version):
             version_info=data['version_info'],
             url=data['url'],
             md5_sum=data['md5_sum'],
+            sha256_sum=data.get('sha256_sum'),
             forced_32=forced_32,
         )
 
@@ -208,12 +348,58 @@ def get_version(name, *, force_32):
     return klass.load(name, data, force_32=force_32)
 
 
-VERSION_NAME_RE = re.compile(r'^\d+\.\d+(:?\-32)?$')
+def get_version_names(architecture=None):
+    """List version names, sorted by version.
 
+    If `architecture` ("amd64" or "win32") is given, only list names that
+    should be shown on a host of that architecture.
+    """
+    index = get_index()
+    if index is not None:
+        names = index['names']
+    else:
+        names = get_architecture_names(sort_names({
+            p.stem: load_version_data(p.stem)
+            for p in VERSIONS_DIR_PATH.iterdir()
+            if p.suffix == '.json' and VERSION_NAME_RE.match(p.stem)
+        }))
+    return names[architecture or 'amd64']
 
-def get_versions():
+
+def get_catalogue(architecture=None):
+    """List catalogue entries, sorted by version.
+
+    See `get_version_names()` for `architecture`.
+    """
     return [
-        get_version(p.stem, force_32=False)
-        for p in VERSIONS_DIR_PATH.iterdir()
-        if p.suffix == '.json' and VERSION_NAME_RE.match(p.stem)
+        CatalogueEntry(
+            name=name, version_info=load_version_data(name)['version_info'],
+        )
+        for name in get_version_names(architecture)
     ]
+
+
+def get_versions(*, architecture=None):
+    return [
+        get_version(name, force_32=False)
+        for name in get_version_names(architecture)
+    ]
+
+
+def get_all_variants():
+    """Get every distinct installer in the catalogue.
+
+    This includes both the amd64 and x86 installers of MSI-based versions,
+    which share a name.
+    """
+    variants = []
+    urls = set()
+    for version in get_versions():
+        variants.append(version)
+        urls.add(version.url)
+        if isinstance(version, CPythonMSIVersion):
+            x86 = get_version(version.name, force_32=True)
+            if x86.url not in urls:
+                variants.append(x86)
+                urls.add(x86.url)
+    return variants
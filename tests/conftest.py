@@ -1,6 +1,400 @@
-import unittest.mock
+import collections
+import email.utils
+import http.server
+import io
+import os
+import pathlib
+import re
+import socketserver
 import sys
+import threading
+import unittest.mock
+import zlib
+
+import pytest
 
 
 def pytest_collectstart():
     sys.modules['winreg'] = unittest.mock.Mock()
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+
+    root = None     # Set by LocalServer.
+
+    def translate_path(self, path):
+        path = super().translate_path(path)
+        return os.path.join(str(self.root), os.path.relpath(path))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeHTTPRequestHandler(QuietHTTPRequestHandler):
+    """Serve files with support to ranges, and optionally fail on purpose.
+    """
+    protocol_version = 'HTTP/1.1'   # Allow connection reuse.
+
+    def send_head(self):
+        self.server.local.requests.append(self.headers)
+        fail_status = self.server.local.fail_status
+        if fail_status is not None:
+            self.server.local.fail_status = None    # Only fail once.
+            self.send_error(fail_status)
+            return None
+        path = self.translate_path(self.path)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404)
+            return None
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        etag = '"{}-{}"'.format(stat.st_mtime_ns, size)
+        start, end = 0, size - 1
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        match = re.match(r'^bytes=(\d+)-(\d*)$', range_header or '')
+        partial = (
+            self.server.local.ranges and match and
+            (if_range is None or if_range == etag)
+        )
+        if partial:
+            start = max(int(match.group(1)) + self.server.local.range_skew, 0)
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start >= size:
+                f.close()
+                self.send_error(416)
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, size,
+            ))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        if self.server.local.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = self.remaining
+        fail_after = self.server.local.fail_after
+        if fail_after is not None:
+            # Only fail once, so the client can recover on retry.
+            self.server.local.fail_after = None
+            remaining = min(remaining, fail_after)
+            self.close_connection = True
+        while remaining > 0:
+            chunk = source.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class ChunkedHTTPRequestHandler(QuietHTTPRequestHandler):
+    """Serve files with chunked encoding, and redirect /redirect/<name>.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.local.requests.append(self.headers)
+        if self.path.startswith('/redirect/'):
+            self.send_response(302)
+            self.send_header('Location', self.path[len('/redirect'):])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            with open(self.translate_path(self.path), 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(data), 1000):
+            chunk = data[i:i + 1000]
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii'))
+            self.wfile.write(chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class ListingHTTPRequestHandler(QuietHTTPRequestHandler):
+    """Serve directory listings with validators, and 304 if not modified.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def send_head(self):
+        self.server.local.requests.append(self.headers)
+        path = self.translate_path(self.path)
+        if not os.path.isdir(path):
+            return super().send_head()
+        names = sorted(
+            name + '/' if os.path.isdir(os.path.join(path, name)) else name
+            for name in os.listdir(path)
+        )
+        body = ''.join(
+            '<a href="{0}">{0}</a>\n'.format(name) for name in names
+        ).encode('utf-8')
+        etag = '"{:x}"'.format(zlib.crc32(body))
+        last_modified = email.utils.formatdate(
+            os.stat(path).st_mtime, usegmt=True,
+        )
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        return io.BytesIO(body)
+
+
+class LocalServer:
+    def __init__(self, root, handler_class):
+        self.root = root
+        self.requests = []
+        self.ranges = True
+        self.fail_after = None
+        self.fail_status = None
+        self.range_skew = 0
+        handler = type(handler_class.__name__, (handler_class,), {
+            'root': root,
+        })
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.local = self
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05},
+        )
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, name):
+        host, port = self.httpd.server_address
+        return 'http://{}:{}/{}'.format(host, port, name)
+
+
+class FakeRegistry:
+    """Stand-in of winreg, keeping keys in memory.
+
+    Keys are (root, path) tuples. Calls to each function are counted in
+    `calls`.
+    """
+    REG_SZ = 1
+
+    def __init__(self, roots):
+        for name, root in roots.items():
+            setattr(self, name, root)
+        self.values = {}
+        self.last_write = {}
+        self.calls = collections.Counter()
+        self._clock = 0
+
+    def set_value(self, root, path, name, value):
+        """Set a value, creating the key and its parents if needed.
+
+        Like Windows, only the key written is marked modified, and parents
+        of keys created.
+        """
+        self._clock += 1
+        parts = path.split('\\')
+        for i in range(1, len(parts) + 1):
+            key = (root, '\\'.join(parts[:i]))
+            if key in self.values:
+                continue
+            self.values[key] = {}
+            self.last_write[key] = self._clock
+            if i > 1:
+                self.last_write[(root, '\\'.join(parts[:i - 1]))] = (
+                    self._clock
+                )
+        self.values[(root, path)][name] = value
+        self.last_write[(root, path)] = self._clock
+
+    def _get_key(self, key, sub_key=''):
+        root, path = key if isinstance(key, tuple) else (key, '')
+        if sub_key:
+            path = '{}\\{}'.format(path, sub_key) if path else sub_key
+        if (root, path) not in self.values:
+            raise FileNotFoundError(path)
+        return root, path
+
+    def _get_subkeys(self, key):
+        root, path = key
+        prefix = '{}\\'.format(path)
+        return sorted({
+            p[len(prefix):].split('\\', 1)[0]
+            for r, p in self.values if r == root and p.startswith(prefix)
+        })
+
+    def OpenKey(self, key, sub_key):
+        self.calls['OpenKey'] += 1
+        return self._get_key(key, sub_key)
+
+    def CreateKey(self, key, sub_key):
+        self.calls['CreateKey'] += 1
+        root, path = key if isinstance(key, tuple) else (key, '')
+        path = '{}\\{}'.format(path, sub_key) if path else sub_key
+        self.values.setdefault((root, path), {})
+        return root, path
+
+    def CloseKey(self, key):
+        pass
+
+    def QueryInfoKey(self, key):
+        self.calls['QueryInfoKey'] += 1
+        return (
+            len(self._get_subkeys(key)), len(self.values[key]),
+            self.last_write.get(key, 0),
+        )
+
+    def EnumKey(self, key, index):
+        self.calls['EnumKey'] += 1
+        try:
+            return self._get_subkeys(key)[index]
+        except IndexError:
+            raise OSError('No more data is available')
+
+    def QueryValue(self, key, sub_key):
+        self.calls['QueryValue'] += 1
+        try:
+            return self.values[self._get_key(key, sub_key)][None]
+        except KeyError:
+            raise FileNotFoundError(sub_key)
+
+    def QueryValueEx(self, key, name):
+        self.calls['QueryValueEx'] += 1
+        try:
+            return self.values[key][name], 1
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def SetValueEx(self, key, name, reserved, type, value):
+        self.calls['SetValueEx'] += 1
+        self.set_value(key[0], key[1], name, value)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Replace the registry with an empty in-memory one.
+    """
+    import snafu.metadata
+    import snafu.relinks
+    winreg = snafu.metadata.winreg
+    registry = FakeRegistry({
+        name: getattr(winreg, name)
+        for name in ('HKEY_CURRENT_USER', 'HKEY_LOCAL_MACHINE',
+                     'HKEY_CLASSES_ROOT')
+    })
+    monkeypatch.setattr(snafu.metadata, 'winreg', registry)
+    monkeypatch.setattr(snafu.relinks, 'winreg', registry)
+    monkeypatch.setattr(snafu.metadata, '_install_paths', None)
+    monkeypatch.setattr(snafu.metadata, '_uninstaller_index', None)
+    return registry
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    """Keep anything written into the cache out of the source tree.
+    """
+    path = pathlib.Path(str(tmpdir.mkdir('snafu-cache')))
+    monkeypatch.setattr('snafu.configs.get_cache_dir_path', lambda: path)
+    monkeypatch.setattr('snafu.verification._memos', {})
+    monkeypatch.setattr('snafu.states._state', None)
+    monkeypatch.setattr('snafu.relinks._lock', None)
+    return path
+
+
+@pytest.fixture
+def http_server(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('www')))
+    with LocalServer(root, QuietHTTPRequestHandler) as server:
+        yield server
+
+
+@pytest.fixture
+def chunked_server(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('www')))
+    with LocalServer(root, ChunkedHTTPRequestHandler) as server:
+        yield server
+
+
+@pytest.fixture
+def listing_server(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('www')))
+    with LocalServer(root, ListingHTTPRequestHandler) as server:
+        yield server
+
+
+@pytest.fixture
+def range_server(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('www')))
+    with LocalServer(root, RangeHTTPRequestHandler) as server:
+        yield server
+
+
+@pytest.fixture
+def scripts_dir(tmpdir, monkeypatch):
+    path = pathlib.Path(str(tmpdir.mkdir('Scripts')))
+    monkeypatch.setattr('snafu.configs.get_scripts_dir_path', lambda: path)
+    monkeypatch.setattr('snafu.configs.get_scriptsets_dir_path', lambda: None)
+    return path
+
+
+@pytest.fixture
+def shims_dir(tmpdir, monkeypatch):
+    path = pathlib.Path(str(tmpdir.mkdir('shims')))
+    for name in ('piplike-script', 'python-script'):
+        path.joinpath('{}.exe'.format(name)).write_bytes(name.encode())
+    monkeypatch.setattr(
+        'snafu.configs.get_shim_path',
+        lambda name: path.joinpath('{}.exe'.format(name)),
+    )
+    return path
+
+
+@pytest.fixture
+def version(registry, tmpdir):
+    import snafu.versions
+    path = pathlib.Path(str(tmpdir.mkdir('Python36')))
+    scripts = path.joinpath('Scripts')
+    scripts.mkdir()
+    for name in ('pip.exe', 'pip3.exe', 'pip3.6.exe', 'black.exe',
+                 'flake8.exe', 'tox.exe'):
+        scripts.joinpath(name).write_bytes(name.encode() * 10)
+    registry.set_value(
+        registry.HKEY_CURRENT_USER,
+        'Software\\Python\\PythonCore\\3.6\\InstallPath', None, str(path),
+    )
+    return snafu.versions.get_version('3.6', force_32=False)
+
+
+@pytest.fixture
+def published(mocker):
+    import snafu.publishing
+    return mocker.spy(snafu.publishing, 'publish')
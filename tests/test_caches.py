@@ -0,0 +1,98 @@
+import hashlib
+import pathlib
+
+import pytest
+
+import snafu.caches
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return snafu.caches.InstallerCache(root=pathlib.Path(str(tmpdir)))
+
+
+def populate(cache, data, filename):
+    key = hashlib.md5(data).hexdigest()
+    path = cache.get_container(key).joinpath(filename)
+    path.write_bytes(data)
+    cache.add(key, 'https://example.com/{}'.format(filename), path)
+    return key, path
+
+
+def test_get(cache):
+    key, path = populate(cache, b'python', 'python.exe')
+    assert cache.get(key) == path
+
+
+def test_get_miss(cache):
+    assert cache.get('0' * 32) is None
+
+
+def test_get_missing_file(cache):
+    key, path = populate(cache, b'python', 'python.exe')
+    path.unlink()
+    assert cache.get(key) is None
+    assert cache.entries() == []
+
+
+def test_get_deferred(cache, mocker):
+    time = mocker.patch('time.time')
+    time.return_value = 1
+    key, path = populate(cache, b'python', 'python.exe')
+    index = cache.index_path.read_bytes()
+
+    time.return_value = 2
+    assert cache.get(key, defer=True) == path
+    assert cache.index_path.read_bytes() == index
+    entry, = cache.entries()
+    assert entry.last_used == 2
+
+    cache.flush(min_interval=60)    # Written at 1, too recently.
+    assert cache.index_path.read_bytes() == index
+    cache.flush()
+    assert snafu.caches.InstallerCache(root=cache.root).entries() == [entry]
+
+
+def test_get_deferred_missing_file(cache):
+    key, path = populate(cache, b'python', 'python.exe')
+    path.unlink()
+    assert cache.get(key, defer=True) is None
+
+
+def test_prune_lru(cache, mocker):
+    time = mocker.patch('time.time')
+    time.return_value = 1
+    old_key, _ = populate(cache, b'a' * 10, 'old.exe')
+    time.return_value = 2
+    new_key, _ = populate(cache, b'b' * 10, 'new.exe')
+    time.return_value = 3
+    cache.get(old_key)
+
+    removed = cache.prune(15)
+    assert [e.key for e in removed] == [new_key]
+    assert [e.key for e in cache.entries()] == [old_key]
+
+
+def test_add_evicts(cache):
+    cache.max_size = 15
+    old_key, _ = populate(cache, b'a' * 10, 'old.exe')
+    new_key, _ = populate(cache, b'b' * 10, 'new.exe')
+    assert [e.key for e in cache.entries()] == [new_key]
+    assert not cache.root.joinpath(old_key).exists()
+
+
+def test_verify(cache):
+    key, path = populate(cache, b'python', 'python.exe')
+    entry, = cache.entries()
+    assert cache.verify(entry)
+    path.write_bytes(b'corrupted')
+    assert not cache.verify(entry)
+
+
+def test_link_or_copy(tmpdir):
+    source = pathlib.Path(str(tmpdir.join('source')))
+    target = pathlib.Path(str(tmpdir.join('target')))
+    source.write_bytes(b'python')
+    target.write_bytes(b'old')
+    snafu.caches.link_or_copy(source, target)
+    assert target.read_bytes() == b'python'
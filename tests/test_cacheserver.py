@@ -0,0 +1,152 @@
+import hashlib
+import pathlib
+import threading
+import time
+
+import pytest
+import requests
+
+import snafu.cacheserver
+import snafu.caches
+import snafu.mirrors
+import snafu.verification
+import snafu.versions
+
+
+DATA = bytes(range(256)) * 16
+
+MD5_SUM = hashlib.md5(DATA).hexdigest()
+
+PATH = '3.6.4/python-3.6.4-amd64.exe'
+
+
+@pytest.fixture
+def upstream(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('upstream')))
+    root.joinpath('3.6.4').mkdir()
+    root.joinpath(PATH).write_bytes(DATA)
+    return root
+
+
+@pytest.fixture
+def server(tmpdir, upstream):
+    version = snafu.versions.CPythonVersion(
+        name='3.6', url='{}/{}'.format(snafu.mirrors.ORIGIN, PATH),
+        md5_sum=MD5_SUM, version_info=(3, 6, 4),
+    )
+    mirror = snafu.mirrors.Mirror(
+        base=upstream.as_uri(), latency=0, probed_at=time.time(),
+    )
+    state = snafu.cacheserver.CacheServerState(
+        cache=snafu.caches.InstallerCache(
+            root=pathlib.Path(str(tmpdir.mkdir('cache'))),
+        ),
+        mirror_list=snafu.mirrors.MirrorList(mirrors=[mirror]),
+        catalogue={MD5_SUM: version},
+    )
+    server = snafu.cacheserver.CacheServer(('127.0.0.1', 0), state)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.05},
+    )
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server, path):
+    host, port = server.server_address[:2]
+    return 'http://{}:{}/{}'.format(host, port, path)
+
+
+def test_pull_through(server, upstream):
+    assert requests.get(get_url(server, 'index.json')).json() == []
+
+    response = requests.get(get_url(server, PATH))
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers['etag'] == '"{}"'.format(MD5_SUM)
+
+    # Served from cache afterwards.
+    upstream.joinpath(PATH).unlink()
+    name = '{}/python-3.6.4-amd64.exe'.format(MD5_SUM)
+    response = requests.get(get_url(server, name))
+    assert response.content == DATA
+
+    index = requests.get(get_url(server, 'index.json')).json()
+    assert [(e['md5_sum'], e['path']) for e in index] == [
+        (MD5_SUM, '/{}'.format(name)),
+    ]
+
+
+def test_pruned_while_serving(server, mocker):
+    requests.get(get_url(server, PATH))
+    state = server.state
+    get_file = state.get_file
+    pruned = []
+
+    def get_file_pruned(version):
+        path = get_file(version)
+        if not pruned:
+            path.unlink()
+            pruned.append(path)
+        return path
+
+    # Pruned between looking it up and opening it. Fetched again.
+    mocker.patch.object(state, 'get_file', side_effect=get_file_pruned)
+    response = requests.get(get_url(server, PATH))
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert pruned[0].read_bytes() == DATA
+
+
+def test_serving_defers_uses(server, mocker):
+    requests.get(get_url(server, PATH))
+    save = mocker.spy(server.state.cache, '_save_index')
+    for _ in range(3):
+        assert requests.get(get_url(server, PATH)).content == DATA
+    assert save.call_count == 0
+
+
+def test_range(server):
+    response = requests.get(get_url(server, PATH), headers={
+        'Range': 'bytes=256-511',
+    })
+    assert response.status_code == 206
+    assert response.headers['content-range'] == 'bytes 256-511/4096'
+    assert response.content == DATA[256:512]
+
+
+def test_not_found(server):
+    response = requests.get(get_url(server, '3.6.4/nothing.exe'))
+    assert response.status_code == 404
+
+
+def test_as_mirror(server, tmpdir):
+    mirror = snafu.mirrors.Mirror(
+        base=get_url(server, ''), latency=0, probed_at=time.time(),
+    )
+    path = snafu.mirrors.MirrorList(mirrors=[mirror]).download_file(
+        '{}/{}'.format(snafu.mirrors.ORIGIN, PATH),
+        container=pathlib.Path(str(tmpdir)),
+        check=lambda: snafu.verification.HashVerifier('md5', MD5_SUM),
+    )
+    assert path.read_bytes() == DATA
+
+
+@pytest.mark.parametrize('value, result', [
+    (None, None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=900-2000', (900, 999)),
+    ('bytes=0-1,5-6', None),
+])
+def test_parse_range(value, result):
+    assert snafu.cacheserver.parse_range(value, 1000) == result
+
+
+def test_parse_range_unsatisfiable():
+    with pytest.raises(ValueError):
+        snafu.cacheserver.parse_range('bytes=1000-', 1000)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import pathlib
+
+import pytest
+
+import snafu.caches
+import snafu.catalogue
+
+
+PYTHON_ORG_LISTING = """
+<html><head><title>Index of /ftp/python/</title></head><body>
+<h1>Index of /ftp/python/</h1><hr><pre><a href="../">../</a>
+<a href="2.7.14/">2.7.14/</a>              16-Sep-2017 20:58       -
+<a href="3.6.4/">3.6.4/</a>                19-Dec-2017 05:06       -
+<a href="README.html">README.html</a>      11-Jul-2018 13:06    3380
+</pre><hr></body></html>
+"""
+
+
+def test_parse_listing():
+    assert snafu.catalogue.parse_listing(PYTHON_ORG_LISTING) == [
+        '2.7.14/', '3.6.4/', 'README.html',
+    ]
+
+
+def write_installers(root, version, filenames):
+    directory = root.joinpath(version)
+    directory.mkdir(exist_ok=True)
+    for filename in filenames:
+        directory.joinpath(filename).write_bytes(filename.encode() * 100)
+
+
+def write_definition(dirpath, name, data):
+    with dirpath.joinpath('{}.json'.format(name)).open('w') as f:
+        json.dump(data, f)
+
+
+@pytest.fixture
+def versions_dir(tmpdir):
+    path = pathlib.Path(str(tmpdir.mkdir('versions')))
+    write_definition(path, '3.4', {
+        'type': 'cpython_msi',
+        'version_info': [3, 4, 4],
+        'amd64': {
+            'url': 'https://example.com/python-3.4.4.amd64.msi',
+            'md5_sum': '0' * 32,
+            'product_codes': {'3.4.4': '{AMD64}'},
+        },
+        'x86': {
+            'url': 'https://example.com/python-3.4.4.msi',
+            'md5_sum': '1' * 32,
+        },
+    })
+    for name, filename in [('3.6', 'python-3.6.4-amd64.exe'),
+                           ('3.6-32', 'python-3.6.4.exe')]:
+        write_definition(path, name, {
+            'type': 'cpython',
+            'version_info': [3, 6, 4],
+            'url': 'https://example.com/{}'.format(filename),
+            'md5_sum': '2' * 32,
+        })
+    return path
+
+
+@pytest.fixture
+def ftp_root(listing_server):
+    root = listing_server.root
+    write_installers(root, '3.2.5', ['python-3.2.5.msi'])    # Too old.
+    write_installers(root, '3.4.4', [])
+    write_installers(root, '3.4.5', [
+        'python-3.4.5.amd64.msi', 'python-3.4.5.msi',
+    ])
+    write_installers(root, '3.6.4', [])
+    write_installers(root, '3.6.5', [
+        'python-3.6.5-amd64.exe', 'python-3.6.5.exe',
+    ])
+    write_installers(root, '3.6.6', ['Python-3.6.6.tgz'])   # Source only.
+    write_installers(root, '3.7.0', ['python-3.7.0b1-amd64.exe'])
+    return root
+
+
+def load(dirpath, name):
+    with dirpath.joinpath('{}.json'.format(name)).open() as f:
+        return json.load(f)
+
+
+def test_update(listing_server, ftp_root, versions_dir):
+    result = snafu.catalogue.update(
+        source=listing_server.url(''), versions_dir=versions_dir,
+    )
+    assert result.updated == [
+        ('3.4', (3, 4, 4), (3, 4, 5)),
+        ('3.6', (3, 6, 4), (3, 6, 5)),
+        ('3.6-32', (3, 6, 4), (3, 6, 5)),
+    ]
+    # The root, and release directories newer than the catalogue.
+    assert result.requests == 5
+    assert result.revalidated == 0
+
+    data = b'python-3.6.5-amd64.exe' * 100
+    assert load(versions_dir, '3.6') == {
+        'type': 'cpython',
+        'version_info': [3, 6, 5],
+        'url': (
+            'https://www.python.org/ftp/python/3.6.5/python-3.6.5-amd64.exe'
+        ),
+        'md5_sum': hashlib.md5(data).hexdigest(),
+        'sha256_sum': hashlib.sha256(data).hexdigest(),
+    }
+    msi = load(versions_dir, '3.4')
+    assert msi['version_info'] == [3, 4, 5]
+    assert msi['amd64']['product_codes'] == {'3.4.4': '{AMD64}'}
+    assert 'product_codes' not in msi['x86']
+
+    # Downloaded installers are kept in the cache.
+    cached = snafu.caches.get_installer_cache().get(
+        hashlib.md5(data).hexdigest(),
+    )
+    assert cached.read_bytes() == data
+
+
+def test_update_unchanged(listing_server, ftp_root, versions_dir):
+    source = listing_server.url('')
+    snafu.catalogue.update(source=source, versions_dir=versions_dir)
+    del listing_server.requests[:]
+
+    result = snafu.catalogue.update(source=source, versions_dir=versions_dir)
+    assert result.updated == []
+
+    # Only directories after 3.6.5 are listed again, and all are unchanged.
+    assert result.requests == result.revalidated == 3
+    assert len(listing_server.requests) == 3
+    assert all(r['If-None-Match'] for r in listing_server.requests)
+
+
+def test_update_new_release(listing_server, ftp_root, versions_dir):
+    source = listing_server.url('')
+    snafu.catalogue.update(source=source, versions_dir=versions_dir)
+    write_installers(ftp_root, '3.7.0', [
+        'python-3.7.0-amd64.exe', 'python-3.7.0.exe',
+    ])
+
+    result = snafu.catalogue.update(source=source, versions_dir=versions_dir)
+    assert result.updated == [
+        ('3.7', None, (3, 7, 0)),
+        ('3.7-32', None, (3, 7, 0)),
+    ]
+    assert result.revalidated == 2      # The root, and 3.6.6.
+    assert load(versions_dir, '3.7-32')['url'] == (
+        'https://www.python.org/ftp/python/3.7.0/python-3.7.0.exe'
+    )
@@ -0,0 +1,60 @@
+import hashlib
+import pathlib
+import time
+
+import attr
+import pytest
+
+import snafu.configs
+import snafu.mirrors
+import snafu.versions
+from snafu.operations import download
+
+
+@pytest.fixture
+def environment(tmpdir, mocker, http_server):
+    for name in ('cache', 'downloads'):
+        path = pathlib.Path(str(tmpdir.mkdir(name)))
+        mocker.patch.object(
+            snafu.configs, 'get_{}_dir_path'.format(name), return_value=path,
+        )
+    mirror = snafu.mirrors.Mirror(
+        base=http_server.url(''), latency=0, probed_at=time.time(),
+    )
+    mocker.patch.object(snafu.mirrors, 'get_mirror_list', return_value=(
+        snafu.mirrors.MirrorList(mirrors=[mirror])
+    ))
+    mocker.patch.object(snafu.configs, 'get_cache_max_size', return_value=None)
+    return http_server
+
+
+def make_version(server, name, data):
+    filename = 'python-{}.exe'.format(name)
+    server.root.joinpath(filename).write_bytes(data)
+    return snafu.versions.CPythonVersion(
+        name=name, url='{}/{}'.format(snafu.mirrors.ORIGIN, filename),
+        md5_sum=hashlib.md5(data).hexdigest(), version_info=(3, 6, 4),
+    )
+
+
+def test_download_installers(environment):
+    versions = [
+        make_version(environment, '3.5', b'3.5' * 1000),
+        make_version(environment, '3.6', b'3.6' * 1000),
+    ]
+    broken = attr.evolve(
+        make_version(environment, '3.7', b'3.7'), md5_sum='0' * 32,
+    )
+
+    results = download.download_installers(
+        versions + [broken], jobs=2, connections=1,
+    )
+    assert [r.path.read_bytes() for r in results[:2]] == [
+        b'3.5' * 1000, b'3.6' * 1000,
+    ]
+    assert [r.size for r in results[:2]] == [3000, 3000]
+    assert results[2].error is not None
+
+    # Downloaded installers are cached.
+    results = download.download_installers(versions, jobs=2, connections=1)
+    assert [r.size for r in results] == [0, 0]
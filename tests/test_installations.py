@@ -1,9 +1,14 @@
+import os
 import pathlib
+import struct
+import subprocess
+import time
 import uuid
 
 import pytest
 
 import snafu.installations
+import snafu.states
 
 
 @pytest.fixture
@@ -26,3 +31,132 @@ def test_python(instpath, installation):
 
 def test_pip(instpath, installation):
     assert installation.pip == instpath.joinpath('Scripts', 'pip.exe')
+
+
+def test_get_version_info_state(instpath, installation, mocker):
+    instpath.joinpath('python.exe').write_bytes(b'3.6.4')
+    read = mocker.patch.object(
+        snafu.installations.Installation, 'read_version_info',
+        return_value=(3, 6, 4),
+    )
+    assert installation.get_version_info() == (3, 6, 4)
+    assert installation.get_version_info() == (3, 6, 4)
+    assert read.call_count == 1
+
+    # Upgraded.
+    read.return_value = (3, 6, 5)
+    instpath.joinpath('python.exe').write_bytes(b'3.6.5!')
+    assert installation.get_version_info() == (3, 6, 5)
+    assert read.call_count == 2
+
+    # Upgraded in place, without changing the size or mtime.
+    read.return_value = (3, 6, 6)
+    stat = instpath.joinpath('python.exe').stat()
+    instpath.joinpath('python.exe').write_bytes(b'3.6.6!')
+    os.utime(str(installation.python), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert installation.get_version_info() == (3, 6, 5)
+    snafu.states.get_state().forget_version_info(installation.python)
+    assert installation.get_version_info() == (3, 6, 6)
+
+
+PATCHLEVEL = """
+#define PY_MAJOR_VERSION        3
+#define PY_MINOR_VERSION        6
+#define PY_MICRO_VERSION        4
+#define PY_RELEASE_LEVEL        PY_RELEASE_LEVEL_FINAL
+#define PY_VERSION              "3.6.4"
+"""
+
+
+def make_dll(version_info):
+    major, minor, micro = version_info
+    info = struct.pack(
+        '<4I', 0xFEEF04BD, 0x00010000, (major << 16) | minor,
+        ((micro * 1000 + 150) << 16) | 1013,
+    )
+    # A signature without the right version comes first, to be skipped.
+    decoy = struct.pack('<4I', 0xFEEF04BD, 0x00010000, 1 << 16, 0)
+    return b'MZ' + b'\0' * 1000 + decoy + b'\0' * 1000 + info + b'\0' * 100
+
+
+@pytest.fixture
+def run_version_info(mocker):
+    return mocker.patch.object(
+        snafu.installations.Installation, 'run_version_info',
+        return_value=(3, 6, 0),
+    )
+
+
+def test_read_version_info_patchlevel(instpath, installation,
+                                      run_version_info):
+    instpath.joinpath('include').mkdir()
+    instpath.joinpath('include', 'patchlevel.h').write_text(PATCHLEVEL)
+    assert installation.read_version_info() == (3, 6, 4)
+    assert not run_version_info.called
+
+
+def test_read_version_info_dll(instpath, installation, run_version_info):
+    instpath.joinpath('python3.dll').write_bytes(b'MZ')
+    instpath.joinpath('python36.dll').write_bytes(make_dll((3, 6, 5)))
+    assert installation.read_version_info() == (3, 6, 5)
+    assert not run_version_info.called
+
+
+def test_read_version_info_fallback(instpath, installation, run_version_info):
+    instpath.joinpath('include').mkdir()
+    instpath.joinpath('include', 'patchlevel.h').write_text('broken')
+    instpath.joinpath('python36.dll').write_bytes(b'MZ' + b'\0' * 100)
+    assert installation.read_version_info() == (3, 6, 0)
+    assert run_version_info.called
+
+
+def make_installation(root, name, patchlevel=None):
+    path = root.joinpath(name)
+    path.mkdir()
+    path.joinpath('python.exe').write_bytes(b'not really')
+    if patchlevel is not None:
+        path.joinpath('include').mkdir()
+        path.joinpath('include', 'patchlevel.h').write_text(patchlevel)
+    return snafu.installations.Installation(path)
+
+
+def test_probe_versions(tmpdir):
+    root = pathlib.Path(str(tmpdir))
+    good = make_installation(root, 'good', PATCHLEVEL)
+    broken = make_installation(root, 'broken')
+    versions, errors = snafu.installations.probe_versions([good, broken])
+    assert versions == {good: (3, 6, 4)}
+    assert list(errors) == [broken]
+    assert isinstance(errors[broken], OSError)
+
+    # Recorded versions are not probed again.
+    good.path.joinpath('include', 'patchlevel.h').unlink()
+    assert snafu.installations.probe_versions([good]) == (
+        {good: (3, 6, 4)}, {},
+    )
+
+
+def test_probe_versions_concurrent(tmpdir, mocker):
+    root = pathlib.Path(str(tmpdir))
+    installations = [
+        make_installation(root, str(i), PATCHLEVEL) for i in range(8)
+    ]
+
+    def read_version_info(self, *, timeout):
+        time.sleep(0.2)
+        if self is installations[0]:
+            raise subprocess.TimeoutExpired('python.exe', timeout)
+        return (3, 6, int(self.path.name))
+
+    mocker.patch.object(
+        snafu.installations.Installation, 'read_version_info',
+        read_version_info,
+    )
+    start = time.perf_counter()
+    versions, errors = snafu.installations.probe_versions(
+        installations, jobs=8, timeout=1,
+    )
+    assert time.perf_counter() - start < 1
+    assert versions == {i: (3, 6, n) for n, i in enumerate(installations)
+                        if n}
+    assert isinstance(errors[installations[0]], subprocess.TimeoutExpired)
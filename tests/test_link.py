@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import snafu.operations.link
+import snafu.publishing
+
+
+@pytest.fixture(autouse=True)
+def copy_strategy(monkeypatch):
+    # Publishing with links is tested in test_publishing.
+    monkeypatch.setenv('SNAFU_PUBLISH_STRATEGY', 'copy')
+
+
+def activate(version, **kwargs):
+    snafu.operations.link.activate([version], quiet=True, **kwargs)
+
+
+def test_activate(version, scripts_dir, shims_dir, published):
+    scripts_dir.joinpath('stale.exe').write_bytes(b'')
+    activate(version)
+    assert sorted(p.name for p in scripts_dir.iterdir()) == [
+        'black.exe', 'flake8.exe', 'pip3.exe', 'python3.exe', 'tox.exe',
+    ]
+    assert scripts_dir.joinpath('pip3.exe').read_bytes() == b'piplike-script'
+    assert published.call_count == 5
+
+
+def test_activate_unchanged(version, scripts_dir, shims_dir, published):
+    activate(version)
+    activate(version)
+    activate(version, overwrite=snafu.operations.link.Overwrite.smart)
+    assert published.call_count == 5
+
+
+def test_activate_changed(version, scripts_dir, shims_dir, published, mocker):
+    activate(version)
+    version_scripts = version.get_installation().scripts_dir
+
+    version_scripts.joinpath('black.exe').write_bytes(b'new black')
+    version_scripts.joinpath('tox.exe').unlink()
+    version_scripts.joinpath('isort.exe').write_bytes(b'isort')
+    # Touched by pip, but not modified.
+    flake8 = version_scripts.joinpath('flake8.exe')
+    stat = flake8.stat()
+    os.utime(str(flake8), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    activate(version)
+    assert sorted(p.name for p in scripts_dir.iterdir()) == [
+        'black.exe', 'flake8.exe', 'isort.exe', 'pip3.exe', 'python3.exe',
+    ]
+    assert scripts_dir.joinpath('black.exe').read_bytes() == b'new black'
+    assert published.call_count == 7
+
+    # The touched script is recorded, so it is not hashed again.
+    digests = mocker.spy(snafu.publishing, 'get_digest')
+    activate(version)
+    assert published.call_count == 7
+    assert not digests.called
+
+
+def test_activate_target_modified(version, scripts_dir, shims_dir, published):
+    activate(version)
+    scripts_dir.joinpath('black.exe').write_bytes(b'modified')
+    activate(version, overwrite=snafu.operations.link.Overwrite.smart)
+    assert scripts_dir.joinpath('black.exe').read_bytes() == (
+        b'black.exe' * 10
+    )
+    assert published.call_count == 6
+
+
+def test_activate_without_manifest(version, scripts_dir, shims_dir, published):
+    activate(version)
+    snafu.publishing.get_manifest_path().unlink()
+
+    # Identical files are adopted into the manifest without copying.
+    activate(version, overwrite=snafu.operations.link.Overwrite.smart)
+    assert published.call_count == 5
+    activate(version)
+    assert published.call_count == 5
@@ -0,0 +1,135 @@
+import pathlib
+
+import pytest
+
+import snafu.metadata
+import snafu.states
+
+
+CORE = 'Software\\Python\\PythonCore'
+
+
+@pytest.fixture
+def install_dirs(tmpdir):
+    return {
+        name: pathlib.Path(str(tmpdir.mkdir(name)))
+        for name in ('user36', 'machine36', 'machine27', 'wow35')
+    }
+
+
+@pytest.fixture
+def pythons(registry, install_dirs):
+    for root, prefix, name, dirname in [
+        (registry.HKEY_CURRENT_USER, CORE, '3.6', 'user36'),
+        (registry.HKEY_LOCAL_MACHINE, CORE, '3.6', 'machine36'),
+        (registry.HKEY_LOCAL_MACHINE, CORE, '2.7', 'machine27'),
+        (registry.HKEY_LOCAL_MACHINE,
+         'Software\\Wow6432Node\\Python\\PythonCore', '3.5-32', 'wow35'),
+    ]:
+        registry.set_value(
+            root, '{}\\{}\\InstallPath'.format(prefix, name), None,
+            str(install_dirs[dirname]),
+        )
+    # A key without InstallPath is skipped.
+    registry.set_value(registry.HKEY_CURRENT_USER, CORE + '\\3.7', 'X', '')
+    return registry
+
+
+def test_get_install_path(pythons, install_dirs):
+    get_install_path = snafu.metadata.get_install_path
+    assert get_install_path('3.6') == install_dirs['user36']
+    assert get_install_path('2.7') == install_dirs['machine27']
+    assert get_install_path('3.5-32') == install_dirs['wow35']
+    for name in ('3.7', '3.4'):
+        with pytest.raises(FileNotFoundError):
+            get_install_path(name)
+
+
+def test_get_install_path_snapshot(pythons):
+    for _ in range(3):
+        for name in ('3.6', '2.7', '3.5-32', '3.4'):
+            try:
+                snafu.metadata.get_install_path(name)
+            except FileNotFoundError:
+                pass
+    # One pass over the three roots, however many lookups are made.
+    assert pythons.calls['OpenKey'] == 3
+    assert pythons.calls['QueryInfoKey'] == 3
+
+
+def test_invalidate_install_paths(pythons, tmpdir):
+    with pytest.raises(FileNotFoundError):
+        snafu.metadata.get_install_path('3.4')
+    path = pathlib.Path(str(tmpdir.mkdir('user34')))
+    pythons.set_value(
+        pythons.HKEY_CURRENT_USER, CORE + '\\3.4\\InstallPath', None,
+        str(path),
+    )
+    with pytest.raises(FileNotFoundError):
+        snafu.metadata.get_install_path('3.4')
+
+    snafu.metadata.invalidate_install_paths()
+    assert snafu.metadata.get_install_path('3.4') == path
+
+
+UNINSTALL = 'Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall'
+
+
+def add_uninstaller(registry, sub_name, display_name, publisher):
+    path = '{}\\{}'.format(UNINSTALL, sub_name)
+    root = registry.HKEY_LOCAL_MACHINE
+    registry.set_value(root, path, 'DisplayName', display_name)
+    registry.set_value(root, path, 'Publisher', publisher)
+
+
+@pytest.fixture
+def uninstallers(registry):
+    for i in range(50):
+        add_uninstaller(
+            registry, '{{PRODUCT-{}}}'.format(i), 'Product {}'.format(i),
+            'Someone',
+        )
+    add_uninstaller(
+        registry, '{PY27}', 'Python 2.7.14 (64-bit)',
+        'Python Software Foundation',
+    )
+    add_uninstaller(registry, '{FAKE34}', 'Python 3.4.4', 'Not PSF')
+    return registry
+
+
+def test_find_uninstaller_id(uninstallers):
+    assert snafu.metadata.find_uninstaller_id('2.7') == '{PY27}'
+    for name in ('3.4', '2.7.14', '3.6'):
+        with pytest.raises(FileNotFoundError):
+            snafu.metadata.find_uninstaller_id(name)
+
+
+def test_find_uninstaller_id_index(uninstallers, monkeypatch):
+    assert snafu.metadata.find_uninstaller_id('2.7') == '{PY27}'
+    scanned = uninstallers.calls['EnumKey']
+    assert scanned == 52
+
+    # A new process reads the index from disk, without scanning.
+    monkeypatch.setattr(snafu.metadata, '_uninstaller_index', None)
+    assert snafu.metadata.find_uninstaller_id('2.7') == '{PY27}'
+    assert uninstallers.calls['EnumKey'] == scanned
+
+    # The index is rebuilt when the Uninstall key is modified.
+    add_uninstaller(
+        uninstallers, '{PY34}', 'Python 3.4.4', 'Python Software Foundation',
+    )
+    assert snafu.metadata.find_uninstaller_id('3.4') == '{PY34}'
+    assert uninstallers.calls['EnumKey'] == scanned + 53
+
+
+def test_install_paths_new_process(pythons, tmpdir, monkeypatch):
+    snafu.metadata.get_install_paths()
+    path = pathlib.Path(str(tmpdir.mkdir('user36moved')))
+    pythons.set_value(
+        pythons.HKEY_CURRENT_USER, CORE + '\\3.6\\InstallPath', None,
+        str(path),
+    )
+    # Only kept in the process. A new one reads the registry again.
+    monkeypatch.setattr(snafu.metadata, '_install_paths', None)
+    monkeypatch.setattr(snafu.states, '_state', None)
+    assert snafu.metadata.get_install_path('3.6') == path
@@ -0,0 +1,143 @@
+import hashlib
+import pathlib
+import time
+
+import pytest
+
+import snafu.mirrors
+import snafu.utils
+import snafu.verification
+
+
+URL = 'https://www.python.org/ftp/python/3.6.4/python-3.6.4.exe'
+
+DATA = b'python installer'
+
+MD5_SUM = hashlib.md5(DATA).hexdigest()
+
+
+def check():
+    return snafu.verification.HashVerifier('md5', MD5_SUM)
+
+
+@pytest.fixture
+def local_mirror(tmpdir):
+    root = pathlib.Path(str(tmpdir.mkdir('share')))
+    root.joinpath('3.6.4').mkdir()
+    root.joinpath('3.6.4', 'python-3.6.4.exe').write_bytes(DATA)
+    return snafu.mirrors.Mirror(
+        base=root.as_uri(), latency=0.2, probed_at=time.time(),
+    )
+
+
+@pytest.fixture
+def http_mirror(http_server):
+    return snafu.mirrors.Mirror(
+        base=http_server.url(''), latency=0.1, probed_at=time.time(),
+    )
+
+
+@pytest.fixture
+def container(tmpdir):
+    return pathlib.Path(str(tmpdir.mkdir('container')))
+
+
+def test_get_relative_path():
+    assert snafu.mirrors.get_relative_path(URL) == '3.6.4/python-3.6.4.exe'
+    assert snafu.mirrors.get_relative_path('https://example.com/x') is None
+
+
+def test_rank():
+    now = time.time()
+    slow = snafu.mirrors.Mirror(
+        base='http://slow', latency=0.01, throughput=10 ** 5, probed_at=now,
+    )
+    fast = snafu.mirrors.Mirror(
+        base='http://fast', latency=0.1, throughput=10 ** 6, probed_at=now,
+    )
+    broken = snafu.mirrors.Mirror(
+        base='http://broken', latency=0.001, failures=1, failed_at=now,
+        probed_at=now,
+    )
+    mirrors = snafu.mirrors.MirrorList(mirrors=[broken, slow, fast])
+    assert mirrors.rank(size=10 ** 6) == [fast, slow, broken]
+
+    # Throughput counts even if the size is unknown. A typical installer
+    # takes longer from the slow mirror than the failure penalty.
+    assert mirrors.rank() == [fast, broken, slow]
+
+
+def test_rank_failure_decays():
+    now = time.time()
+    fast = snafu.mirrors.Mirror(
+        base='http://fast', latency=0.01, throughput=10 ** 7, probed_at=now,
+    )
+    slow = snafu.mirrors.Mirror(
+        base='http://slow', latency=0.1, throughput=10 ** 6, probed_at=now,
+    )
+    mirrors = snafu.mirrors.MirrorList(mirrors=[slow, fast])
+    mirrors.record_failure(fast)
+    assert mirrors.rank() == [slow, fast]
+
+    # A transient error is forgiven after a while.
+    fast.failed_at -= snafu.mirrors.FAILURE_HALF_LIFE * 10
+    assert mirrors.rank() == [fast, slow]
+
+
+def test_download_from_local(local_mirror, container):
+    mirrors = snafu.mirrors.MirrorList(mirrors=[local_mirror])
+    path = mirrors.download_file(URL, container=container, check=check)
+    assert path == container.joinpath('python-3.6.4.exe')
+    assert path.read_bytes() == DATA
+    assert local_mirror.throughput is not None
+
+
+def test_download_stats_not_saved(local_mirror, container, tmpdir):
+    # Stats can't be saved into a missing directory. Download anyway.
+    mirrors = snafu.mirrors.MirrorList(
+        mirrors=[local_mirror],
+        stats_path=pathlib.Path(str(tmpdir.join('missing', 'mirrors.json'))),
+    )
+    path = mirrors.download_file(URL, container=container, check=check)
+    assert path.read_bytes() == DATA
+
+
+def test_download_origin_only(mocker, container):
+    mirrors = snafu.mirrors.MirrorList(
+        mirrors=[snafu.mirrors.Mirror(base=snafu.mirrors.ORIGIN)],
+    )
+    rank = mocker.patch.object(mirrors, 'rank')
+    urls = []
+
+    async def download_file(self, url, **kwargs):
+        urls.append(url)
+        return container.joinpath('python-3.6.4.exe')
+
+    mocker.patch('snafu.transfers.Engine.download_file', download_file)
+    mirrors.download_file(URL, container=container)
+    assert urls == [URL]
+    assert not rank.called
+
+
+def test_failover_missing(http_mirror, local_mirror, container):
+    mirrors = snafu.mirrors.MirrorList(mirrors=[http_mirror, local_mirror])
+    path = mirrors.download_file(URL, container=container, check=check)
+    assert path.read_bytes() == DATA
+    assert http_mirror.failures == 1
+    assert local_mirror.failures == 0
+
+
+def test_failover_integrity(http_server, http_mirror, local_mirror,
+                            container):
+    http_server.root.joinpath('3.6.4').mkdir()
+    http_server.root.joinpath('3.6.4', 'python-3.6.4.exe').write_bytes(b'x')
+    mirrors = snafu.mirrors.MirrorList(mirrors=[http_mirror, local_mirror])
+    path = mirrors.download_file(URL, container=container, check=check)
+    assert path.read_bytes() == DATA
+    assert http_mirror.failures == 1
+
+
+def test_all_failed(http_mirror, container):
+    mirrors = snafu.mirrors.MirrorList(mirrors=[http_mirror])
+    with pytest.raises(OSError):
+        mirrors.download_file(URL, container=container, check=check)
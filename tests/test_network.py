@@ -0,0 +1,37 @@
+import pytest
+
+import snafu.network
+
+
+@pytest.fixture
+def session():
+    return snafu.network.Session(
+        pool_size=2, retries=0, backoff=0, timeout=(1, 2),
+    )
+
+
+def test_connection_reuse(session, range_server):
+    range_server.root.joinpath('data').write_bytes(b'x' * 1000)
+    for _ in range(3):
+        response = session.get(range_server.url('data'))
+        assert response.content == b'x' * 1000
+
+    assert session.statistics.requests == 3
+    assert session.statistics.bytes_received == 3000
+    assert session.get_connection_counts() == (1, 3)
+
+
+def test_default_timeout(session, mocker):
+    send = mocker.patch('requests.Session.send')
+    session.get('http://example.com')
+    assert send.call_args[1]['timeout'] == (1, 2)
+
+
+def test_get_session_shared(mocker):
+    mocker.patch.object(snafu.network, '_session', None)
+    session = snafu.network.get_session()
+    assert snafu.network.get_session() is session
+
+    pool_size = session.pool_size
+    assert snafu.network.get_session(pool_size=pool_size + 1) is session
+    assert session.pool_size == pool_size + 1
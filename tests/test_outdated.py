@@ -0,0 +1,73 @@
+import json
+import pathlib
+
+import click.testing
+import pytest
+
+import snafu.__main__
+import snafu.installations
+
+
+PATCHLEVEL = """
+#define PY_MAJOR_VERSION        {}
+#define PY_MINOR_VERSION        {}
+#define PY_MICRO_VERSION        {}
+"""
+
+
+@pytest.fixture
+def installed(registry, tmpdir, monkeypatch):
+    monkeypatch.setattr('snafu.metadata.can_install_64bit', lambda: True)
+    for name, version_info in [('3.6', (3, 6, 1)), ('3.5', (3, 5, 4))]:
+        path = pathlib.Path(str(tmpdir.mkdir(name)))
+        path.joinpath('python.exe').write_bytes(b'')
+        path.joinpath('include').mkdir()
+        path.joinpath('include', 'patchlevel.h').write_text(
+            PATCHLEVEL.format(*version_info),
+        )
+        registry.set_value(
+            registry.HKEY_CURRENT_USER,
+            'Software\\Python\\PythonCore\\{}\\InstallPath'.format(name),
+            None, str(path),
+        )
+    return registry
+
+
+def run(*args):
+    result = click.testing.CliRunner().invoke(snafu.__main__.cli, args)
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_list(installed):
+    assert run('list').splitlines() == ['o  3.5', 'o+ 3.6']
+
+
+def test_list_up_to_date(installed, tmpdir):
+    tmpdir.join('3.6', 'include', 'patchlevel.h').write_text(
+        PATCHLEVEL.format(3, 6, 4), encoding='latin-1',
+    )
+    assert run('list').splitlines() == ['o 3.5', 'o 3.6']
+
+
+def test_list_all_no_probe(installed, mocker):
+    probe = mocker.patch.object(snafu.installations, 'probe_versions')
+    lines = run('list', '--all').splitlines()
+    assert 'o 3.5' in lines and 'o 3.6' in lines
+    assert not probe.called
+
+
+def test_outdated(installed):
+    assert run('outdated').splitlines() == ['3.6     3.6.1 -> 3.6.4']
+
+
+def test_outdated_json(installed, mocker):
+    expected = [{'name': '3.6', 'installed': '3.6.1', 'latest': '3.6.4'}]
+    assert json.loads(run('outdated', '--json')) == expected
+
+    # Versions are remembered, and not read again.
+    read = mocker.patch.object(
+        snafu.installations.Installation, 'read_version_info',
+    )
+    assert json.loads(run('outdated', '--json')) == expected
+    assert not read.called
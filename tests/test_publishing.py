@@ -0,0 +1,184 @@
+import errno
+import os
+import pathlib
+
+import click.testing
+import pytest
+
+import snafu.__main__
+import snafu.metadata
+import snafu.operations.link
+import snafu.publishing
+
+
+Strategy = snafu.publishing.Strategy
+
+
+@pytest.fixture
+def source(tmpdir):
+    path = pathlib.Path(str(tmpdir.join('source.exe')))
+    path.write_bytes(b'source')
+    return path
+
+
+@pytest.fixture
+def target(tmpdir):
+    path = pathlib.Path(str(tmpdir.join('target.exe')))
+    path.write_bytes(b'target')
+    return path
+
+
+@pytest.fixture
+def no_links(mocker):
+    error = OSError(errno.EXDEV, 'Invalid cross-device link')
+    mocker.patch('os.link', side_effect=error)
+    mocker.patch('os.symlink', side_effect=error)
+
+
+@pytest.mark.parametrize('strategy, expected', [
+    (Strategy.copy, Strategy.copy),
+    (Strategy.hardlink, Strategy.hardlink),
+    (Strategy.symlink, Strategy.symlink),
+    (Strategy.auto, Strategy.hardlink),
+])
+def test_publish(source, target, strategy, expected):
+    assert snafu.publishing.publish(
+        source, target, strategy=strategy,
+    ) == expected
+    assert target.read_bytes() == b'source'
+    assert target.is_symlink() == (expected == Strategy.symlink)
+    assert target.samefile(source) == (expected != Strategy.copy)
+
+
+@pytest.mark.parametrize('strategy', list(Strategy))
+def test_publish_fallback(source, target, no_links, strategy):
+    assert snafu.publishing.publish(
+        source, target, strategy=strategy,
+    ) == Strategy.copy
+    assert target.read_bytes() == b'source'
+
+
+@pytest.mark.parametrize('strategy', list(Strategy))
+def test_shim_attempts(strategy):
+    assert strategy.get_attempts(shim=True) == [Strategy.copy]
+
+
+def test_publish_failed(tmpdir, source, target, no_links, mocker):
+    mocker.patch(
+        'shutil.copy2', side_effect=OSError(errno.ENOSPC, 'No space left'),
+    )
+    with pytest.raises(OSError):
+        snafu.publishing.publish(source, target, strategy=Strategy.auto)
+    assert target.read_bytes() == b'target'
+    assert not tmpdir.listdir(lambda p: p.ext == '.tmp')
+
+
+def test_publish_over_link(tmpdir, source, target):
+    # Replacing a link must not modify the file it links to.
+    other = pathlib.Path(str(tmpdir.join('other.exe')))
+    other.write_bytes(b'other')
+    target.unlink()
+    os.link(str(other), str(target))
+    snafu.publishing.publish(source, target, strategy=Strategy.copy)
+    assert target.read_bytes() == b'source'
+    assert other.read_bytes() == b'other'
+
+
+def test_remove_broken_symlink(source, target):
+    target.unlink()
+    target.symlink_to(source)
+    source.unlink()
+    snafu.publishing.remove(target)
+    assert not os.path.lexists(str(target))
+
+
+def activate(versions):
+    snafu.operations.link.activate(versions, quiet=True, allow_empty=True)
+
+
+def test_activate_hardlinks(version, scripts_dir, shims_dir, published):
+    activate([version])
+    version_scripts = version.get_installation().scripts_dir
+    assert scripts_dir.joinpath('black.exe').samefile(
+        str(version_scripts.joinpath('black.exe')),
+    )
+    # Shims are copied, so the originals can be replaced while they run.
+    pip3 = scripts_dir.joinpath('pip3.exe')
+    assert not pip3.samefile(str(shims_dir.joinpath('piplike-script.exe')))
+    assert pip3.read_bytes() == b'piplike-script'
+    assert published.call_count == 5
+
+    # Modifying a source in place modifies the published link. It only
+    # needs recording.
+    version_scripts.joinpath('black.exe').write_bytes(b'new black')
+    activate([version])
+    assert published.call_count == 5
+
+    # Removing scripts leaves their sources alone.
+    activate([])
+    assert list(scripts_dir.iterdir()) == []
+    assert version_scripts.joinpath('black.exe').read_bytes() == b'new black'
+    assert shims_dir.joinpath('piplike-script.exe').read_bytes() == (
+        b'piplike-script'
+    )
+
+
+def test_activate_removes_broken_symlinks(
+        version, scripts_dir, shims_dir, monkeypatch):
+    monkeypatch.setenv('SNAFU_PUBLISH_STRATEGY', 'symlink')
+    activate([version])
+    assert scripts_dir.joinpath('tox.exe').is_symlink()
+
+    # Shims are copied, so they see their own names.
+    assert not scripts_dir.joinpath('pip3.exe').is_symlink()
+
+    version.get_installation().scripts_dir.joinpath('tox.exe').unlink()
+    activate([version])
+    assert not os.path.lexists(str(scripts_dir.joinpath('tox.exe')))
+
+
+def test_activate_removes_temps(version, scripts_dir, shims_dir):
+    # Left by a process that died while publishing.
+    scripts_dir.joinpath('tox.exe.99999.tmp').write_bytes(b'tox')
+    activate([version])
+    assert not scripts_dir.joinpath('tox.exe.99999.tmp').exists()
+
+
+def test_make_plan_skips_temps(tmpdir, source):
+    scripts_dir = pathlib.Path(str(tmpdir.mkdir('Scripts')))
+    scripts_dir.joinpath('tox.exe.1234.tmp').write_bytes(b'tox')
+    scripts_dir.joinpath('old.exe').write_bytes(b'old')
+    manifest = snafu.publishing.Manifest(path=None)
+    plan = snafu.publishing.make_plan(manifest, scripts_dir, {})
+    assert plan.remove == [scripts_dir.joinpath('old.exe')]
+
+
+def test_make_plan_source_removed(tmpdir, source, target):
+    # Removed by a concurrent pip uninstall.
+    manifest = snafu.publishing.Manifest(path=None, scripts={})
+    missing = source.with_name('missing.exe')
+    plan = snafu.publishing.make_plan(manifest, target.parent, {
+        'target.exe': missing,
+    })
+    assert plan.update == []
+    assert plan.linked == []
+
+
+def test_invalid_strategy(monkeypatch):
+    monkeypatch.setenv('SNAFU_PUBLISH_STRATEGY', 'junction')
+    with pytest.raises(ValueError) as ctx:
+        snafu.publishing.get_strategy()
+    assert 'junction' in str(ctx.value)
+    assert 'hardlink' in str(ctx.value)
+
+
+def test_invalid_strategy_command(version, scripts_dir, shims_dir,
+                                  monkeypatch):
+    snafu.metadata.set_active_python_versions(['3.6'])
+    monkeypatch.setenv('SNAFU_PUBLISH_STRATEGY', 'junction')
+    result = click.testing.CliRunner().invoke(snafu.__main__.cli, [
+        'link', '--all',
+    ])
+    assert result.exit_code == 1
+    assert result.output.startswith('Error: publish strategy must be')
+    assert not any(scripts_dir.iterdir())
@@ -0,0 +1,321 @@
+import json
+import multiprocessing
+import os
+import pathlib
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import click.testing
+import pytest
+
+import snafu.__main__
+import snafu.configs
+import snafu.metadata
+import snafu.operations.link
+import snafu.relinks
+
+
+def activate(version):
+    snafu.operations.link.activate([version], quiet=True)
+
+
+def touch(path):
+    stat = path.stat()
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_unchanged(version, scripts_dir, shims_dir):
+    assert not snafu.relinks.is_unchanged()
+    activate(version)
+    assert snafu.relinks.is_unchanged()
+
+
+def test_changed_active_versions(version, scripts_dir, shims_dir):
+    activate(version)
+    snafu.metadata.set_active_python_versions(['3.6', '2.7'])
+    assert not snafu.relinks.is_unchanged()
+
+
+def test_changed_scripts(version, scripts_dir, shims_dir):
+    activate(version)
+    version_scripts = version.get_installation().scripts_dir
+    version_scripts.joinpath('isort.exe').write_bytes(b'isort')
+    touch(version_scripts)
+    assert not snafu.relinks.is_unchanged()
+
+
+def test_failed_publish_not_stamped(version, scripts_dir, shims_dir, mocker):
+    mocker.patch(
+        'snafu.publishing.publish', side_effect=PermissionError(13, 'Denied'),
+    )
+    activate(version)
+    assert not snafu.relinks.is_unchanged()
+
+    mocker.stopall()
+    activate(version)
+    assert snafu.relinks.is_unchanged()
+
+
+def test_failed_remove_not_stamped(version, scripts_dir, shims_dir, mocker):
+    activate(version)
+    version.get_installation().scripts_dir.joinpath('tox.exe').unlink()
+    mocker.patch(
+        'snafu.publishing.remove', side_effect=PermissionError(13, 'Denied'),
+    )
+    activate(version)
+    assert not snafu.relinks.is_unchanged()
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['link', '--all', '--if-changed'], True),
+    (['link', '--if-changed', '--all', '--overwrite=smart'], True),
+    (['link', '--all'], False),
+    (['use', '--all', '--if-changed'], False),
+])
+def test_is_unchanged_relink(mocker, args, expected):
+    mocker.patch('snafu.relinks.is_unchanged', return_value=True)
+    assert snafu.relinks.is_unchanged_relink(args) == expected
+
+
+def test_link_if_changed(version, scripts_dir, shims_dir, published, mocker):
+    snafu.metadata.set_active_python_versions(['3.6'])
+    spy = mocker.spy(snafu.operations.link, 'activate')
+    runner = click.testing.CliRunner()
+    for _ in range(2):
+        result = runner.invoke(snafu.__main__.cli, [
+            'link', '--all', '--if-changed', '--overwrite=smart',
+        ])
+        assert result.exit_code == 0, result.output
+    assert spy.call_count == 1
+    assert published.call_count == 5
+
+
+# Run the module in a fresh interpreter, with a registry holding only the
+# active versions, to see what is imported.
+FAST_PATH_SCRIPT = textwrap.dedent("""
+    import json
+    import pathlib
+    import runpy
+    import sys
+    import types
+
+    winreg = types.ModuleType('winreg')
+    winreg.HKEY_CURRENT_USER = object()
+    winreg.OpenKey = lambda root, path: None
+    winreg.QueryValueEx = lambda key, name: ('3.6', 1)
+    winreg.CloseKey = lambda key: None
+    sys.modules['winreg'] = winreg
+
+    import snafu.configs
+    cache_dir = pathlib.Path(sys.argv[1])
+    snafu.configs.get_cache_dir_path = lambda: cache_dir
+
+    sys.argv[1:] = ['link', '--all', '--if-changed']
+    try:
+        runpy.run_module('snafu', run_name='__main__')
+    except SystemExit as e:
+        code = e.code
+    print(json.dumps({
+        'code': code,
+        'imported': [n for n in ('attr', 'click', 'requests')
+                     if n in sys.modules],
+    }))
+""")
+
+
+def test_fast_path(tmpdir):
+    scripts = pathlib.Path(str(tmpdir.mkdir('Scripts')))
+    cache_dir = snafu.configs.get_cache_dir_path()
+    snafu.relinks.write_stamp(snafu.relinks.make_stamp(['3.6'], [scripts]))
+
+    output = subprocess.check_output(
+        [sys.executable, '-c', FAST_PATH_SCRIPT, str(cache_dir)],
+        cwd=str(pathlib.Path(snafu.__file__).parent.parent),
+    )
+    assert json.loads(output.decode()) == {'code': 0, 'imported': []}
+
+
+# Forked processes inherit the patched cache directory.
+fork = multiprocessing.get_context('fork')
+
+
+def hold_lock(acquired, release):
+    with snafu.relinks.locked():
+        acquired.set()
+        release.wait(10)
+
+
+def try_lock():
+    sys.exit(int(not snafu.relinks.get_lock().acquire(blocking=False)))
+
+
+@pytest.fixture
+def lock_holder():
+    acquired, release = fork.Event(), fork.Event()
+    process = fork.Process(target=hold_lock, args=(acquired, release))
+    process.start()
+    assert acquired.wait(10)
+    yield release
+    release.set()
+    process.join(10)
+
+
+def test_lock(lock_holder):
+    assert not snafu.relinks.get_lock().acquire(blocking=False)
+
+
+def test_lock_reentrant():
+    with snafu.relinks.locked():
+        with snafu.relinks.locked():
+            pass
+        assert snafu.relinks.get_lock().count == 1
+
+    process = fork.Process(target=try_lock)
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+
+
+def request_relink(requested):
+    request = snafu.relinks.request
+
+    def request_and_tell():
+        request()
+        requested.release()
+
+    snafu.relinks.request = request_and_tell
+    ran = snafu.relinks.run_coalesced(lambda: None)
+    sys.exit(int(ran))
+
+
+def test_run_coalesced():
+    runs = []
+    requested = fork.Semaphore(0)
+    processes = [
+        fork.Process(target=request_relink, args=(requested,))
+        for _ in range(5)
+    ]
+
+    def relink():
+        runs.append(None)
+        if len(runs) > 1:
+            return
+        # Requests made while relinking are left to this process.
+        for process in processes:
+            process.start()
+        for _ in processes:
+            assert requested.acquire(timeout=10)
+
+    assert snafu.relinks.run_coalesced(relink)
+    for process in processes:
+        process.join(10)
+    assert [p.exitcode for p in processes] == [0] * 5
+    assert len(runs) == 2
+    assert not snafu.relinks.get_pending_path().exists()
+
+
+def test_locked_serves_requests():
+    runs = []
+    with snafu.relinks.locked(relink=lambda: runs.append(None)):
+        with snafu.relinks.locked(relink=lambda: runs.append(None)):
+            snafu.relinks.request()     # As by another process.
+        assert runs == []
+    assert len(runs) == 1
+    assert not snafu.relinks.get_pending_path().exists()
+
+
+def test_activate_serves_requests(version, scripts_dir, shims_dir, mocker):
+    snafu.metadata.set_active_python_versions(['3.6'])
+    spy = mocker.spy(snafu.operations.link, 'relink_all')
+    snafu.relinks.request()
+    activate(version)
+    assert spy.call_count == 1
+    assert not snafu.relinks.get_pending_path().exists()
+
+
+def relink_logged(log_path):
+    def relink():
+        with open(log_path, 'a') as f:
+            f.write('start\n')
+        time.sleep(0.05)
+        with open(log_path, 'a') as f:
+            f.write('end\n')
+
+    snafu.relinks.run_coalesced(relink)
+
+
+def test_run_coalesced_concurrently(tmpdir):
+    log_path = str(tmpdir.join('relinks.log'))
+    processes = [
+        fork.Process(target=relink_logged, args=(log_path,))
+        for _ in range(8)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+
+    # Relinks never overlap, and every request is served.
+    with open(log_path) as f:
+        lines = f.read().split()
+    assert 2 <= len(lines) <= 16
+    assert lines == ['start', 'end'] * (len(lines) // 2)
+    assert not snafu.relinks.get_pending_path().exists()
+
+
+def test_link_while_relinking(
+        lock_holder, version, scripts_dir, shims_dir, mocker):
+    snafu.metadata.set_active_python_versions(['3.6'])
+    spy = mocker.spy(snafu.operations.link, 'activate')
+    # The holder does not serve requests. Waiting for it, this does.
+    timer = threading.Timer(0.2, lock_holder.set)
+    timer.start()
+    start = time.monotonic()
+    result = click.testing.CliRunner().invoke(snafu.__main__.cli, [
+        'link', '--all', '--overwrite=smart',
+    ])
+    timer.join()
+    assert result.exit_code == 0, result.output
+    assert time.monotonic() - start >= 0.2
+    assert spy.call_count == 1
+    assert not snafu.relinks.get_pending_path().exists()
+
+
+def test_enqueue(mocker):
+    popen = mocker.patch('subprocess.Popen')
+    assert snafu.relinks.enqueue(['link', '--all'])
+    args, _ = popen.call_args
+    assert args[0] == [sys.executable, '-m', 'snafu', 'link', '--all']
+    assert snafu.relinks.get_pending_path().exists()
+
+
+# Stands in for winreg in a fresh interpreter, and tells the test it ran.
+WINREG_STUB = textwrap.dedent("""
+    import os
+    open(os.environ['SNAFU_TEST_STARTED'], 'w').close()
+""")
+
+
+def test_enqueue_starts_process(tmpdir, monkeypatch):
+    stubs = tmpdir.mkdir('stubs')
+    stubs.join('winreg.py').write(WINREG_STUB)
+    started = pathlib.Path(str(tmpdir.join('started')))
+    root = pathlib.Path(snafu.__file__).parent.parent
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([str(stubs), str(root)]))
+    monkeypatch.setenv('SNAFU_TEST_STARTED', str(started))
+
+    assert snafu.relinks.enqueue(['--version'])
+    deadline = time.time() + 10
+    while not started.exists() and time.time() < deadline:
+        time.sleep(0.05)
+    assert started.exists()
+
+
+def test_enqueue_while_relinking(lock_holder, mocker):
+    popen = mocker.patch('subprocess.Popen')
+    assert not snafu.relinks.enqueue(['link', '--all'])
+    assert not popen.called
+    assert snafu.relinks.get_pending_path().exists()
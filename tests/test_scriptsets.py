@@ -0,0 +1,209 @@
+import json
+import os
+import pathlib
+import time
+
+import pytest
+
+import snafu.configs
+import snafu.metadata
+import snafu.operations.link
+import snafu.publishing
+import snafu.relinks
+import snafu.scriptsets
+import snafu.versions
+
+
+@pytest.fixture
+def link(tmpdir, scripts_dir, monkeypatch):
+    """The scripts directory in PATH, with sets enabled.
+    """
+    scripts_dir.rmdir()
+    sets_dir = pathlib.Path(str(tmpdir.mkdir('scriptsets')))
+    monkeypatch.setattr(
+        'snafu.configs.get_scripts_link_path', lambda: scripts_dir,
+    )
+    monkeypatch.setattr(
+        'snafu.configs.get_scriptsets_dir_path', lambda: sets_dir,
+    )
+    return scripts_dir
+
+
+@pytest.fixture
+def version27(registry, tmpdir):
+    path = pathlib.Path(str(tmpdir.mkdir('Python27')))
+    scripts = path.joinpath('Scripts')
+    scripts.mkdir()
+    for name in ('pip2.exe', 'fab.exe'):
+        scripts.joinpath(name).write_bytes(name.encode())
+    registry.set_value(
+        registry.HKEY_CURRENT_USER,
+        'Software\\Python\\PythonCore\\2.7\\InstallPath', None, str(path),
+    )
+    return snafu.versions.get_version('2.7', force_32=False)
+
+
+def activate(versions):
+    snafu.operations.link.activate(versions, quiet=True)
+
+
+def listdir(path):
+    return sorted(p.name for p in path.iterdir())
+
+
+def test_switch(link, shims_dir, version, version27, published):
+    sets_dir = snafu.configs.get_scriptsets_dir_path()
+
+    activate([version])
+    assert snafu.scriptsets.is_directory_link(link)
+    assert link.samefile(str(sets_dir.joinpath('3.6')))
+    assert listdir(link) == [
+        'black.exe', 'flake8.exe', 'pip3.exe', 'python3.exe', 'tox.exe',
+    ]
+
+    activate([version, version27])
+    assert link.samefile(str(sets_dir.joinpath('3.6+2.7')))
+    assert 'fab.exe' in listdir(link)
+    assert listdir(sets_dir) == ['3.6', '3.6+2.7', '3.6+2.7.json', '3.6.json']
+    count = published.call_count
+
+    # Switching back to a set only repoints the link.
+    activate([version])
+    assert link.samefile(str(sets_dir.joinpath('3.6')))
+    assert published.call_count == count
+
+
+def test_link_command(
+        link, shims_dir, version, version27, mocker, monkeypatch):
+    monkeypatch.setenv('PATHEXT', '.exe')
+    activate([version27])
+    ctx = mocker.Mock()
+    snafu.operations.link.link(
+        ctx, command='fab', link_all=False, if_changed=False, no_wait=False,
+        overwrite=snafu.operations.link.Overwrite.yes,
+    )
+    assert link.joinpath('fab.exe').exists()
+    manifest = snafu.publishing.Manifest.load(
+        snafu.scriptsets.get_manifest_path(['2.7']),
+    )
+    assert 'fab.exe' in manifest.scripts
+    assert not snafu.publishing.get_manifest_path().exists()
+
+
+def test_migrate(link, shims_dir, version, version27):
+    # A scripts directory from before sets, for 2.7.
+    snafu.metadata.set_active_python_versions(['2.7'])
+    link.mkdir()
+    link.joinpath('fab.exe').write_bytes(b'fab.exe')
+    with snafu.publishing.get_manifest_path().open('w') as f:
+        json.dump({'format': 1, 'scripts': {}}, f)
+
+    activate([version])
+    sets_dir = snafu.configs.get_scriptsets_dir_path()
+    assert listdir(sets_dir.joinpath('2.7')) == ['fab.exe']
+    assert sets_dir.joinpath('2.7.json').exists()
+    assert not snafu.publishing.get_manifest_path().exists()
+    assert link.samefile(str(sets_dir.joinpath('3.6')))
+
+
+def test_migrate_existing_set(link, shims_dir, version, version27):
+    snafu.metadata.set_active_python_versions(['2.7'])
+    sets_dir = snafu.configs.get_scriptsets_dir_path()
+    sets_dir.joinpath('2.7').mkdir()
+    sets_dir.joinpath('2.7', 'pip2.exe').write_bytes(b'pip2.exe')
+    link.mkdir()
+    link.joinpath('fab.exe').write_bytes(b'fab.exe')
+    link.joinpath('pip2.exe').write_bytes(b'old pip2.exe')
+
+    activate([version])
+    assert listdir(sets_dir.joinpath('2.7')) == ['fab.exe', 'pip2.exe']
+    assert sets_dir.joinpath('2.7', 'pip2.exe').read_bytes() == b'pip2.exe'
+    assert link.samefile(str(sets_dir.joinpath('3.6')))
+
+    # Scripts the set has already are kept aside, not removed.
+    backup, = (p for p in link.parent.iterdir() if p.suffix == '.backup')
+    assert listdir(backup) == ['pip2.exe']
+
+
+def test_migrate_failed(link, shims_dir, version, version27, mocker):
+    snafu.metadata.set_active_python_versions(['2.7'])
+    link.mkdir()
+    link.joinpath('fab.exe').write_bytes(b'fab.exe')
+    with snafu.publishing.get_manifest_path().open('w') as f:
+        json.dump({'format': 1, 'scripts': {}}, f)
+    replace = os.replace
+
+    def replace_in_use(src, dst):
+        if src == str(link):
+            raise PermissionError(32, 'The file is in use')
+        replace(src, dst)
+
+    # The old layout is used until the directory can be moved.
+    mocker.patch('os.replace', side_effect=replace_in_use)
+    activate([version])
+    assert not snafu.scriptsets.is_directory_link(link)
+    assert listdir(link) == [
+        'black.exe', 'fab.exe', 'flake8.exe', 'pip3.exe', 'python3.exe',
+        'tox.exe',
+    ]
+    assert snafu.publishing.get_manifest_path().exists()
+    assert not snafu.relinks.is_unchanged()
+
+    mocker.stopall()
+    activate([version])
+    sets_dir = snafu.configs.get_scriptsets_dir_path()
+    assert link.samefile(str(sets_dir.joinpath('3.6')))
+    assert 'fab.exe' in listdir(link)
+
+
+def test_point_link_fallback(link, tmpdir, mocker):
+    # Replacing the link fails on Windows.
+    old, new = tmpdir.mkdir('old'), tmpdir.mkdir('new')
+    os.symlink(str(old), str(link))
+    replace = os.replace
+
+    def replace_no_directory(src, dst):
+        if os.path.lexists(dst):
+            raise PermissionError(5, 'Access is denied')
+        replace(src, dst)
+
+    mocker.patch('os.replace', side_effect=replace_no_directory)
+    snafu.scriptsets.point_link(link, pathlib.Path(str(new)))
+    assert link.samefile(str(new))
+    assert not any(
+        name.endswith(('.new', '.old')) for name in listdir(link.parent)
+    )
+
+
+def test_point_link_fallback_failed(link, tmpdir, mocker):
+    old, new = tmpdir.mkdir('old'), tmpdir.mkdir('new')
+    os.symlink(str(old), str(link))
+    replace = os.replace
+
+    def replace_failing(src, dst):
+        if os.path.lexists(dst) or src.endswith('.new'):
+            raise PermissionError(5, 'Access is denied')
+        replace(src, dst)
+
+    mocker.patch('os.replace', side_effect=replace_failing)
+    with pytest.raises(PermissionError):
+        snafu.scriptsets.point_link(link, pathlib.Path(str(new)))
+    # The old link is put back.
+    assert link.samefile(str(old))
+    assert not any(
+        name.endswith(('.new', '.old')) for name in listdir(link.parent)
+    )
+
+
+def test_collect_garbage(link):
+    sets_dir = snafu.configs.get_scriptsets_dir_path()
+    past = time.time() - snafu.scriptsets.SET_MAX_AGE - 60
+    for name in ('3.6', '2.7', '3.6+2.7', '3.5'):
+        sets_dir.joinpath(name).mkdir()
+        sets_dir.joinpath(name, 'pip.exe').write_bytes(b'')
+        sets_dir.joinpath('{}.json'.format(name)).write_text('{}')
+        if name != '3.5':
+            os.utime(str(sets_dir.joinpath(name)), (past, past))
+
+    snafu.scriptsets.collect_garbage(keep=['3.6'])
+    assert listdir(sets_dir) == ['3.5', '3.5.json', '3.6', '3.6.json']
@@ -0,0 +1,100 @@
+import pytest
+
+from snafu.specifiers import (
+    Candidate, InvalidSpecifier, Resolver, Specifier, build_resolver, parse,
+)
+
+
+@pytest.mark.parametrize('value, specifier', [
+    ('latest', Specifier()),
+    ('latest-32', Specifier(x86=True)),
+    ('3', Specifier(lower=((3,), True), upper=((4,), False))),
+    ('3.6', Specifier(lower=((3, 6), True), upper=((3, 7), False))),
+    ('3.6.*', Specifier(lower=((3, 6), True), upper=((3, 7), False))),
+    ('3.5-32', Specifier(
+        lower=((3, 5), True), upper=((3, 6), False), x86=True,
+    )),
+    ('>=3.5,<3.7', Specifier(
+        lower=((3, 5, 0), True), upper=((3, 7, 0), False),
+    )),
+    ('~=3.6', Specifier(lower=((3, 6, 0), True), upper=((4,), False))),
+    ('==3.6.2', Specifier(
+        lower=((3, 6, 2), True), upper=((3, 6, 2), True),
+    )),
+    ('>3,!=3.5.*', Specifier(lower=((3, 0, 0), False), excluded=((3, 5),))),
+])
+def test_parse(value, specifier):
+    assert parse(value) == specifier
+
+
+@pytest.mark.parametrize('value', ['', 'python3', '>=3.*', '~=3', '3.6,'])
+def test_parse_invalid(value):
+    with pytest.raises(InvalidSpecifier):
+        parse(value)
+
+
+@pytest.fixture
+def resolver():
+    default = [
+        Candidate(name=name, version_info=version_info)
+        for name, version_info in [
+            ('2.7', (2, 7, 14)), ('3.4', (3, 4, 4)), ('3.5', (3, 5, 4)),
+            ('3.6', (3, 6, 4)), ('3.7', (3, 7, 0)),
+        ]
+    ]
+    x86 = [
+        Candidate(name='2.7', version_info=(2, 7, 14), force_32=True),
+        Candidate(name='3.4', version_info=(3, 4, 4), force_32=True),
+        Candidate(name='3.5-32', version_info=(3, 5, 4)),
+        Candidate(name='3.6-32', version_info=(3, 6, 4)),
+    ]
+    return Resolver(default, x86)
+
+
+@pytest.mark.parametrize('value, name', [
+    ('latest', '3.7'),
+    ('3', '3.7'),
+    ('2', '2.7'),
+    ('3.5', '3.5'),
+    ('>=3.5,<3.7', '3.6'),
+    ('<=3.6.4', '3.6'),
+    ('<3.6.4', '3.5'),
+    ('~=3.4', '3.7'),
+    ('>=3,!=3.7.*', '3.6'),
+    ('3-32', '3.6-32'),
+    ('<3.5-32', '3.4'),
+    ('3.8', None),
+    ('3.7-32', None),
+])
+def test_best_match(resolver, value, name):
+    candidate = resolver.best_match(parse(value))
+    assert (candidate and candidate.name) == name
+
+
+def test_best_match_force_32(resolver):
+    candidate = resolver.best_match(parse('2-32'))
+    assert candidate.name == '2.7'
+    assert candidate.force_32
+
+
+def test_best_match_predicate(resolver):
+    installed = {'2.7', '3.5'}
+    candidate = resolver.best_match(
+        parse('latest'), predicate=installed.__contains__,
+    )
+    assert candidate.name == '3.5'
+    assert resolver.best_match(
+        parse('3.6'), predicate=installed.__contains__,
+    ) is None
+
+
+@pytest.mark.parametrize('host_64bit, value, name, force_32', [
+    (True, '3.5', '3.5', False),
+    (True, '3.5-32', '3.5-32', False),
+    (True, '3.4-32', '3.4', True),
+    (False, '3.5', '3.5-32', False),
+])
+def test_build_resolver(host_64bit, value, name, force_32):
+    candidate = build_resolver(host_64bit=host_64bit).best_match(parse(value))
+    assert candidate.name == name
+    assert candidate.force_32 == force_32
@@ -0,0 +1,127 @@
+import asyncio
+import pathlib
+import time
+
+import pytest
+
+import snafu.configs
+import snafu.network
+import snafu.termui
+import snafu.transfers
+import snafu.utils
+
+
+@pytest.fixture
+def container(tmpdir):
+    return pathlib.Path(str(tmpdir.mkdir('container')))
+
+
+@pytest.fixture
+def statistics(mocker):
+    statistics = snafu.network.Statistics()
+    mocker.patch.object(snafu.network, '_statistics', statistics)
+    return statistics
+
+
+def download_all(urls, container, *, per_host):
+    progress = snafu.termui.CombinedProgress(label='test')
+
+    async def download():
+        async with snafu.transfers.Engine(per_host=per_host) as engine:
+            return await engine.gather([
+                engine.download_file(
+                    url, container=container, progress=progress,
+                )
+                for url in urls
+            ], progress=progress)
+
+    return snafu.transfers.run(download())
+
+
+def test_concurrent_downloads(range_server, container, statistics):
+    names = ['file{}'.format(i) for i in range(6)]
+    for name in names:
+        range_server.root.joinpath(name).write_bytes(name.encode() * 1000)
+
+    results = download_all(
+        [range_server.url(name) for name in names], container, per_host=2,
+    )
+    assert [p.read_bytes() for p in results] == [
+        name.encode() * 1000 for name in names
+    ]
+
+    # At most two connections to the host, reused for the other requests.
+    assert statistics.connections == 2
+    assert statistics.reused == 4
+    assert statistics.bytes_received == sum(len(n) * 1000 for n in names)
+
+
+def test_chunked_redirect(chunked_server, container):
+    data = bytes(range(256)) * 100
+    chunked_server.root.joinpath('data.bin').write_bytes(data)
+    path = snafu.transfers.download_file(
+        chunked_server.url('redirect/data.bin'), container=container,
+    )
+    assert path == container.joinpath('data.bin')
+    assert path.read_bytes() == data
+    assert [r.get('Range') for r in chunked_server.requests] == [None, None]
+
+
+def test_http_error(range_server, container):
+    results = download_all([range_server.url('missing')], container,
+                           per_host=1)
+    error, = results
+    assert isinstance(error, snafu.transfers.HTTPError)
+    assert error.status_code == 404
+    assert len(range_server.requests) == 1  # Not retried.
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retry_status(range_server, container, monkeypatch, status):
+    monkeypatch.setitem(snafu.configs.HTTP_SETTINGS, 'backoff', 0.2)
+    range_server.root.joinpath('data.bin').write_bytes(b'data' * 1000)
+    range_server.fail_status = status
+    start = time.monotonic()
+    path, = download_all([range_server.url('data.bin')], container,
+                         per_host=1)
+    assert time.monotonic() - start >= 0.2     # Backed off.
+    assert path.read_bytes() == b'data' * 1000
+    assert len(range_server.requests) == 2
+
+
+def test_release_on_error(range_server, container, mocker):
+    range_server.root.joinpath('data.bin').write_bytes(b'data')
+    mocker.patch(
+        'snafu.utils.accept_response', side_effect=ValueError('bad'),
+    )
+
+    async def download():
+        async with snafu.transfers.Engine(per_host=1) as engine:
+            with pytest.raises(ValueError):
+                await engine.download_file(
+                    range_server.url('data.bin'), container=container,
+                )
+            # The only connection is free to use again.
+            response = await asyncio.wait_for(engine.client.request(
+                'GET', range_server.url('data.bin'),
+            ), 5)
+            return await response.read()
+
+    assert snafu.transfers.run(download()) == b'data'
+
+
+@pytest.mark.parametrize('name', ['REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE'])
+def test_ssl_context_ca_bundle(tmpdir, monkeypatch, mocker, name):
+    monkeypatch.delenv('REQUESTS_CA_BUNDLE', raising=False)
+    monkeypatch.delenv('CURL_CA_BUNDLE', raising=False)
+    create = mocker.patch('ssl.create_default_context')
+    bundle = tmpdir.join('corporate.pem')
+    bundle.write('')
+    monkeypatch.setenv(name, str(bundle))
+    snafu.transfers.get_ssl_context()
+    create.assert_called_once_with(cafile=str(bundle))
+
+    create.reset_mock()
+    monkeypatch.setenv(name, str(tmpdir))
+    snafu.transfers.get_ssl_context()
+    create.assert_called_once_with(capath=str(tmpdir))
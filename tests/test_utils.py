@@ -0,0 +1,189 @@
+import hashlib
+import json
+import pathlib
+
+import pytest
+
+import snafu.segments
+import snafu.utils
+import snafu.verification
+
+
+@pytest.fixture
+def container(tmpdir):
+    return pathlib.Path(str(tmpdir.mkdir('container')))
+
+
+@pytest.fixture
+def payload(http_server):
+    data = bytes(range(256)) * 1024
+    http_server.root.joinpath('payload.bin').write_bytes(data)
+    return data
+
+
+def md5_verifier(data):
+    checksum = hashlib.md5(data).hexdigest()
+    return lambda: snafu.verification.HashVerifier('md5', checksum)
+
+
+def test_write_json_atomic(container):
+    path = container.joinpath('data.json')
+    snafu.utils.write_json_atomic(path, {'a': 1})
+    assert json.loads(path.read_text()) == {'a': 1}
+    assert [p.name for p in container.iterdir()] == ['data.json']
+
+
+def test_write_json_atomic_failed(container):
+    path = container.joinpath('missing', 'data.json')
+    snafu.utils.write_json_atomic(path, {'a': 1}, optional=True)
+    with pytest.raises(FileNotFoundError):
+        snafu.utils.write_json_atomic(path, {'a': 1})
+
+
+def test_download_file(http_server, container, payload):
+    path = snafu.utils.download_file(
+        http_server.url('payload.bin'), container=container,
+        check=md5_verifier(payload),
+    )
+    assert path == container.joinpath('payload.bin')
+    assert path.read_bytes() == payload
+    assert list(container.iterdir()) == [path]
+
+
+def test_download_file_integrity_error(http_server, container, payload):
+    with pytest.raises(snafu.utils.DownloadIntegrityError):
+        snafu.utils.download_file(
+            http_server.url('payload.bin'), container=container,
+            check=md5_verifier(b'something else'),
+        )
+    assert list(container.iterdir()) == []
+
+
+def test_size_verifier():
+    verifier = snafu.verification.SizeVerifier(5)
+    verifier.update(b'abc')
+    with pytest.raises(AssertionError):
+        verifier.verify()
+    verifier.update(b'de')
+    verifier.verify()
+
+
+@pytest.fixture
+def range_payload(range_server):
+    data = bytes(range(256)) * 4096
+    range_server.root.joinpath('payload.bin').write_bytes(data)
+    return data
+
+
+def test_download_file_resume_in_process(range_server, container,
+                                         range_payload):
+    range_server.fail_after = 131072
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload),
+    )
+    assert path.read_bytes() == range_payload
+    assert list(container.iterdir()) == [path]
+    assert [r.get('Range') for r in range_server.requests] == [
+        None, 'bytes=131072-',
+    ]
+
+
+def test_download_file_resume_later(range_server, container, range_payload):
+    range_server.fail_after = 131072
+    with pytest.raises(snafu.utils.RETRIABLE_ERRORS):
+        snafu.utils.download_file(
+            range_server.url('payload.bin'), container=container,
+            check=md5_verifier(range_payload), retries=0,
+        )
+    assert container.joinpath('payload.bin.part').stat().st_size == 131072
+    assert container.joinpath('payload.bin.part.json').exists()
+
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload),
+    )
+    assert path.read_bytes() == range_payload
+    assert list(container.iterdir()) == [path]
+    assert range_server.requests[-1]['Range'] == 'bytes=131072-'
+
+
+def test_download_file_resume_unsupported(range_server, container,
+                                          range_payload):
+    range_server.ranges = False
+    range_server.fail_after = 131072
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload),
+    )
+    assert path.read_bytes() == range_payload
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(snafu.segments, 'MIN_SEGMENT_SIZE', 65536)
+
+
+def get_ranges(server):
+    return sorted(
+        r['Range'] for r in server.requests
+        if r.get('Range') is not None
+    )
+
+
+def test_download_file_segmented(range_server, container, range_payload,
+                                 small_segments):
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload), connections=4,
+    )
+    assert path.read_bytes() == range_payload
+    assert list(container.iterdir()) == [path]
+    assert get_ranges(range_server) == [
+        'bytes=0-262143', 'bytes=262144-524287',
+        'bytes=524288-786431', 'bytes=786432-1048575',
+    ]
+
+
+def test_download_file_segmented_resume(range_server, container,
+                                        range_payload, small_segments):
+    range_server.fail_after = 131072
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload), connections=2,
+    )
+    assert path.read_bytes() == range_payload
+    assert len(get_ranges(range_server)) == 3
+
+
+def test_download_file_segmented_unsupported(range_server, container,
+                                             range_payload, small_segments):
+    range_server.ranges = False
+    path = snafu.utils.download_file(
+        range_server.url('payload.bin'), container=container,
+        check=md5_verifier(range_payload), connections=4,
+    )
+    assert path.read_bytes() == range_payload
+    assert get_ranges(range_server) == []
+
+
+@pytest.mark.parametrize('size, connections, received, result', [
+    (4 * 65536, 2, 0, [(0, 131071), (131072, 262143)]),
+    (4 * 65536, 8, 0, [(i * 65536, i * 65536 + 65535) for i in range(4)]),
+    (100, 4, 0, [(0, 99)]),
+    (3 * 65536, 2, 65536, [(0, 65535), (65536, 131071), (131072, 196607)]),
+])
+def test_split_segments(small_segments, size, connections, received, result):
+    segments = snafu.segments.split(size, connections, received=received)
+    assert [(s.start, s.end) for s in segments] == result
+    assert segments[0].received == received
+
+
+def test_download_file_segmented_misaligned(range_server, container,
+                                            range_payload, small_segments):
+    range_server.range_skew = -1
+    with pytest.raises(snafu.segments.SegmentInterrupted):
+        snafu.utils.download_file(
+            range_server.url('payload.bin'), container=container,
+            check=md5_verifier(range_payload), connections=4, retries=0,
+        )
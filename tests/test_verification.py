@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import pathlib
+
+import pytest
+
+import snafu.verification
+
+
+DATA = bytes(range(256)) * 100
+
+
+@pytest.fixture
+def memo(cache_dir):
+    return snafu.verification.get_memo()
+
+
+@pytest.fixture
+def installer(tmpdir):
+    path = pathlib.Path(str(tmpdir.join('python.exe')))
+    path.write_bytes(DATA)
+    return path
+
+
+def test_hash_file(installer, monkeypatch):
+    monkeypatch.setattr(snafu.verification, 'BLOCK_SIZE', 1000)
+    assert snafu.verification.hash_file(installer) == {
+        'md5': hashlib.md5(DATA).hexdigest(),
+        'sha256': hashlib.sha256(DATA).hexdigest(),
+    }
+
+
+def test_verify_file_memoized(memo, installer, mocker):
+    hash_file = mocker.spy(snafu.verification, 'hash_file')
+    checksums = {'sha256': hashlib.sha256(DATA).hexdigest()}
+    assert snafu.verification.verify_file(installer, checksums)
+    assert snafu.verification.verify_file(installer, checksums)
+    assert hash_file.call_count == 1
+
+    # Saved once, when the run ends.
+    assert not memo.path.exists()
+    snafu.verification.save_memos()
+    memo = snafu.verification.VerificationMemo(path=memo.path)
+    assert memo.lookup(installer, installer.stat()) is not None
+
+    # Modified files are hashed again.
+    stat = installer.stat()
+    os.utime(str(installer), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert snafu.verification.verify_file(installer, checksums)
+    assert hash_file.call_count == 2
+
+
+def test_memo_save_drops_stale(memo, installer, tmpdir):
+    digests = {'md5': hashlib.md5(DATA).hexdigest()}
+    deleted = pathlib.Path(str(tmpdir.join('deleted.exe')))
+    deleted.write_bytes(DATA)
+    replaced = pathlib.Path(str(tmpdir.join('replaced.exe')))
+    replaced.write_bytes(DATA)
+    for path in (installer, deleted, replaced):
+        memo.record(path, digests)
+    memo.save()
+
+    deleted.unlink()
+    replaced.write_bytes(DATA * 2)
+    memo.record(installer, digests)
+    memo.save()
+    with memo.path.open() as f:
+        entries = json.load(f)
+    assert list(entries) == [str(installer.resolve())]
+
+
+def test_memo_save_merges(memo, installer, tmpdir):
+    digests = {'md5': hashlib.md5(DATA).hexdigest()}
+    other = pathlib.Path(str(tmpdir.join('other.exe')))
+    other.write_bytes(DATA)
+
+    # Another process saves its record after this memo is loaded.
+    memo.lookup(installer, installer.stat())
+    other_memo = snafu.verification.VerificationMemo(path=memo.path)
+    other_memo.record(other, digests)
+    other_memo.save()
+
+    memo.record(installer, digests)
+    memo.save()
+    memo = snafu.verification.VerificationMemo(path=memo.path)
+    assert memo.lookup(installer, installer.stat()) == digests
+    assert memo.lookup(other, other.stat()) == digests
+
+
+def test_verify_file_mismatch(memo, installer):
+    assert not snafu.verification.verify_file(installer, {'md5': '0' * 32})
+
+
+def test_checksum_verifier(memo, installer, mocker):
+    verifier = snafu.verification.ChecksumVerifier({
+        'md5': hashlib.md5(DATA).hexdigest(),
+        'sha256': '0' * 64,
+    })
+    verifier.update(DATA)
+    with pytest.raises(AssertionError) as ctx:
+        verifier.verify()
+    assert 'sha256' in str(ctx.value)
+
+    # Digests computed while downloading are reused.
+    verifier.completed(installer)
+    hash_file = mocker.spy(snafu.verification, 'hash_file')
+    assert snafu.verification.verify_file(
+        installer, {'md5': hashlib.md5(DATA).hexdigest()},
+    )
+    assert hash_file.call_count == 0
@@ -2,8 +2,10 @@ import json
 import pathlib
 import re
 
+import attr
 import pytest
 
+import snafu.operations.common
 import snafu.versions
 
 
@@ -31,9 +33,11 @@ def test_version_definitions(path):
             d = data.pop(key)
             assert d.pop('url')
             assert re.match(r'^[a-f\d]{32}$', d.pop('md5_sum'))
+            assert re.match(r'^[a-f\d]{64}$', d.pop('sha256_sum', 'f' * 64))
     elif schema == 'cpython':
         assert data.pop('url')
         assert re.match(r'^[a-f\d]{32}$', data.pop('md5_sum'))
+        assert re.match(r'^[a-f\d]{64}$', data.pop('sha256_sum', 'f' * 64))
 
     assert not data, 'superfulous keys: {}'.format(', '.join(data.keys()))
 
@@ -108,6 +112,7 @@ def test_python_major_command(mocker, name, force_32, cmd):
     })
     version = snafu.versions.get_version(name, force_32=force_32)
     assert version.python_major_command == pathlib.Path(cmd)
+    assert version.python_major_command_name == cmd
 
 
 @pytest.mark.parametrize('name, force_32, result', [
@@ -140,3 +145,84 @@ def test_is_installed(tmpdir, mocker):
     version = snafu.versions.get_version('3.6', force_32=False)
     assert version.is_installed()
     mock_metadata.get_install_path.assert_called_once_with('3.6')
+
+
+@pytest.fixture
+def versions_dir(tmpdir, monkeypatch):
+    dirpath = pathlib.Path(str(tmpdir.mkdir('versions')))
+    for path in version_paths:
+        dirpath.joinpath(path.name).write_bytes(path.read_bytes())
+    monkeypatch.setattr(snafu.versions, 'VERSIONS_DIR_PATH', dirpath)
+    monkeypatch.setattr(
+        snafu.versions, 'INDEX_PATH', dirpath.with_name('index.json'),
+    )
+    monkeypatch.setattr(snafu.versions, '_index', None)
+    monkeypatch.setattr(snafu.versions, '_definitions', {})
+    return dirpath
+
+
+def test_get_version_names(versions_dir):
+    names = ['2.7', '3.4', '3.5', '3.5-32', '3.6', '3.6-32']
+    assert snafu.versions.get_version_names() == names
+    assert snafu.versions.get_version_names('win32') == [
+        '2.7', '3.4', '3.5-32', '3.6-32',
+    ]
+
+
+def test_index(versions_dir, mocker):
+    names = snafu.versions.get_version_names('win32')
+    snafu.versions.build_index()
+    mocker.patch.object(snafu.versions, '_index', None)
+
+    load = mocker.patch('json.load', wraps=json.load)
+    assert snafu.versions.get_version_names('win32') == names
+    version = snafu.versions.get_version('3.5', force_32=True)
+    assert version.name == '3.5-32'
+    assert load.call_count == 1     # Only the index is read.
+
+
+def test_index_stale(versions_dir, mocker):
+    snafu.versions.build_index()
+    versions_dir.joinpath('3.7.json').write_text(json.dumps({
+        'type': 'cpython',
+        'version_info': [3, 7, 0],
+        'url': 'https://www.python.org/ftp/python/3.7.0/python-3.7.0.exe',
+        'md5_sum': '0' * 32,
+    }))
+    assert snafu.versions.get_index() is None
+    assert snafu.versions.get_version_names()[-1] == '3.7'
+
+
+def test_no_index(versions_dir, mocker):
+    load = mocker.patch('json.load', wraps=json.load)
+    catalogue = snafu.versions.get_catalogue()
+    assert [e.name for e in catalogue] == snafu.versions.get_version_names()
+    for entry in catalogue:
+        entry.get_version()
+    # Each definition is read once, without an index.
+    assert load.call_count == len(version_paths)
+
+
+@pytest.mark.parametrize('record', [
+    snafu.versions.CatalogueEntry(name='3.6', version_info=(3, 6, 4)),
+    snafu.versions.get_version('3.6', force_32=False),
+    snafu.versions.get_version('3.4', force_32=True),
+], ids=['entry', 'cpython', 'cpython_msi'])
+def test_records_immutable(record):
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        record.name = '2.7'
+    # Slotted all the way down, without an instance dict.
+    assert not hasattr(record, '__dict__')
+    with pytest.raises((AttributeError, TypeError)):
+        record.extra = None
+
+
+def test_get_versions_installed_only(mocker):
+    mocker.patch('snafu.metadata.can_install_64bit', return_value=True)
+    mocker.patch.object(
+        snafu.versions, 'is_installed', side_effect=lambda n: n == '3.6',
+    )
+    get_version = mocker.spy(snafu.versions, 'get_version')
+    versions = snafu.operations.common.get_versions(installed_only=True)
+    assert [v.name for v in versions] == ['3.6']
+    assert [c[0] for c in get_version.call_args_list] == [('3.6',)]
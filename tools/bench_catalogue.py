@@ -0,0 +1,108 @@
+"""Measure memory and construction cost of catalogue records.
+
+Usage: python tools/bench_catalogue.py [SIZE ...]
+"""
+
+import pathlib
+import sys
+import time
+import tracemalloc
+
+import attr
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from snafu import versions     # noqa: E402
+
+
+@attr.s
+class DictVersion:
+    """How a version record was laid out before slots.
+    """
+    name = attr.ib()
+    url = attr.ib()
+    md5_sum = attr.ib()
+    version_info = attr.ib(convert=tuple)
+    product_codes = attr.ib(default=attr.Factory(dict))
+    forced_32 = attr.ib(default=False)
+    sha256_sum = attr.ib(default=None)
+
+
+def make_definitions(size):
+    definitions = []
+    for i in range(size):
+        major, minor = divmod(i, 100)
+        name = '{}.{}'.format(major, minor)
+        definitions.append((name, {
+            'version_info': [major, minor, 0],
+            'url': 'https://www.python.org/ftp/python/{0}.0/python-{0}.0.exe'
+                   .format(name),
+            'md5_sum': '{:032x}'.format(i),
+        }))
+    return definitions
+
+
+def build_entries(definitions):
+    return [
+        versions.CatalogueEntry(name=name, version_info=d['version_info'])
+        for name, d in definitions
+    ]
+
+
+def build_versions(definitions):
+    return [
+        versions.CPythonVersion(
+            name=name, url=d['url'], md5_sum=d['md5_sum'],
+            version_info=d['version_info'],
+        )
+        for name, d in definitions
+    ]
+
+
+def build_dict_versions(definitions):
+    return [
+        DictVersion(
+            name=name, url=d['url'], md5_sum=d['md5_sum'],
+            version_info=d['version_info'],
+        )
+        for name, d in definitions
+    ]
+
+
+def measure(build, definitions):
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = build(definitions)
+    seconds = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return memory / len(definitions), seconds / len(definitions)
+
+
+BUILDERS = [
+    ('CatalogueEntry', build_entries),
+    ('Version', build_versions),
+    ('Version (dict)', build_dict_versions),
+]
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 5000, 20000]
+    print('{:>7}  {:<16}  {:>12}  {:>12}'.format(
+        'Size', 'Record', 'Bytes/record', 'us/record',
+    ))
+    for size in sizes:
+        definitions = make_definitions(size)
+        for label, build in BUILDERS:
+            memory, seconds = measure(build, definitions)
+            print('{:>7}  {:<16}  {:>12.0f}  {:>12.2f}'.format(
+                size, label, memory, seconds * 1e6,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare specifier resolution by bisection against a linear scan.
+
+Usage: python tools/bench_specifiers.py [SIZE ...]
+"""
+
+import pathlib
+import random
+import sys
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from snafu import specifiers    # noqa: E402
+
+
+QUERIES = ['latest', '3', '3.6', '>=3.5,<3.7', '~=2.7', '<2.1', '!=3.*']
+
+
+def make_candidates(size):
+    candidates = []
+    for i in range(size):
+        major, rest = divmod(i, 1000)
+        minor, micro = divmod(rest, 10)
+        candidates.append(specifiers.Candidate(
+            name='{}.{}.{}'.format(major, minor, micro),
+            version_info=(major, minor, micro),
+        ))
+    random.shuffle(candidates)
+    return candidates
+
+
+def matches(specifier, version_info):
+    if specifier.lower is not None:
+        version, inclusive = specifier.lower
+        if version_info < version or (version_info == version and
+                                      not inclusive):
+            return False
+    if specifier.upper is not None:
+        version, inclusive = specifier.upper
+        if version_info > version or (version_info == version and
+                                      not inclusive):
+            return False
+    return not specifier.excludes(version_info)
+
+
+def linear_best_match(candidates, specifier):
+    best = None
+    for candidate in candidates:
+        if not matches(specifier, candidate.version_info):
+            continue
+        if best is None or candidate.version_info > best.version_info:
+            best = candidate
+    return best
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [10000, 50000, 100000]
+    parsed = [specifiers.parse(q) for q in QUERIES]
+    print('{:>7}  {:<12}  {:>12}  {:>12}  {:>12}'.format(
+        'Size', 'Query', 'Build (ms)', 'Bisect (us)', 'Linear (us)',
+    ))
+    for size in sizes:
+        candidates = make_candidates(size)
+        start = time.perf_counter()
+        resolver = specifiers.Resolver(candidates, [])
+        build = time.perf_counter() - start
+        for query, specifier in zip(QUERIES, parsed):
+            expected = linear_best_match(candidates, specifier)
+            assert resolver.best_match(specifier) == expected, query
+            bisect = measure(lambda: resolver.best_match(specifier), 1000)
+            linear = measure(
+                lambda: linear_best_match(candidates, specifier), 3,
+            )
+            print('{:>7}  {:<12}  {:>12.1f}  {:>12.2f}  {:>12.0f}'.format(
+                size, query, build * 1e3, bisect * 1e6, linear * 1e6,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,93 @@
 """Quick way to verify I provided matching download URL and MD5.
 """
 
-import hashlib
 import json
 import pathlib
 import sys
+import tempfile
 
-import requests
 
+ROOT = pathlib.Path(__file__).resolve().parent.parent
 
-def download_data(url):
-    print('Downloading', url, '... ', end='', flush=True)
-    response = requests.get(url)
-    response.raise_for_status()
-    print('Done')
-    return response.content
+sys.path.insert(0, str(ROOT))
 
-
-def check_download(url, version_info, md5sum):
-    prefix = 'https://www.python.org/ftp/python/{v}/python-{v}'.format(
-        v='.'.join(str(s) for s in version_info),
-    )
-    if not url.startswith(prefix):
-        raise ValueError('{} is not from version {}'.format(url, version_info))
-
-    checksum = hashlib.md5(download_data(url)).hexdigest()
-    if checksum != md5sum:
-        raise AssertionError('{} != {} (expected)'.format(checksum, md5sum))
+from snafu import termui, transfers, utils, verification     # noqa: E402
 
 
-def check_cpython(info):
-    check_download(info['url'], info['version_info'], info['md5_sum'])
+def iter_downloads_cpython(info):
+    yield info['url'], info['version_info'], info['md5_sum']
 
 
-def check_cpython_msi(info):
+def iter_downloads_cpython_msi(info):
     for variant in ['x86', 'amd64']:
-        check_download(
+        yield (
             info[variant]['url'],
             info['version_info'],
             info[variant]['md5_sum'],
         )
 
 
-CHECKERS = {
-    'cpython': check_cpython,
-    'cpython_msi': check_cpython_msi,
+DOWNLOADS = {
+    'cpython': iter_downloads_cpython,
+    'cpython_msi': iter_downloads_cpython_msi,
 }
 
 
-def main():
-    if len(sys.argv) < 2:
-        raise ValueError('no versions provided')
-    for v in sys.argv[1:]:
-        path = pathlib.Path(__file__).parent.parent.joinpath(
-            'snafu', 'versions', '{}.json'.format(v),
+async def check_download(engine, container, url, version_info, md5sum, *,
+                         progress):
+    prefix = 'https://www.python.org/ftp/python/{v}/python-{v}'.format(
+        v='.'.join(str(s) for s in version_info),
+    )
+    if not url.startswith(prefix):
+        raise ValueError('{} is not from version {}'.format(url, version_info))
+
+    try:
+        path = await engine.download_file(
+            url, container=container, progress=progress,
+            check=lambda: verification.HashVerifier('md5', md5sum),
         )
+    except utils.DownloadIntegrityError as e:
+        raise AssertionError(str(e))
+    path.unlink()
+
+
+async def check_versions(names, container):
+    downloads = []
+    for v in names:
+        path = ROOT.joinpath('snafu', 'versions', '{}.json'.format(v))
         with path.open() as f:
             info = json.load(f)
-        CHECKERS[info['type']](info)
-        print('Version', v, 'is OK!')
+        downloads.extend((v, d) for d in DOWNLOADS[info['type']](info))
+
+    progress = termui.CombinedProgress(
+        label='{} downloads'.format(len(downloads)),
+    )
+    async with transfers.Engine() as engine:
+        results = await engine.gather([
+            check_download(engine, container, *d, progress=progress)
+            for _, d in downloads
+        ], progress=progress)
+
+    failed = set()
+    for (v, (url, _, _)), result in zip(downloads, results):
+        if isinstance(result, BaseException):
+            print('{}: {}'.format(url, result))
+            failed.add(v)
+    for v in names:
+        if v not in failed:
+            print('Version', v, 'is OK!')
+    return not failed
+
+
+def main():
+    if len(sys.argv) < 2:
+        raise ValueError('no versions provided')
+    with tempfile.TemporaryDirectory() as container:
+        ok = transfers.run(check_versions(
+            sys.argv[1:], pathlib.Path(container),
+        ))
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':